@@ -12,7 +12,9 @@ from typing import (
 from pyhocon import ConfigFactory, ConfigTree
 
 from databuilder import Scoped
+from databuilder.extractor import schema_partitioned_sql_alchemy_extractor
 from databuilder.extractor.base_extractor import Extractor
+from databuilder.extractor.schema_partitioned_sql_alchemy_extractor import add_schema_filter
 from databuilder.extractor.sql_alchemy_extractor import SQLAlchemyExtractor
 from databuilder.models.table_metadata import ColumnMetadata, TableMetadata
 
@@ -31,12 +33,20 @@ class BasePostgresMetadataExtractor(Extractor):
     CLUSTER_KEY = 'cluster_key'
     USE_CATALOG_AS_CLUSTER_NAME = 'use_catalog_as_cluster_name'
     DATABASE_KEY = 'database_key'
+    # Number of schemas extracted concurrently, each with its own query. A single query is used if 1.
+    SCHEMA_CONCURRENCY = 'schema_concurrency'
 
     # Default values
     DEFAULT_CLUSTER_NAME = 'master'
+    # System schemas, including the temporary ones of each session, are not listed
+    LIST_SCHEMAS_SQL = "SELECT nspname FROM pg_catalog.pg_namespace " \
+                       "WHERE substring(nspname, 1, 3) <> 'pg_' AND nspname <> 'information_schema' ORDER BY nspname"
+    # Sets the server-side timeout of the queries of a schema, when extracting schema by schema
+    STATEMENT_TIMEOUT_SQL = 'SET statement_timeout = {timeout_ms}'
 
     DEFAULT_CONFIG = ConfigFactory.from_dict(
-        {WHERE_CLAUSE_SUFFIX_KEY: ' ', CLUSTER_KEY: DEFAULT_CLUSTER_NAME, USE_CATALOG_AS_CLUSTER_NAME: True}
+        {WHERE_CLAUSE_SUFFIX_KEY: ' ', CLUSTER_KEY: DEFAULT_CLUSTER_NAME, USE_CATALOG_AS_CLUSTER_NAME: True,
+         SCHEMA_CONCURRENCY: 1}
     )
 
     @abc.abstractmethod
@@ -46,16 +56,46 @@ class BasePostgresMetadataExtractor(Extractor):
         """
         return None
 
+    def get_schema_column(self) -> str:
+        """
+        :return: Column of the schema that the where clause suffix of get_sql_statement can filter on
+        """
+        return 'c.table_schema'
+
+    def get_schema_sql_statement(self, use_catalog_as_cluster_name: bool, where_clause_suffix: str,
+                                 schema: str) -> Any:
+        """
+        :return: Provides the statement of the tables of a schema, when extracting schema by schema
+        """
+        return self.get_sql_statement(
+            use_catalog_as_cluster_name=use_catalog_as_cluster_name,
+            where_clause_suffix=add_schema_filter(where_clause_suffix, self.get_schema_column(), schema),
+        )
+
     def init(self, conf: ConfigTree) -> None:
         conf = conf.with_fallback(BasePostgresMetadataExtractor.DEFAULT_CONFIG)
         self._cluster = conf.get_string(BasePostgresMetadataExtractor.CLUSTER_KEY)
 
         self._database = conf.get_string(BasePostgresMetadataExtractor.DATABASE_KEY, default='postgres')
 
+        use_catalog_as_cluster_name = conf.get_bool(BasePostgresMetadataExtractor.USE_CATALOG_AS_CLUSTER_NAME)
+        where_clause_suffix = conf.get_string(BasePostgresMetadataExtractor.WHERE_CLAUSE_SUFFIX_KEY)
         self.sql_stmt = self.get_sql_statement(
-            use_catalog_as_cluster_name=conf.get_bool(BasePostgresMetadataExtractor.USE_CATALOG_AS_CLUSTER_NAME),
-            where_clause_suffix=conf.get_string(BasePostgresMetadataExtractor.WHERE_CLAUSE_SUFFIX_KEY),
+            use_catalog_as_cluster_name=use_catalog_as_cluster_name,
+            where_clause_suffix=where_clause_suffix,
         )
+        self._extract_iter: Union[None, Iterator] = None
+
+        schema_concurrency = conf.get_int(BasePostgresMetadataExtractor.SCHEMA_CONCURRENCY)
+        if schema_concurrency > 1:
+            def sql_for_schema(schema: str) -> str:
+                return self.get_schema_sql_statement(use_catalog_as_cluster_name, where_clause_suffix, schema)
+
+            LOGGER.info('SQL for postgres metadata, partitioned by schema: %s', self.sql_stmt)
+            self._alchemy_extractor: Extractor = schema_partitioned_sql_alchemy_extractor.from_surrounding_config(
+                conf, sql_for_schema, BasePostgresMetadataExtractor.LIST_SCHEMAS_SQL, schema_concurrency,
+                statement_timeout_sql=BasePostgresMetadataExtractor.STATEMENT_TIMEOUT_SQL)
+            return
 
         self._alchemy_extractor = SQLAlchemyExtractor()
         sql_alch_conf = Scoped.get_scoped_conf(conf, self._alchemy_extractor.get_scope())\
@@ -66,7 +106,10 @@ class BasePostgresMetadataExtractor(Extractor):
         LOGGER.info('SQL for postgres metadata: %s', self.sql_stmt)
 
         self._alchemy_extractor.init(sql_alch_conf)
-        self._extract_iter: Union[None, Iterator] = None
+
+    def close(self) -> None:
+        if getattr(self, '_alchemy_extractor', None) is not None:
+            self._alchemy_extractor.close()
 
     def extract(self) -> Union[TableMetadata, None]:
         if not self._extract_iter:
@@ -5,17 +5,20 @@ import logging
 from collections import namedtuple
 from itertools import groupby
 from typing import (
-    Any, Dict, Iterator, Union,
+    Any, Dict, Iterator, List, Optional, Union,
 )
 
 from pyhocon import ConfigFactory, ConfigTree
 from sqlalchemy.engine.url import make_url
 
 from databuilder import Scoped
+from databuilder.extractor import sql_alchemy_extractor
 from databuilder.extractor.base_extractor import Extractor
-from databuilder.extractor.sql_alchemy_extractor import SQLAlchemyExtractor
+from databuilder.extractor.sql_alchemy_extractor import SQLAlchemyExtractor, add_where_condition
 from databuilder.extractor.table_metadata_constants import PARTITION_BADGE
 from databuilder.models.table_metadata import ColumnMetadata, TableMetadata
+from databuilder.state.base_state_store import StateStore
+from databuilder.state.incremental_extraction import IncrementalExtraction
 
 TableKey = namedtuple('TableKey', ['schema', 'table_name'])
 
@@ -25,6 +28,9 @@ LOGGER = logging.getLogger(__name__)
 class HiveTableMetadataExtractor(Extractor):
     """
     Extracts Hive table and column metadata from underlying meta store database using SQLAlchemyExtractor
+
+    If a state store is given, tables are extracted incrementally: only tables whose DDL changed since the previous
+    run are extracted, and the tables that were not are recorded in the state store for staleness removal.
     """
     EXTRACT_SQL = 'extract_sql'
     # SELECT statement from hive metastore database to extract table and column metadata
@@ -37,22 +43,24 @@ class HiveTableMetadataExtractor(Extractor):
     (SELECT t.TBL_ID, d.NAME as `schema`, t.TBL_NAME name, t.TBL_TYPE, tp.PARAM_VALUE as description,
            p.PKEY_NAME as col_name, p.INTEGER_IDX as col_sort_order,
            p.PKEY_TYPE as col_type, p.PKEY_COMMENT as col_description, 1 as "is_partition_col",
-           IF(t.TBL_TYPE = 'VIRTUAL_VIEW', 1, 0) "is_view"
+           IF(t.TBL_TYPE = 'VIRTUAL_VIEW', 1, 0) "is_view", ddl.PARAM_VALUE as last_altered
     FROM TBLS t
     JOIN DBS d ON t.DB_ID = d.DB_ID
     JOIN PARTITION_KEYS p ON t.TBL_ID = p.TBL_ID
     LEFT JOIN TABLE_PARAMS tp ON (t.TBL_ID = tp.TBL_ID AND tp.PARAM_KEY='comment')
+    LEFT JOIN TABLE_PARAMS ddl ON (t.TBL_ID = ddl.TBL_ID AND ddl.PARAM_KEY='transient_lastDdlTime')
     {where_clause_suffix}
     UNION
     SELECT t.TBL_ID, d.NAME as `schema`, t.TBL_NAME name, t.TBL_TYPE, tp.PARAM_VALUE as description,
            c.COLUMN_NAME as col_name, c.INTEGER_IDX as col_sort_order,
            c.TYPE_NAME as col_type, c.COMMENT as col_description, 0 as "is_partition_col",
-           IF(t.TBL_TYPE = 'VIRTUAL_VIEW', 1, 0) "is_view"
+           IF(t.TBL_TYPE = 'VIRTUAL_VIEW', 1, 0) "is_view", ddl.PARAM_VALUE as last_altered
     FROM TBLS t
     JOIN DBS d ON t.DB_ID = d.DB_ID
     JOIN SDS s ON t.SD_ID = s.SD_ID
     JOIN COLUMNS_V2 c ON s.CD_ID = c.CD_ID
     LEFT JOIN TABLE_PARAMS tp ON (t.TBL_ID = tp.TBL_ID AND tp.PARAM_KEY='comment')
+    LEFT JOIN TABLE_PARAMS ddl ON (t.TBL_ID = ddl.TBL_ID AND ddl.PARAM_KEY='transient_lastDdlTime')
     {where_clause_suffix}
     ) source
     ORDER by tbl_id, is_partition_col desc;
@@ -64,44 +72,100 @@ class HiveTableMetadataExtractor(Extractor):
            tp."PARAM_VALUE" as description, p."PKEY_NAME" as col_name, p."INTEGER_IDX" as col_sort_order,
            p."PKEY_TYPE" as col_type, p."PKEY_COMMENT" as col_description, 1 as "is_partition_col",
            CASE WHEN t."TBL_TYPE" = 'VIRTUAL_VIEW' THEN 1
-                ELSE 0 END as "is_view"
+                ELSE 0 END as "is_view", ddl."PARAM_VALUE" as last_altered
     FROM "TBLS" t
     JOIN "DBS" d ON t."DB_ID" = d."DB_ID"
     JOIN "PARTITION_KEYS" p ON t."TBL_ID" = p."TBL_ID"
     LEFT JOIN "TABLE_PARAMS" tp ON (t."TBL_ID" = tp."TBL_ID" AND tp."PARAM_KEY"='comment')
+    LEFT JOIN "TABLE_PARAMS" ddl ON (t."TBL_ID" = ddl."TBL_ID" AND ddl."PARAM_KEY"='transient_lastDdlTime')
     {where_clause_suffix}
     UNION
     SELECT t."TBL_ID" as tbl_id, d."NAME" as "schema", t."TBL_NAME" as name, t."TBL_TYPE",
            tp."PARAM_VALUE" as description, c."COLUMN_NAME" as col_name, c."INTEGER_IDX" as col_sort_order,
            c."TYPE_NAME" as col_type, c."COMMENT" as col_description, 0 as "is_partition_col",
            CASE WHEN t."TBL_TYPE" = 'VIRTUAL_VIEW' THEN 1
-                ELSE 0 END as "is_view"
+                ELSE 0 END as "is_view", ddl."PARAM_VALUE" as last_altered
     FROM "TBLS" t
     JOIN "DBS" d ON t."DB_ID" = d."DB_ID"
     JOIN "SDS" s ON t."SD_ID" = s."SD_ID"
     JOIN "COLUMNS_V2" c ON s."CD_ID" = c."CD_ID"
     LEFT JOIN "TABLE_PARAMS" tp ON (t."TBL_ID" = tp."TBL_ID" AND tp."PARAM_KEY"='comment')
+    LEFT JOIN "TABLE_PARAMS" ddl ON (t."TBL_ID" = ddl."TBL_ID" AND ddl."PARAM_KEY"='transient_lastDdlTime')
     {where_clause_suffix}
     ) source
     ORDER by tbl_id, is_partition_col desc;
     """
 
+    # SELECT statements listing all tables, used to find the tables that have not changed when extracting
+    # incrementally
+    LIST_TABLES_SQL_STATEMENT = """
+    SELECT DISTINCT d.NAME as `schema`, t.TBL_NAME name
+    FROM TBLS t
+    JOIN DBS d ON t.DB_ID = d.DB_ID
+    LEFT JOIN TABLE_PARAMS tp ON (t.TBL_ID = tp.TBL_ID AND tp.PARAM_KEY='comment')
+    LEFT JOIN TABLE_PARAMS ddl ON (t.TBL_ID = ddl.TBL_ID AND ddl.PARAM_KEY='transient_lastDdlTime')
+    {where_clause_suffix}
+    """
+
+    LIST_TABLES_POSTGRES_SQL_STATEMENT = """
+    SELECT DISTINCT d."NAME" as "schema", t."TBL_NAME" as name
+    FROM "TBLS" t
+    JOIN "DBS" d ON t."DB_ID" = d."DB_ID"
+    LEFT JOIN "TABLE_PARAMS" tp ON (t."TBL_ID" = tp."TBL_ID" AND tp."PARAM_KEY"='comment')
+    LEFT JOIN "TABLE_PARAMS" ddl ON (t."TBL_ID" = ddl."TBL_ID" AND ddl."PARAM_KEY"='transient_lastDdlTime')
+    {where_clause_suffix}
+    """
+
+    # Conditions on the time of the last DDL, in epoch seconds, to extract incrementally.
+    # Tables without it are always extracted.
+    WATERMARK_CONDITION = '(ddl.PARAM_VALUE IS NULL OR CAST(ddl.PARAM_VALUE AS UNSIGNED) >= {watermark})'
+    WATERMARK_POSTGRES_CONDITION = \
+        '(ddl."PARAM_VALUE" IS NULL OR CAST(ddl."PARAM_VALUE" AS BIGINT) >= {watermark})'
+
     # CONFIG KEYS
     WHERE_CLAUSE_SUFFIX_KEY = 'where_clause_suffix'
     CLUSTER_KEY = 'cluster'
+    # Name of the source in the state store when extracting incrementally. Defaults to hive.<cluster>
+    INCREMENTAL_SOURCE = 'incremental_source'
 
     DEFAULT_CONFIG = ConfigFactory.from_dict({WHERE_CLAUSE_SUFFIX_KEY: ' ',
                                               CLUSTER_KEY: 'gold'})
 
+    def __init__(self, state_store: Optional[StateStore] = None) -> None:
+        """
+        :param state_store: State store to extract incrementally with. It's initialized with the config within its
+        scope, and is expected to be registered as a callback of the publisher to commit the state.
+        """
+        self._state_store = state_store
+
     def init(self, conf: ConfigTree) -> None:
         conf = conf.with_fallback(HiveTableMetadataExtractor.DEFAULT_CONFIG)
+        self._conf = conf
         self._cluster = conf.get_string(HiveTableMetadataExtractor.CLUSTER_KEY)
 
         self._alchemy_extractor = SQLAlchemyExtractor()
 
         sql_alch_conf = Scoped.get_scoped_conf(conf, self._alchemy_extractor.get_scope())
-        default_sql = self._choose_default_sql_stm(sql_alch_conf).format(
-            where_clause_suffix=conf.get_string(HiveTableMetadataExtractor.WHERE_CLAUSE_SUFFIX_KEY))
+        self._where_clause_suffix = conf.get_string(HiveTableMetadataExtractor.WHERE_CLAUSE_SUFFIX_KEY)
+        where_clause_suffix = self._where_clause_suffix
+
+        self._incremental: Optional[IncrementalExtraction] = None
+        if self._state_store is not None:
+            if HiveTableMetadataExtractor.EXTRACT_SQL in conf:
+                raise ValueError(f'{HiveTableMetadataExtractor.EXTRACT_SQL} cannot be used to extract incrementally')
+
+            self._is_postgres_metastore = self._is_postgres(sql_alch_conf)
+            self._state_store.init(Scoped.get_scoped_conf(conf, self._state_store.get_scope()))
+            source = conf.get_string(HiveTableMetadataExtractor.INCREMENTAL_SOURCE, default=f'hive.{self._cluster}')
+            self._incremental = IncrementalExtraction(self._state_store, source)
+            if self._incremental.watermark is not None:
+                watermark_condition = HiveTableMetadataExtractor.WATERMARK_POSTGRES_CONDITION \
+                    if self._is_postgres_metastore else HiveTableMetadataExtractor.WATERMARK_CONDITION
+                # Tables altered within the same second as the watermark are extracted again rather than missed
+                where_clause_suffix = add_where_condition(
+                    where_clause_suffix, watermark_condition.format(watermark=self._incremental.watermark))
+
+        default_sql = self._choose_default_sql_stm(sql_alch_conf).format(where_clause_suffix=where_clause_suffix)
 
         self.sql_stmt = conf.get_string(HiveTableMetadataExtractor.EXTRACT_SQL, default=default_sql)
 
@@ -112,9 +176,12 @@ class HiveTableMetadataExtractor(Extractor):
         self._alchemy_extractor.init(sql_alch_conf)
         self._extract_iter: Union[None, Iterator] = None
 
-    def _choose_default_sql_stm(self, conf: ConfigTree) -> str:
+    def _is_postgres(self, conf: ConfigTree) -> bool:
         url = make_url(conf.get_string(SQLAlchemyExtractor.CONN_STRING))
-        if url.drivername.lower() in ['postgresql', 'postgres']:
+        return url.drivername.lower() in ['postgresql', 'postgres']
+
+    def _choose_default_sql_stm(self, conf: ConfigTree) -> str:
+        if self._is_postgres(conf):
             return HiveTableMetadataExtractor.DEFAULT_POSTGRES_SQL_STATEMENT
         else:
             return HiveTableMetadataExtractor.DEFAULT_SQL_STATEMENT
@@ -157,6 +224,37 @@ class HiveTableMetadataExtractor(Extractor):
                                 columns,
                                 is_view=is_view)
 
+            if self._incremental:
+                table_key = TableMetadata.TABLE_KEY_FORMAT.format(db='hive', cluster=self._cluster,
+                                                                  schema=last_row['schema'], tbl=last_row['name'])
+                last_altered = last_row['last_altered']
+                self._incremental.record_table(table_key, int(last_altered) if last_altered else None)
+
+        if self._incremental:
+            self._incremental.finish(self._list_table_keys() if self._incremental.watermark is not None else [])
+
+    def _list_table_keys(self) -> List[str]:
+        """
+        Lists keys of all tables, changed or not
+        :return:
+        """
+        sql_stmt = HiveTableMetadataExtractor.LIST_TABLES_POSTGRES_SQL_STATEMENT if self._is_postgres_metastore \
+            else HiveTableMetadataExtractor.LIST_TABLES_SQL_STATEMENT
+        sql_stmt = sql_stmt.format(where_clause_suffix=self._where_clause_suffix)
+        LOGGER.info('SQL for hive tables: %s', sql_stmt)
+
+        extractor = sql_alchemy_extractor.from_surrounding_config(self._conf, sql_stmt)
+        try:
+            table_keys = []
+            row = extractor.extract()
+            while row:
+                table_keys.append(TableMetadata.TABLE_KEY_FORMAT.format(db='hive', cluster=self._cluster,
+                                                                        schema=row['schema'], tbl=row['name']))
+                row = extractor.extract()
+            return table_keys
+        finally:
+            extractor.close()
+
     def _get_raw_extract_iter(self) -> Iterator[Dict[str, Any]]:
         """
         Provides iterator of result row from SQLAlchemy extractor
@@ -11,7 +11,9 @@ from typing import (
 from pyhocon import ConfigFactory, ConfigTree
 
 from databuilder import Scoped
+from databuilder.extractor import schema_partitioned_sql_alchemy_extractor
 from databuilder.extractor.base_extractor import Extractor
+from databuilder.extractor.schema_partitioned_sql_alchemy_extractor import add_schema_filter
 from databuilder.extractor.sql_alchemy_extractor import SQLAlchemyExtractor
 from databuilder.models.table_metadata import ColumnMetadata, TableMetadata
 
@@ -51,12 +53,18 @@ class MysqlMetadataExtractor(Extractor):
     CLUSTER_KEY = 'cluster_key'
     USE_CATALOG_AS_CLUSTER_NAME = 'use_catalog_as_cluster_name'
     DATABASE_KEY = 'database_key'
+    # Number of schemas extracted concurrently, each with its own query. A single query is used if 1.
+    SCHEMA_CONCURRENCY = 'schema_concurrency'
 
     # Default values
     DEFAULT_CLUSTER_NAME = 'master'
+    LIST_SCHEMAS_SQL = 'SELECT schema_name FROM INFORMATION_SCHEMA.SCHEMATA ORDER BY schema_name'
+    # Sets the server-side timeout of the queries of a schema, when extracting schema by schema
+    STATEMENT_TIMEOUT_SQL = 'SET SESSION max_execution_time = {timeout_ms}'
 
     DEFAULT_CONFIG = ConfigFactory.from_dict(
-        {WHERE_CLAUSE_SUFFIX_KEY: ' ', CLUSTER_KEY: DEFAULT_CLUSTER_NAME, USE_CATALOG_AS_CLUSTER_NAME: True}
+        {WHERE_CLAUSE_SUFFIX_KEY: ' ', CLUSTER_KEY: DEFAULT_CLUSTER_NAME, USE_CATALOG_AS_CLUSTER_NAME: True,
+         SCHEMA_CONCURRENCY: 1}
     )
 
     def init(self, conf: ConfigTree) -> None:
@@ -70,10 +78,26 @@ class MysqlMetadataExtractor(Extractor):
 
         self._database = conf.get_string(MysqlMetadataExtractor.DATABASE_KEY, default='mysql')
 
+        where_clause_suffix = conf.get_string(MysqlMetadataExtractor.WHERE_CLAUSE_SUFFIX_KEY)
         self.sql_stmt = MysqlMetadataExtractor.SQL_STATEMENT.format(
-            where_clause_suffix=conf.get_string(MysqlMetadataExtractor.WHERE_CLAUSE_SUFFIX_KEY),
+            where_clause_suffix=where_clause_suffix,
             cluster_source=cluster_source
         )
+        self._extract_iter: Union[None, Iterator] = None
+
+        schema_concurrency = conf.get_int(MysqlMetadataExtractor.SCHEMA_CONCURRENCY)
+        if schema_concurrency > 1:
+            def sql_for_schema(schema: str) -> str:
+                return MysqlMetadataExtractor.SQL_STATEMENT.format(
+                    where_clause_suffix=add_schema_filter(where_clause_suffix, 'c.table_schema', schema),
+                    cluster_source=cluster_source
+                )
+
+            LOGGER.info('SQL for mysql metadata, partitioned by schema: %s', self.sql_stmt)
+            self._alchemy_extractor: Extractor = schema_partitioned_sql_alchemy_extractor.from_surrounding_config(
+                conf, sql_for_schema, MysqlMetadataExtractor.LIST_SCHEMAS_SQL, schema_concurrency,
+                statement_timeout_sql=MysqlMetadataExtractor.STATEMENT_TIMEOUT_SQL)
+            return
 
         self._alchemy_extractor = SQLAlchemyExtractor()
         sql_alch_conf = Scoped.get_scoped_conf(conf, self._alchemy_extractor.get_scope()) \
@@ -84,7 +108,10 @@ class MysqlMetadataExtractor(Extractor):
         LOGGER.info('SQL for mysql metadata: %s', self.sql_stmt)
 
         self._alchemy_extractor.init(sql_alch_conf)
-        self._extract_iter: Union[None, Iterator] = None
+
+    def close(self) -> None:
+        if getattr(self, '_alchemy_extractor', None) is not None:
+            self._alchemy_extractor.close()
 
     def extract(self) -> Union[TableMetadata, None]:
         if not self._extract_iter:
@@ -2,12 +2,13 @@
 # SPDX-License-Identifier: Apache-2.0
 
 from typing import (  # noqa: F401
-    Any, Dict, Iterator, Union,
+    Any, Dict, Iterator, Optional, Union,
 )
 
 from pyhocon import ConfigFactory, ConfigTree  # noqa: F401
 
 from databuilder.extractor.base_postgres_metadata_extractor import BasePostgresMetadataExtractor
+from databuilder.extractor.schema_partitioned_sql_alchemy_extractor import add_schema_filter
 
 
 class RedshiftMetadataExtractor(BasePostgresMetadataExtractor):
@@ -19,11 +20,23 @@ class RedshiftMetadataExtractor(BasePostgresMetadataExtractor):
     """
 
     def get_sql_statement(self, use_catalog_as_cluster_name: bool, where_clause_suffix: str) -> str:
+        return self._get_sql_statement(use_catalog_as_cluster_name, where_clause_suffix, schema=None)
+
+    def get_schema_sql_statement(self, use_catalog_as_cluster_name: bool, where_clause_suffix: str,
+                                 schema: str) -> str:
+        # The schema is filtered in each of the queries of the union, so that they don't scan the other schemas
+        return self._get_sql_statement(use_catalog_as_cluster_name, where_clause_suffix, schema=schema)
+
+    def _get_sql_statement(self, use_catalog_as_cluster_name: bool, where_clause_suffix: str,
+                           schema: Optional[str]) -> str:
         if use_catalog_as_cluster_name:
             cluster_source = "CURRENT_DATABASE()"
         else:
             cluster_source = f"'{self._cluster}'"
 
+        def schema_filter(schema_column: str) -> str:
+            return add_schema_filter('', schema_column, schema) if schema is not None else ''
+
         return """
         SELECT
             *
@@ -44,6 +57,7 @@ class RedshiftMetadataExtractor(BasePostgresMetadataExtractor):
               pg_catalog.pg_description pgcd on pgcd.objoid=st.relid and pgcd.objsubid=c.ordinal_position
             LEFT JOIN
               pg_catalog.pg_description pgtd on pgtd.objoid=st.relid and pgtd.objsubid=0
+            {table_schema_filter}
 
             UNION
 
@@ -59,6 +73,7 @@ class RedshiftMetadataExtractor(BasePostgresMetadataExtractor):
             FROM
                 PG_GET_LATE_BINDING_VIEW_COLS()
                     COLS(view_schema NAME, view_name NAME, column_name NAME, data_type VARCHAR, ordinal_position INT)
+            {view_schema_filter}
 
             UNION
 
@@ -72,12 +87,16 @@ class RedshiftMetadataExtractor(BasePostgresMetadataExtractor):
               NULL AS col_description,
               columnnum AS col_sort_order
             FROM svv_external_columns
+            {external_schema_filter}
         )
 
         {where_clause_suffix}
         ORDER by cluster, schema, name, col_sort_order ;
         """.format(
             cluster_source=cluster_source,
+            table_schema_filter=schema_filter('c.table_schema'),
+            view_schema_filter=schema_filter('view_schema'),
+            external_schema_filter=schema_filter('schemaname'),
             where_clause_suffix=where_clause_suffix,
         )
 
@@ -0,0 +1,248 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import (
+    Future, ThreadPoolExecutor, TimeoutError,
+)
+from typing import (
+    Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple,
+)
+
+from pyhocon import ConfigFactory, ConfigTree
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Connection
+from sqlalchemy.pool import NullPool
+
+from databuilder import Scoped
+from databuilder.extractor.base_extractor import Extractor
+from databuilder.extractor.sql_alchemy_extractor import add_where_condition
+
+LOGGER = logging.getLogger(__name__)
+
+
+def add_schema_filter(where_clause_suffix: str, schema_column: str, schema: str) -> str:
+    """
+    Adds a condition on the schema to a where clause suffix such as "WHERE table_schema NOT IN ('pg_catalog')".
+    :param where_clause_suffix: Either empty or a clause starting with WHERE
+    :param schema_column: Column, or expression, of the schema in the query
+    :param schema: Schema to filter on
+    :return: Where clause suffix that only matches the given schema
+    """
+    return add_where_condition(where_clause_suffix,
+                               "{} = '{}'".format(schema_column, schema.replace("'", "''")))
+
+
+class SchemaPartitionedSQLAlchemyExtractor(Extractor):
+    """
+    An Extractor that extracts records via SQLAlchemy with a query per schema, instead of a single query over the
+    whole catalog. Schemas are listed first, then queried concurrently on a pool of connections where each worker
+    thread keeps its own connection.
+    Records are returned schema by schema in the order the schemas are listed, and records of a schema keep the order
+    of the query, so callers grouping records by table (e.g. with itertools.groupby) still work.
+
+    It is a replacement of SQLAlchemyExtractor within the metadata extractors and takes the same scope.
+
+    SCHEMA_TIMEOUT_SEC is counted from the time the query of a schema starts. When STATEMENT_TIMEOUT_SQL is set, it
+    is run on each connection so that the database aborts queries that take longer. Either way, once a schema times
+    out, the connections are invalidated and pending schemas cancelled, so that closing the extractor doesn't wait
+    for a hung query.
+    """
+    # Config keys
+    CONN_STRING = 'conn_string'
+    CONNECT_ARGS = 'connect_args'
+    # A query whose first column is the schema name
+    LIST_SCHEMAS_SQL = 'list_schemas_sql'
+    # List of schemas to extract. If set, schemas are not listed with LIST_SCHEMAS_SQL
+    SCHEMAS = 'schemas'
+    # Number of schemas queried concurrently
+    CONCURRENCY = 'concurrency'
+    # Seconds to wait for the records of a schema before failing the extraction. No timeout if not set.
+    SCHEMA_TIMEOUT_SEC = 'schema_timeout_sec'
+    # Statement run on each new connection to set a server-side timeout of SCHEMA_TIMEOUT_SEC on its queries, formatted
+    # with {timeout_ms} and {timeout_sec}, e.g. "SET statement_timeout = {timeout_ms}" for PostgreSQL
+    STATEMENT_TIMEOUT_SQL = 'statement_timeout_sql'
+
+    _DEFAULT_CONFIG = ConfigFactory.from_dict({CONCURRENCY: 4})
+
+    def __init__(self, sql_for_schema: Callable[[str], str]) -> None:
+        """
+        :param sql_for_schema: A function that returns the SQL statement that extracts records of the given schema
+        """
+        self._sql_for_schema = sql_for_schema
+        self._connections: List[Connection] = []
+        self._connections_lock = threading.Lock()
+        self._thread_local = threading.local()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: Deque[Tuple[str, Future]] = deque()
+        # Time at which the query of each running schema started
+        self._started: Dict[str, float] = {}
+
+    def init(self, conf: ConfigTree) -> None:
+        self.conf = conf.with_fallback(SchemaPartitionedSQLAlchemyExtractor._DEFAULT_CONFIG)
+        self._concurrency = self.conf.get_int(SchemaPartitionedSQLAlchemyExtractor.CONCURRENCY)
+        self._schema_timeout_sec = self.conf.get_float(SchemaPartitionedSQLAlchemyExtractor.SCHEMA_TIMEOUT_SEC,
+                                                       None)
+        self._statement_timeout_sql = self.conf.get_string(SchemaPartitionedSQLAlchemyExtractor.STATEMENT_TIMEOUT_SQL,
+                                                           None)
+
+        connect_args = {
+            k: v
+            for k, v in self.conf.get_config(
+                SchemaPartitionedSQLAlchemyExtractor.CONNECT_ARGS, default=ConfigTree()
+            ).items()
+        }
+        # Connections are held by the worker threads for the whole extraction, so there's no need of a pool
+        self._engine = create_engine(self.conf.get_string(SchemaPartitionedSQLAlchemyExtractor.CONN_STRING),
+                                     connect_args=connect_args,
+                                     poolclass=NullPool)
+        self._iter: Optional[Iterator[Any]] = None
+
+    def extract(self) -> Any:
+        if not self._iter:
+            self._iter = self._get_extract_iter()
+        return next(self._iter, None)
+
+    def get_scope(self) -> str:
+        return 'extractor.sqlalchemy'
+
+    def close(self) -> None:
+        for _, future in self._pending:
+            future.cancel()
+        self._pending.clear()
+
+        if self._executor is not None:
+            # Running queries were either consumed, or invalidated after a failure, so there's nothing to wait for
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+
+    def _list_schemas(self) -> List[str]:
+        if SchemaPartitionedSQLAlchemyExtractor.SCHEMAS in self.conf:
+            return self.conf.get_list(SchemaPartitionedSQLAlchemyExtractor.SCHEMAS)
+
+        list_schemas_sql = self.conf.get_string(SchemaPartitionedSQLAlchemyExtractor.LIST_SCHEMAS_SQL)
+        LOGGER.info('Listing schemas: %s', list_schemas_sql)
+        return [row[0] for row in self._get_connection().execute(list_schemas_sql)]
+
+    def _get_extract_iter(self) -> Iterator[Any]:
+        schemas = self._list_schemas()
+        LOGGER.info('Extracting %i schemas with concurrency %i', len(schemas), self._concurrency)
+
+        self._executor = ThreadPoolExecutor(max_workers=self._concurrency)
+        pending = self._pending
+        schemas_iter = iter(schemas)
+        # Only keep a bounded number of schemas in flight so that records of schemas that are done but not consumed
+        # yet don't pile up in memory
+        for schema in schemas_iter:
+            pending.append((schema, self._executor.submit(self._extract_schema, schema)))
+            if len(pending) >= self._concurrency * 2:
+                break
+
+        while pending:
+            schema, future = pending.popleft()
+            try:
+                rows = self._get_result(schema, future)
+            except Exception as e:
+                LOGGER.exception('Failed to extract schema %s', schema)
+                for _, f in pending:
+                    f.cancel()
+                pending.clear()
+                self._invalidate_connections()
+                raise e
+
+            next_schema = next(schemas_iter, None)
+            if next_schema is not None:
+                pending.append((next_schema, self._executor.submit(self._extract_schema, next_schema)))
+
+            LOGGER.debug('Extracted %i records from schema %s', len(rows), schema)
+            yield from rows
+
+    def _get_result(self, schema: str, future: Future) -> List[Any]:
+        """
+        Waits for the records of a schema, until SCHEMA_TIMEOUT_SEC after its query started.
+        :param schema:
+        :param future:
+        :return: Records of the schema
+        """
+        if self._schema_timeout_sec is None:
+            return future.result()
+
+        while True:
+            started = self._started.get(schema)
+            # Waits by short steps as long as the query is not started, e.g. while workers are busy with other schemas
+            timeout = 1.0 if started is None else started + self._schema_timeout_sec - time.monotonic()
+            try:
+                return future.result(timeout=max(timeout, 0))
+            except TimeoutError:
+                if started is not None:
+                    raise
+
+    def _extract_schema(self, schema: str) -> List[Any]:
+        connection = self._get_connection()
+        sql = self._sql_for_schema(schema)
+        self._started[schema] = time.monotonic()
+        try:
+            return list(connection.execute(sql))
+        finally:
+            self._started.pop(schema, None)
+
+    def _get_connection(self) -> Connection:
+        """
+        Connection of the current thread
+        """
+        connection = getattr(self._thread_local, 'connection', None)
+        if connection is None:
+            connection = self._engine.connect()
+            if self._statement_timeout_sql and self._schema_timeout_sec is not None:
+                connection.execute(self._statement_timeout_sql.format(
+                    timeout_ms=int(self._schema_timeout_sec * 1000),
+                    timeout_sec=int(math.ceil(self._schema_timeout_sec))))
+            self._thread_local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def _invalidate_connections(self) -> None:
+        """
+        Invalidates the connections, which closes them even while a query runs on them, so that worker threads stuck
+        on a query fail instead of blocking.
+        """
+        with self._connections_lock:
+            for connection in self._connections:
+                try:
+                    connection.invalidate()
+                except Exception:
+                    LOGGER.warning('Failed to invalidate connection', exc_info=True)
+
+
+def from_surrounding_config(conf: ConfigTree,
+                            sql_for_schema: Callable[[str], str],
+                            list_schemas_sql: str,
+                            concurrency: int,
+                            statement_timeout_sql: Optional[str] = None) -> SchemaPartitionedSQLAlchemyExtractor:
+    """
+    A factory to create SchemaPartitionedSQLAlchemyExtractors that are wrapped by another, specialized
+    extractor, same as sql_alchemy_extractor.from_surrounding_config.
+    :param conf: A config tree from which the sqlalchemy config still needs to be taken.
+    :param sql_for_schema: A function that returns the SQL statement that extracts records of the given schema
+    :param list_schemas_sql: The SQL statement to list schemas, unless set in the config.
+    :param concurrency: Number of schemas queried concurrently, unless set in the config.
+    :param statement_timeout_sql: The statement setting a server-side timeout on queries, unless set in the config.
+    """
+    ae = SchemaPartitionedSQLAlchemyExtractor(sql_for_schema)
+    defaults = {SchemaPartitionedSQLAlchemyExtractor.LIST_SCHEMAS_SQL: list_schemas_sql,
+                SchemaPartitionedSQLAlchemyExtractor.CONCURRENCY: concurrency}
+    if statement_timeout_sql:
+        defaults[SchemaPartitionedSQLAlchemyExtractor.STATEMENT_TIMEOUT_SQL] = statement_timeout_sql
+    c = Scoped.get_scoped_conf(conf, ae.get_scope()).with_fallback(ConfigFactory.from_dict(defaults))
+    ae.init(c)
+    return ae
@@ -6,15 +6,20 @@ import logging
 from collections import namedtuple
 from itertools import groupby
 from typing import (
-    Any, Dict, Iterator, Union,
+    Any, Dict, Iterator, List, Optional, Union,
 )
 
 from pyhocon import ConfigFactory, ConfigTree
 from unidecode import unidecode
 
-from databuilder.extractor import sql_alchemy_extractor
+from databuilder import Scoped
+from databuilder.extractor import schema_partitioned_sql_alchemy_extractor, sql_alchemy_extractor
 from databuilder.extractor.base_extractor import Extractor
+from databuilder.extractor.schema_partitioned_sql_alchemy_extractor import add_schema_filter
+from databuilder.extractor.sql_alchemy_extractor import add_where_condition
 from databuilder.models.table_metadata import ColumnMetadata, TableMetadata
+from databuilder.state.base_state_store import StateStore
+from databuilder.state.incremental_extraction import IncrementalExtraction
 
 TableKey = namedtuple('TableKey', ['schema', 'table_name'])
 
@@ -27,6 +32,9 @@ class SnowflakeMetadataExtractor(Extractor):
     Requirements:
         snowflake-connector-python
         snowflake-sqlalchemy
+
+    If a state store is given, tables are extracted incrementally: only tables altered since the previous run are
+    extracted, and the tables that were not are recorded in the state store for staleness removal.
     """
     # SELECT statement from snowflake information_schema to extract table and column metadata
     # https://docs.snowflake.com/en/sql-reference/account-usage.html#label-account-usage-views
@@ -42,7 +50,23 @@ class SnowflakeMetadataExtractor(Extractor):
         lower(c.table_schema) AS schema,
         lower(c.table_name) AS name,
         t.comment AS description,
-        decode(lower(t.table_type), 'view', 'true', 'false') AS is_view
+        decode(lower(t.table_type), 'view', 'true', 'false') AS is_view,
+        date_part(epoch_second, t.last_altered) AS last_altered
+    FROM
+        {database}.{schema}.COLUMNS AS c
+    LEFT JOIN
+        {database}.{schema}.TABLES t
+            ON c.TABLE_NAME = t.TABLE_NAME
+            AND c.TABLE_SCHEMA = t.TABLE_SCHEMA
+    {where_clause_suffix};
+    """
+
+    # SELECT statement listing all tables, used to find the tables that have not changed when extracting incrementally
+    LIST_TABLES_SQL_STATEMENT = """
+    SELECT DISTINCT
+        lower({cluster_source}) AS cluster,
+        lower(c.table_schema) AS schema,
+        lower(c.table_name) AS name
     FROM
         {database}.{schema}.COLUMNS AS c
     LEFT JOIN
@@ -62,9 +86,17 @@ class SnowflakeMetadataExtractor(Extractor):
     SNOWFLAKE_DATABASE_KEY = 'snowflake_database'
     # Snowflake Schema Key, used to determine which Snowflake schema to use.
     SNOWFLAKE_SCHEMA_KEY = 'snowflake_schema'
+    # Number of schemas extracted concurrently, each with its own query. A single query is used if 1.
+    SCHEMA_CONCURRENCY = 'schema_concurrency'
+    # Name of the source in the state store when extracting incrementally.
+    # Defaults to <database_key>.<snowflake_database>
+    INCREMENTAL_SOURCE = 'incremental_source'
 
     # Default values
     DEFAULT_CLUSTER_NAME = 'master'
+    LIST_SCHEMAS_SQL = 'SELECT schema_name FROM {database}.{schema}.SCHEMATA ORDER BY schema_name'
+    # Sets the server-side timeout of the queries of a schema, when extracting schema by schema
+    STATEMENT_TIMEOUT_SQL = 'ALTER SESSION SET STATEMENT_TIMEOUT_IN_SECONDS = {timeout_sec}'
 
     DEFAULT_CONFIG = ConfigFactory.from_dict(
         {WHERE_CLAUSE_SUFFIX_KEY: ' ',
@@ -72,34 +104,76 @@ class SnowflakeMetadataExtractor(Extractor):
          USE_CATALOG_AS_CLUSTER_NAME: True,
          DATABASE_KEY: 'snowflake',
          SNOWFLAKE_DATABASE_KEY: 'prod',
-         SNOWFLAKE_SCHEMA_KEY: 'INFORMATION_SCHEMA'}
+         SNOWFLAKE_SCHEMA_KEY: 'INFORMATION_SCHEMA',
+         SCHEMA_CONCURRENCY: 1}
     )
 
+    def __init__(self, state_store: Optional[StateStore] = None) -> None:
+        """
+        :param state_store: State store to extract incrementally with. It's initialized with the config within its
+        scope, and is expected to be registered as a callback of the publisher to commit the state.
+        """
+        self._state_store = state_store
+
     def init(self, conf: ConfigTree) -> None:
         conf = conf.with_fallback(SnowflakeMetadataExtractor.DEFAULT_CONFIG)
+        self._conf = conf
         self._cluster = conf.get_string(SnowflakeMetadataExtractor.CLUSTER_KEY)
 
         if conf.get_bool(SnowflakeMetadataExtractor.USE_CATALOG_AS_CLUSTER_NAME):
             cluster_source = "c.table_catalog"
         else:
             cluster_source = f"'{self._cluster}'"
+        self._cluster_source = cluster_source
 
         self._database = conf.get_string(SnowflakeMetadataExtractor.DATABASE_KEY)
         self._schema = conf.get_string(SnowflakeMetadataExtractor.DATABASE_KEY)
         self._snowflake_database = conf.get_string(SnowflakeMetadataExtractor.SNOWFLAKE_DATABASE_KEY)
         self._snowflake_schema = conf.get_string(SnowflakeMetadataExtractor.SNOWFLAKE_SCHEMA_KEY)
 
+        self._where_clause_suffix = conf.get_string(SnowflakeMetadataExtractor.WHERE_CLAUSE_SUFFIX_KEY)
+        where_clause_suffix = self._where_clause_suffix
+
+        self._incremental: Optional[IncrementalExtraction] = None
+        if self._state_store is not None:
+            self._state_store.init(Scoped.get_scoped_conf(conf, self._state_store.get_scope()))
+            source = conf.get_string(SnowflakeMetadataExtractor.INCREMENTAL_SOURCE,
+                                     default=f'{self._database}.{self._snowflake_database}')
+            self._incremental = IncrementalExtraction(self._state_store, source)
+            if self._incremental.watermark is not None:
+                # Tables altered within the same second as the watermark are extracted again rather than missed
+                where_clause_suffix = add_where_condition(
+                    where_clause_suffix, f't.last_altered >= to_timestamp_ltz({self._incremental.watermark})')
+
         self.sql_stmt = SnowflakeMetadataExtractor.SQL_STATEMENT.format(
-            where_clause_suffix=conf.get_string(SnowflakeMetadataExtractor.WHERE_CLAUSE_SUFFIX_KEY),
+            where_clause_suffix=where_clause_suffix,
             cluster_source=cluster_source,
             database=self._snowflake_database,
             schema=self._snowflake_schema
         )
+        self._extract_iter: Union[None, Iterator] = None
+
+        schema_concurrency = conf.get_int(SnowflakeMetadataExtractor.SCHEMA_CONCURRENCY)
+        if schema_concurrency > 1:
+            def sql_for_schema(schema: str) -> str:
+                return SnowflakeMetadataExtractor.SQL_STATEMENT.format(
+                    where_clause_suffix=add_schema_filter(where_clause_suffix, 'c.table_schema', schema),
+                    cluster_source=cluster_source,
+                    database=self._snowflake_database,
+                    schema=self._snowflake_schema
+                )
+
+            LOGGER.info('SQL for snowflake metadata, partitioned by schema: %s', self.sql_stmt)
+            list_schemas_sql = SnowflakeMetadataExtractor.LIST_SCHEMAS_SQL.format(database=self._snowflake_database,
+                                                                                  schema=self._snowflake_schema)
+            self._alchemy_extractor: Extractor = schema_partitioned_sql_alchemy_extractor.from_surrounding_config(
+                conf, sql_for_schema, list_schemas_sql, schema_concurrency,
+                statement_timeout_sql=SnowflakeMetadataExtractor.STATEMENT_TIMEOUT_SQL)
+            return
 
         LOGGER.info('SQL for snowflake metadata: %s', self.sql_stmt)
 
         self._alchemy_extractor = sql_alchemy_extractor.from_surrounding_config(conf, self.sql_stmt)
-        self._extract_iter: Union[None, Iterator] = None
 
     def close(self) -> None:
         if getattr(self, '_alchemy_extractor', None) is not None:
@@ -140,6 +214,39 @@ class SnowflakeMetadataExtractor(Extractor):
                                 columns,
                                 last_row['is_view'] == 'true')
 
+            if self._incremental:
+                table_key = TableMetadata.TABLE_KEY_FORMAT.format(db=self._database, cluster=last_row['cluster'],
+                                                                  schema=last_row['schema'], tbl=last_row['name'])
+                self._incremental.record_table(table_key, last_row['last_altered'])
+
+        if self._incremental:
+            self._incremental.finish(self._list_table_keys() if self._incremental.watermark is not None else [])
+
+    def _list_table_keys(self) -> List[str]:
+        """
+        Lists keys of all tables, changed or not
+        :return:
+        """
+        sql_stmt = SnowflakeMetadataExtractor.LIST_TABLES_SQL_STATEMENT.format(
+            where_clause_suffix=self._where_clause_suffix,
+            cluster_source=self._cluster_source,
+            database=self._snowflake_database,
+            schema=self._snowflake_schema
+        )
+        LOGGER.info('SQL for snowflake tables: %s', sql_stmt)
+
+        extractor = sql_alchemy_extractor.from_surrounding_config(self._conf, sql_stmt)
+        try:
+            table_keys = []
+            row = extractor.extract()
+            while row:
+                table_keys.append(TableMetadata.TABLE_KEY_FORMAT.format(db=self._database, cluster=row['cluster'],
+                                                                        schema=row['schema'], tbl=row['name']))
+                row = extractor.extract()
+            return table_keys
+        finally:
+            extractor.close()
+
     def _get_raw_extract_iter(self) -> Iterator[Dict[str, Any]]:
         """
         Provides iterator of result row from SQLAlchemy extractor
@@ -2,7 +2,8 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import importlib
-from typing import Any
+import re
+from typing import Any, Iterator
 
 from pyhocon import ConfigFactory, ConfigTree
 from sqlalchemy import create_engine
@@ -16,6 +17,11 @@ class SQLAlchemyExtractor(Extractor):
     CONN_STRING = 'conn_string'
     EXTRACT_SQL = 'extract_sql'
     CONNECT_ARGS = 'connect_args'
+    # If True, rows are streamed from a server side cursor instead of being buffered in client memory,
+    # for drivers that support it (e.g. psycopg2, pymysql, mysqlclient)
+    STREAM_RESULTS = 'stream_results'
+    # Number of rows fetched at a time when streaming results
+    FETCH_SIZE = 'fetch_size'
     """
     An Extractor that extracts records via SQLAlchemy. Database that supports SQLAlchemy can use this extractor
     """
@@ -31,6 +37,8 @@ class SQLAlchemyExtractor(Extractor):
         self.connection = self._get_connection()
 
         self.extract_sql = conf.get_string(SQLAlchemyExtractor.EXTRACT_SQL)
+        self.stream_results = conf.get_bool(SQLAlchemyExtractor.STREAM_RESULTS, False)
+        self.fetch_size = conf.get_int(SQLAlchemyExtractor.FETCH_SIZE, 1000)
 
         model_class = conf.get('model_class', None)
         if model_class:
@@ -61,6 +69,10 @@ class SQLAlchemyExtractor(Extractor):
         """
         Create an iterator to execute sql.
         """
+        if self.stream_results:
+            self._execute_streaming_query()
+            return
+
         if not hasattr(self, 'results'):
             self.results = self.connection.execute(self.extract_sql)
 
@@ -71,6 +83,25 @@ class SQLAlchemyExtractor(Extractor):
             results = self.results
         self.iter = iter(results)
 
+    def _execute_streaming_query(self) -> None:
+        """
+        Create an iterator that fetches rows in batches of fetch_size from a server side cursor.
+        Rows are converted to model lazily, so that only a batch of rows is held in memory.
+        """
+        if not hasattr(self, 'results'):
+            self.results = self.connection.execution_options(stream_results=True).execute(self.extract_sql)
+
+        if hasattr(self, 'model_class'):
+            self.iter = (self.model_class(**result) for result in self._fetch_in_batches())
+        else:
+            self.iter = self._fetch_in_batches()
+
+    def _fetch_in_batches(self) -> Iterator[Any]:
+        rows = self.results.fetchmany(self.fetch_size)
+        while rows:
+            yield from rows
+            rows = self.results.fetchmany(self.fetch_size)
+
     def extract(self) -> Any:
         """
         Yield the sql result one at a time.
@@ -101,3 +132,24 @@ def from_surrounding_config(conf: ConfigTree, sql_stmt: str) -> SQLAlchemyExtrac
         .with_fallback(ConfigFactory.from_dict({SQLAlchemyExtractor.EXTRACT_SQL: sql_stmt}))
     ae.init(c)
     return ae
+
+
+_WHERE_PREFIX = re.compile(r'^\s*where\s', re.IGNORECASE)
+
+
+def add_where_condition(where_clause_suffix: str, condition: str) -> str:
+    """
+    Adds a condition to a where clause suffix such as "WHERE table_schema NOT IN ('pg_catalog')", used by the
+    extractors that wrap SQLAlchemyExtractor to narrow down their SQL statement.
+    :param where_clause_suffix: Either empty or a clause starting with WHERE
+    :param condition: Condition to AND with the where clause suffix
+    :return: Where clause suffix that also requires the condition
+    """
+    where_clause_suffix = where_clause_suffix.strip().rstrip(';')
+    if not where_clause_suffix:
+        return f'WHERE {condition}'
+
+    if not _WHERE_PREFIX.match(where_clause_suffix):
+        raise ValueError(f'Where clause suffix should start with WHERE to add a condition: {where_clause_suffix}')
+
+    return f'WHERE ({_WHERE_PREFIX.sub("", where_clause_suffix)}) AND {condition}'
@@ -2,6 +2,7 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 from pyhocon import ConfigTree
 from statsd import StatsClient
@@ -62,14 +63,17 @@ class DefaultJob(Job):
         try:
             is_success = True
             self._init()
-            try:
-                self.task.run()
-            finally:
-                self.task.close()
-
-            self.publisher.init(Scoped.get_scoped_conf(self.conf, self.publisher.get_scope()))
-            Job.closer.register(self.publisher.close)
-            self.publisher.publish()
+            if self.publisher.is_streaming():
+                self._run_task_and_publish()
+            else:
+                try:
+                    self.task.run()
+                finally:
+                    self.task.close()
+
+                self.publisher.init(Scoped.get_scoped_conf(self.conf, self.publisher.get_scope()))
+                Job.closer.register(self.publisher.close)
+                self.publisher.publish()
 
         except Exception as e:
             is_success = False
@@ -87,3 +91,19 @@ class DefaultJob(Job):
             Job.closer.close()
 
         logging.info('Job completed')
+
+    def _run_task_and_publish(self) -> None:
+        """
+        Runs the task while a streaming publisher publishes, on another thread, what the loader of the task hands to
+        it. Closing the task closes the loader, which tells the publisher that there is nothing left to publish.
+        :return:
+        """
+        self.publisher.init(Scoped.get_scoped_conf(self.conf, self.publisher.get_scope()))
+        Job.closer.register(self.publisher.close)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            publish_future = executor.submit(self.publisher.publish)
+            try:
+                self.task.run()
+            finally:
+                self.task.close()
+            publish_future.result()
@@ -21,5 +21,12 @@ class Loader(Scoped):
     def load(self, record: Any) -> None:
         pass
 
+    def fail(self) -> None:
+        """
+        Called by the task when it fails, before the loader is closed, e.g. to discard what was loaded so far.
+        :return: None
+        """
+        pass
+
     def get_scope(self) -> str:
         return 'loader'
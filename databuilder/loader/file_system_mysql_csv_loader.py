@@ -1,13 +1,12 @@
 # Copyright Contributors to the Amundsen project.
 # SPDX-License-Identifier: Apache-2.0
 
-import csv
 import logging
 import os
 import shutil
 from csv import DictWriter
 from typing import (
-    Any, Dict, FrozenSet,
+    Any, Dict, FrozenSet, Union,
 )
 
 from pyhocon import ConfigFactory, ConfigTree
@@ -16,7 +15,10 @@ from databuilder.job.base_job import Job
 from databuilder.loader.base_loader import Loader
 from databuilder.models.table_serializable import TableSerializable
 from databuilder.serializers import mysql_serializer
+from databuilder.utils import parquet
 from databuilder.utils.closer import Closer
+from databuilder.utils.csv_writer_pool import CsvWriterPool
+from databuilder.utils.parquet import ParquetRecordWriter, ParquetWriterPool
 
 LOGGER = logging.getLogger(__name__)
 
@@ -25,19 +27,33 @@ class FSMySQLCSVLoader(Loader):
     """
     Write table record CSV file(s) that can be consumed by MySQLCsvPublisher.
     It assumes that the record it consumes is instance of TableSerializable.
+
+    At most MAX_OPEN_FILES files are kept open at once. When more files are written to, the least recently written
+    ones are closed and reopened in append mode when written to again.
+
+    With FILE_FORMAT parquet, files are written as Parquet files (.parquet) with typed columns instead, which
+    MySQLCSVPublisher reads as well. They stay open until the loader is closed. Parquet requires pyarrow.
     """
     # Config keys
     RECORD_DIR_PATH = 'record_dir_path'
     FORCE_CREATE_DIR = 'force_create_directory'
     SHOULD_DELETE_CREATED_DIR = 'delete_created_directories'
+    # Maximum number of files open at once. No limit if 0
+    MAX_OPEN_FILES = 'max_open_files'
+    # Format of the files, either csv or parquet
+    FILE_FORMAT = 'file_format'
+    # Number of records of a row group of a Parquet file, buffered in memory for each file
+    PARQUET_ROW_GROUP_SIZE = 'parquet_row_group_size'
 
     _DEFAULT_CONFIG = ConfigFactory.from_dict({
         SHOULD_DELETE_CREATED_DIR: True,
-        FORCE_CREATE_DIR: False
+        FORCE_CREATE_DIR: False,
+        MAX_OPEN_FILES: 500,
+        FILE_FORMAT: parquet.CSV,
+        PARQUET_ROW_GROUP_SIZE: 10000,
     })
 
     def __init__(self) -> None:
-        self._record_file_mapping: Dict[Any, DictWriter] = {}
         self._keys: Dict[FrozenSet[str], int] = {}
         self._closer = Closer()
 
@@ -53,6 +69,14 @@ class FSMySQLCSVLoader(Loader):
         self._record_dir = conf.get_string(FSMySQLCSVLoader.RECORD_DIR_PATH)
         self._delete_created_dir = conf.get_bool(FSMySQLCSVLoader.SHOULD_DELETE_CREATED_DIR)
         self._force_create_dir = conf.get_bool(FSMySQLCSVLoader.FORCE_CREATE_DIR)
+        self._file_format = conf.get_string(FSMySQLCSVLoader.FILE_FORMAT)
+        self._file_extension = parquet.get_extension(self._file_format)
+        self._writer_pool: Union[CsvWriterPool, ParquetWriterPool]
+        if self._file_format == parquet.PARQUET:
+            self._writer_pool = ParquetWriterPool(row_group_size=conf.get_int(FSMySQLCSVLoader.PARQUET_ROW_GROUP_SIZE))
+        else:
+            self._writer_pool = CsvWriterPool(max_open_files=conf.get_int(FSMySQLCSVLoader.MAX_OPEN_FILES))
+        self._closer.register(self._writer_pool.close)
         self._create_directory(self._record_dir)
 
     def _create_directory(self, path: str) -> None:
@@ -103,7 +127,6 @@ class FSMySQLCSVLoader(Loader):
             key = (table_name, self._make_key(record_dict))
             file_suffix = '{}_{}'.format(*key)
             record_writer = self._get_writer(record_dict,
-                                             self._record_file_mapping,
                                              key,
                                              self._record_dir,
                                              file_suffix)
@@ -112,41 +135,22 @@ class FSMySQLCSVLoader(Loader):
 
     def _get_writer(self,
                     csv_record_dict: Dict[str, Any],
-                    file_mapping: Dict[Any, DictWriter],
                     key: Any,
                     dir_path: str,
                     file_suffix: str
-                    ) -> DictWriter:
+                    ) -> Union[DictWriter, ParquetRecordWriter]:
         """
         Finds a writer based on csv record, key.
-        If writer does not exist, it's creates a csv writer and update the mapping.
+        If the file of the key does not exist, it creates it, with the keys of the csv record as header.
 
         :param csv_record_dict:
-        :param file_mapping:
         :param key:
         :param dir_path:
         :param file_suffix:
         :return:
         """
-        writer = file_mapping.get(key)
-        if writer:
-            return writer
-
-        LOGGER.info(f'Creating file for {key}')
-
-        file_out = open(f'{dir_path}/{file_suffix}.csv', 'w', encoding='utf8')
-        writer = csv.DictWriter(file_out, fieldnames=csv_record_dict.keys(),
-                                quoting=csv.QUOTE_NONNUMERIC)
-
-        def file_out_close() -> None:
-            LOGGER.info(f'Closing file IO {file_out}')
-            file_out.close()
-        self._closer.register(file_out_close)
-
-        writer.writeheader()
-        file_mapping[key] = writer
-
-        return writer
+        return self._writer_pool.get_writer(key, f'{dir_path}/{file_suffix}{self._file_extension}',
+                                            csv_record_dict.keys())
 
     def close(self) -> None:
         """
@@ -0,0 +1,181 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+import time
+from typing import (
+    Any, Dict, Iterator, Optional, Set, Tuple,
+)
+
+from pyhocon import ConfigTree
+
+from databuilder.loader.file_system_neo4j_csv_loader import FsNeo4jCSVLoader
+from databuilder.models.graph_serializable import (
+    NODE_KEY, NODE_LABEL, RELATION_END_KEY, RELATION_END_LABEL, RELATION_REVERSE_TYPE, RELATION_START_KEY,
+    RELATION_START_LABEL, RELATION_TYPE, GraphSerializable,
+)
+from databuilder.publisher.neo4j_csv_publisher import (
+    LAST_UPDATED_EPOCH_MS, PUBLISHED_TAG_PROPERTY_NAME, UNQUOTED_SUFFIX,
+)
+from databuilder.serializers import neo4_serializer
+from databuilder.utils import compression, parquet
+from databuilder.utils.record_deduplicator import RecordDeduplicator
+
+LOGGER = logging.getLogger(__name__)
+
+# Headers of the neo4j-admin import CSV format, where the ID space of a node is its label
+# https://neo4j.com/docs/operations-manual/4.4/tools/neo4j-admin/neo4j-admin-import/#import-tool-header-format
+ID_HEADER = 'key:ID({label})'
+LABEL_HEADER = ':LABEL'
+START_ID_HEADER = ':START_ID({label})'
+END_ID_HEADER = ':END_ID({label})'
+TYPE_HEADER = ':TYPE'
+
+NODE_REQUIRED_KEYS = {NODE_LABEL, NODE_KEY}
+RELATION_REQUIRED_KEYS = {RELATION_START_LABEL, RELATION_START_KEY, RELATION_END_LABEL, RELATION_END_KEY,
+                          RELATION_TYPE, RELATION_REVERSE_TYPE}
+
+
+def _get_typed_header(name: str, value: Any) -> str:
+    """
+    :param name: Name of a property, as serialized by neo4_serializer
+    :param value:
+    :return: Header of the property column, typed after the value
+    """
+    if name.endswith(UNQUOTED_SUFFIX):
+        name = name[:-len(UNQUOTED_SUFFIX)]
+
+    # bool first, as it is a subclass of int
+    if isinstance(value, bool):
+        return f'{name}:boolean'
+    if isinstance(value, int):
+        return f'{name}:long'
+    if isinstance(value, float):
+        return f'{name}:double'
+    return name
+
+
+def _get_import_value(value: Any) -> Any:
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if value is None:
+        return ''
+    return value
+
+
+class FsNeo4jAdminImportCSVLoader(FsNeo4jCSVLoader):
+    """
+    Write node and relationship CSV file(s) in the format of neo4j-admin import, that can be consumed by
+    Neo4jAdminImportPublisher to build a new database offline, instead of merging records one by one.
+
+    Compared to FsNeo4jCSVLoader files:
+     - The key of a node is its :ID, in the ID space of its label, and is stored as its key property.
+     - A relationship is written as two relationships of TYPE and REVERSE_TYPE, between :START_ID and :END_ID.
+     - Property columns are typed (:long, :double or :boolean) after their values, so files are split by types too.
+     - Nodes and relationships get the published tag and last updated timestamp that Neo4jCsvPublisher would set.
+
+    As neo4j-admin import creates a relationship for every row, a relationship is only written once: a 64 bits digest
+    of every relationship written, about 100 bytes, is kept in memory regardless of DEDUPLICATION_MAX_RECORDS, as a
+    relationship forgotten would be imported twice. Duplicate nodes are skipped by the import itself, keeping the
+    first one, or by the loader with DEDUPLICATE_RECORDS.
+    """
+    # Config keys
+    # Published tag of the nodes and relationships, that Neo4jStalenessRemovalTask relies on
+    JOB_PUBLISH_TAG = 'job_publish_tag'
+
+    def __init__(self) -> None:
+        super(FsNeo4jAdminImportCSVLoader, self).__init__()
+        # Relationships written so far
+        self._relation_deduplicator = RecordDeduplicator()
+
+    def init(self, conf: ConfigTree) -> None:
+        super(FsNeo4jAdminImportCSVLoader, self).init(conf)
+        if self._file_format != parquet.CSV:
+            raise ValueError(f'neo4j-admin import only supports {parquet.CSV} files, not {self._file_format}')
+        if self._compression not in (None, compression.GZIP):
+            raise ValueError(f'neo4j-admin import only supports files compressed with {compression.GZIP}, '
+                             f'not {self._compression}')
+        self._publish_tag: Optional[str] = conf.get_string(FsNeo4jAdminImportCSVLoader.JOB_PUBLISH_TAG, None)
+        self._last_updated_epoch_ms = int(time.time() * 1000)
+
+    def load(self, csv_serializable: GraphSerializable) -> None:
+        """
+        Writes nodes and relationships of the record into CSV files of the neo4j-admin import format.
+        :param csv_serializable:
+        :return:
+        """
+        node = csv_serializable.next_node()
+        while node:
+            serialized_node = neo4_serializer.serialize_node(node)
+            if self._is_duplicate(serialized_node):
+                node = csv_serializable.next_node()
+                continue
+            node_dict = self._to_import_node(serialized_node)
+            key = (node.label, self._make_key(node_dict))
+            node_writer = self._get_writer(node_dict,
+                                           key,
+                                           self._node_dir,
+                                           '{}_{}'.format(*key))
+            node_writer.writerow(node_dict)
+            node = csv_serializable.next_node()
+
+        relation = csv_serializable.next_relation()
+        while relation:
+            relation_dict = neo4_serializer.serialize_relationship(relation)
+            for (start_label, end_label, relation_type), import_dict in self._to_import_relations(relation_dict):
+                key2 = (start_label, end_label, relation_type, self._make_key(import_dict))
+                relation_writer = self._get_writer(import_dict,
+                                                   key2,
+                                                   self._relation_dir,
+                                                   '{}_{}_{}_{}'.format(*key2))
+                relation_writer.writerow(import_dict)
+            relation = csv_serializable.next_relation()
+
+    def _to_import_node(self, node_dict: Dict[str, Any]) -> Dict[str, Any]:
+        import_dict = {
+            ID_HEADER.format(label=node_dict[NODE_LABEL]): node_dict[NODE_KEY],
+            LABEL_HEADER: node_dict[NODE_LABEL],
+        }
+        import_dict.update(self._to_import_properties(node_dict, NODE_REQUIRED_KEYS))
+        return import_dict
+
+    def _to_import_relations(self,
+                             relation_dict: Dict[str, Any]
+                             ) -> Iterator[Tuple[Tuple[str, str, str], Dict[str, Any]]]:
+        """
+        :param relation_dict: Relation as serialized by neo4_serializer
+        :return: The relationship and its reverse, unless already written, along with their start label, end label
+        and type
+        """
+        properties = self._to_import_properties(relation_dict, RELATION_REQUIRED_KEYS)
+        for start, end, relation_type in [(RELATION_START_LABEL, RELATION_END_LABEL, RELATION_TYPE),
+                                          (RELATION_END_LABEL, RELATION_START_LABEL, RELATION_REVERSE_TYPE)]:
+            start_label, end_label = relation_dict[start], relation_dict[end]
+            start_key = relation_dict[RELATION_START_KEY if start == RELATION_START_LABEL else RELATION_END_KEY]
+            end_key = relation_dict[RELATION_END_KEY if end == RELATION_END_LABEL else RELATION_START_KEY]
+
+            if self._relation_deduplicator.is_duplicate({RELATION_TYPE: relation_dict[relation_type],
+                                                         RELATION_START_LABEL: start_label,
+                                                         RELATION_START_KEY: start_key,
+                                                         RELATION_END_LABEL: end_label,
+                                                         RELATION_END_KEY: end_key}):
+                continue
+
+            import_dict = {
+                START_ID_HEADER.format(label=start_label): start_key,
+                END_ID_HEADER.format(label=end_label): end_key,
+                TYPE_HEADER: relation_dict[relation_type],
+            }
+            import_dict.update(properties)
+            yield (start_label, end_label, relation_dict[relation_type]), import_dict
+
+    def _to_import_properties(self, record_dict: Dict[str, Any], excludes: Set[str]) -> Dict[str, Any]:
+        properties = {_get_typed_header(k, v): _get_import_value(v)
+                      for k, v in record_dict.items() if k not in excludes}
+        if self._publish_tag is not None:
+            properties[PUBLISHED_TAG_PROPERTY_NAME] = self._publish_tag
+        properties[f'{LAST_UPDATED_EPOCH_MS}:long'] = self._last_updated_epoch_ms
+        return properties
+
+    def get_scope(self) -> str:
+        return "loader.filesystem_csv_neo4j_admin_import"
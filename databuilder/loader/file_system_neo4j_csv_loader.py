@@ -1,13 +1,12 @@
 # Copyright Contributors to the Amundsen project.
 # SPDX-License-Identifier: Apache-2.0
 
-import csv
 import logging
 import os
 import shutil
 from csv import DictWriter
 from typing import (
-    Any, Dict, FrozenSet,
+    IO, Any, Dict, FrozenSet, Optional, Union,
 )
 
 from pyhocon import ConfigFactory, ConfigTree
@@ -16,7 +15,11 @@ from databuilder.job.base_job import Job
 from databuilder.loader.base_loader import Loader
 from databuilder.models.graph_serializable import GraphSerializable
 from databuilder.serializers import neo4_serializer
+from databuilder.utils import compression, parquet
 from databuilder.utils.closer import Closer
+from databuilder.utils.csv_writer_pool import CsvWriterPool
+from databuilder.utils.parquet import ParquetRecordWriter, ParquetWriterPool
+from databuilder.utils.record_deduplicator import RecordDeduplicator
 
 LOGGER = logging.getLogger(__name__)
 
@@ -26,22 +29,56 @@ class FsNeo4jCSVLoader(Loader):
     Write node and relationship CSV file(s) that can be consumed by
     Neo4jCsvPublisher.
     It assumes that the record it consumes is instance of Neo4jCsvSerializable
+
+    With COMPRESSION, files are compressed with gzip (.csv.gz) or zstd (.csv.zst), which Neo4jCsvPublisher reads
+    as is. zstd requires zstandard.
+
+    At most MAX_OPEN_FILES files are kept open at once. When more files are written to, the least recently written
+    ones are closed and reopened in append mode when written to again.
+
+    With DEDUPLICATE_RECORDS, a node or relation identical to one written before, such as the database, schema or
+    tag nodes emitted along with every table, is not written again.
+
+    With FILE_FORMAT parquet, files are written as Parquet files (.parquet) with typed columns instead, compressed with
+    COMPRESSION if set, which Neo4jCsvPublisher reads as well. They stay open until the loader is closed, regardless
+    of MAX_OPEN_FILES. Parquet requires pyarrow.
     """
     # Config keys
     NODE_DIR_PATH = 'node_dir_path'
     RELATION_DIR_PATH = 'relationship_dir_path'
     FORCE_CREATE_DIR = 'force_create_directory'
     SHOULD_DELETE_CREATED_DIR = 'delete_created_directories'
+    # Compression of the files, either gzip or zstd. Files are not compressed if not set
+    COMPRESSION = 'compression'
+    # Compression level. Defaults to 6 for gzip and 3 for zstd
+    COMPRESSION_LEVEL = 'compression_level'
+    # Size of the write buffer of each file, in bytes
+    WRITE_BUFFER_SIZE = 'write_buffer_size'
+    # Maximum number of files open at once. No limit if 0
+    MAX_OPEN_FILES = 'max_open_files'
+    # Skips nodes and relations identical to ones written before
+    DEDUPLICATE_RECORDS = 'deduplicate_records'
+    # Maximum number of records remembered for deduplication, about 100 bytes each. No limit if 0
+    DEDUPLICATION_MAX_RECORDS = 'deduplication_max_records'
+    # Format of the files, either csv or parquet
+    FILE_FORMAT = 'file_format'
+    # Number of records of a row group of a Parquet file, buffered in memory for each file
+    PARQUET_ROW_GROUP_SIZE = 'parquet_row_group_size'
 
     _DEFAULT_CONFIG = ConfigFactory.from_dict({
         SHOULD_DELETE_CREATED_DIR: True,
-        FORCE_CREATE_DIR: False
+        FORCE_CREATE_DIR: False,
+        WRITE_BUFFER_SIZE: 1024 * 1024,
+        MAX_OPEN_FILES: 500,
+        DEDUPLICATE_RECORDS: False,
+        DEDUPLICATION_MAX_RECORDS: 10000000,
+        FILE_FORMAT: parquet.CSV,
+        PARQUET_ROW_GROUP_SIZE: 10000,
     })
 
     def __init__(self) -> None:
-        self._node_file_mapping: Dict[Any, DictWriter] = {}
-        self._relation_file_mapping: Dict[Any, DictWriter] = {}
         self._keys: Dict[FrozenSet[str], int] = {}
+        self._deduplicator: Optional[RecordDeduplicator] = None
         self._closer = Closer()
 
     def init(self, conf: ConfigTree) -> None:
@@ -61,6 +98,24 @@ class FsNeo4jCSVLoader(Loader):
         self._delete_created_dir = \
             conf.get_bool(FsNeo4jCSVLoader.SHOULD_DELETE_CREATED_DIR)
         self._force_create_dir = conf.get_bool(FsNeo4jCSVLoader.FORCE_CREATE_DIR)
+        self._compression = conf.get_string(FsNeo4jCSVLoader.COMPRESSION, None)
+        # Fails early on an unsupported compression
+        compression.get_extension(self._compression)
+        self._compression_level = conf.get_int(FsNeo4jCSVLoader.COMPRESSION_LEVEL, None)
+        self._write_buffer_size = conf.get_int(FsNeo4jCSVLoader.WRITE_BUFFER_SIZE)
+        self._file_format = conf.get_string(FsNeo4jCSVLoader.FILE_FORMAT)
+        self._file_extension = parquet.get_extension(self._file_format)
+        self._writer_pool: Union[CsvWriterPool, ParquetWriterPool]
+        if self._file_format == parquet.PARQUET:
+            self._writer_pool = ParquetWriterPool(compression=self._compression,
+                                                  compression_level=self._compression_level,
+                                                  row_group_size=conf.get_int(FsNeo4jCSVLoader.PARQUET_ROW_GROUP_SIZE))
+        else:
+            self._writer_pool = CsvWriterPool(max_open_files=conf.get_int(FsNeo4jCSVLoader.MAX_OPEN_FILES),
+                                              open_file=self._open_file)
+        self._closer.register(self._writer_pool.close)
+        if conf.get_bool(FsNeo4jCSVLoader.DEDUPLICATE_RECORDS):
+            self._deduplicator = RecordDeduplicator(conf.get_int(FsNeo4jCSVLoader.DEDUPLICATION_MAX_RECORDS))
         self._create_directory(self._node_dir)
         self._create_directory(self._relation_dir)
 
@@ -111,10 +166,12 @@ class FsNeo4jCSVLoader(Loader):
         node = csv_serializable.next_node()
         while node:
             node_dict = neo4_serializer.serialize_node(node)
+            if self._is_duplicate(node_dict):
+                node = csv_serializable.next_node()
+                continue
             key = (node.label, self._make_key(node_dict))
             file_suffix = '{}_{}'.format(*key)
             node_writer = self._get_writer(node_dict,
-                                           self._node_file_mapping,
                                            key,
                                            self._node_dir,
                                            file_suffix)
@@ -124,6 +181,9 @@ class FsNeo4jCSVLoader(Loader):
         relation = csv_serializable.next_relation()
         while relation:
             relation_dict = neo4_serializer.serialize_relationship(relation)
+            if self._is_duplicate(relation_dict):
+                relation = csv_serializable.next_relation()
+                continue
             key2 = (relation.start_label,
                     relation.end_label,
                     relation.type,
@@ -131,7 +191,6 @@ class FsNeo4jCSVLoader(Loader):
 
             file_suffix = f'{key2[0]}_{key2[1]}_{key2[2]}'
             relation_writer = self._get_writer(relation_dict,
-                                               self._relation_file_mapping,
                                                key2,
                                                self._relation_dir,
                                                file_suffix)
@@ -140,47 +199,40 @@ class FsNeo4jCSVLoader(Loader):
 
     def _get_writer(self,
                     csv_record_dict: Dict[str, Any],
-                    file_mapping: Dict[Any, DictWriter],
                     key: Any,
                     dir_path: str,
                     file_suffix: str
-                    ) -> DictWriter:
+                    ) -> Union[DictWriter, ParquetRecordWriter]:
         """
         Finds a writer based on csv record, key.
-        If writer does not exist, it's creates a csv writer and update the
-        mapping.
+        If the file of the key does not exist, it creates it, with the keys of the csv record as header.
 
         :param csv_record_dict:
-        :param file_mapping:
         :param key:
+        :param dir_path:
         :param file_suffix:
         :return:
         """
-        writer = file_mapping.get(key)
-        if writer:
-            return writer
-
-        LOGGER.info('Creating file for %s', key)
-
-        file_out = open(f'{dir_path}/{file_suffix}.csv', 'w', encoding='utf8')
-        writer = csv.DictWriter(file_out, fieldnames=csv_record_dict.keys(),
-                                quoting=csv.QUOTE_NONNUMERIC)
-
-        def file_out_close() -> None:
-            LOGGER.info('Closing file IO %s', file_out)
-            file_out.close()
-        self._closer.register(file_out_close)
+        return self._writer_pool.get_writer(key, f'{dir_path}/{file_suffix}{self._file_extension}',
+                                            csv_record_dict.keys())
 
-        writer.writeheader()
-        file_mapping[key] = writer
+    def _is_duplicate(self, record_dict: Dict[str, Any]) -> bool:
+        return self._deduplicator is not None and self._deduplicator.is_duplicate(record_dict)
 
-        return writer
+    def _open_file(self, path: str, mode: str) -> IO[str]:
+        return compression.open_for_write(path,
+                                          compression=self._compression,
+                                          level=self._compression_level,
+                                          buffer_size=self._write_buffer_size,
+                                          mode=mode)
 
     def close(self) -> None:
         """
         Any closeable callable registered in _closer, it will close.
         :return:
         """
+        if self._deduplicator is not None:
+            LOGGER.info('Skipped %i duplicate nodes and relations', self._deduplicator.duplicate_count)
         self._closer.close()
 
     def get_scope(self) -> str:
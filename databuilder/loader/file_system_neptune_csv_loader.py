@@ -1,7 +1,6 @@
 # Copyright Contributors to the Amundsen project.
 # SPDX-License-Identifier: Apache-2.0
 
-import csv
 import logging
 import os
 import shutil
@@ -15,6 +14,7 @@ from databuilder.loader.base_loader import Loader
 from databuilder.models.graph_serializable import GraphSerializable
 from databuilder.serializers import neptune_serializer
 from databuilder.utils.closer import Closer
+from databuilder.utils.csv_writer_pool import CsvWriterPool
 
 LOGGER = logging.getLogger(__name__)
 
@@ -26,6 +26,9 @@ class FSNeptuneCSVLoader(Loader):
     Write node and relationship CSV file(s) that can be consumed by
     NeptuneCsvPublisher.
     It assumes that the record it consumes is instance of GraphSerializable
+
+    At most MAX_OPEN_FILES files are kept open at once. When more files are written to, the least recently written
+    ones are closed and reopened in append mode when written to again.
     """
     # Config keys
     NODE_DIR_PATH = 'node_dir_path'
@@ -33,15 +36,16 @@ class FSNeptuneCSVLoader(Loader):
     FORCE_CREATE_DIR = 'force_create_directory'
     SHOULD_DELETE_CREATED_DIR = 'delete_created_directories'
     JOB_PUBLISHER_TAG = 'job_publisher_tag'
+    # Maximum number of files open at once. No limit if 0
+    MAX_OPEN_FILES = 'max_open_files'
 
     _DEFAULT_CONFIG = ConfigFactory.from_dict({
         SHOULD_DELETE_CREATED_DIR: True,
-        FORCE_CREATE_DIR: False
+        FORCE_CREATE_DIR: False,
+        MAX_OPEN_FILES: 500,
     })
 
     def __init__(self) -> None:
-        self._node_file_mapping: Dict[Any, DictWriter] = {}
-        self._relation_file_mapping: Dict[Any, DictWriter] = {}
         self._closer = Closer()
 
     def init(self, conf: ConfigTree) -> None:
@@ -57,6 +61,8 @@ class FSNeptuneCSVLoader(Loader):
 
         self._delete_created_dir = conf.get_bool(FSNeptuneCSVLoader.SHOULD_DELETE_CREATED_DIR)
         self._force_create_dir = conf.get_bool(FSNeptuneCSVLoader.FORCE_CREATE_DIR)
+        self._writer_pool = CsvWriterPool(max_open_files=conf.get_int(FSNeptuneCSVLoader.MAX_OPEN_FILES))
+        self._closer.register(self._writer_pool.close)
         self._create_directory(self._node_dir)
         self._create_directory(self._relation_dir)
         self.job_publisher_tag = conf.get_string(FSNeptuneCSVLoader.JOB_PUBLISHER_TAG)
@@ -111,7 +117,6 @@ class FSNeptuneCSVLoader(Loader):
                 file_suffix = '{}_{}'.format(*key)
                 node_writer = self._get_writer(
                     node_dict,
-                    self._node_file_mapping,
                     key,
                     self._node_dir,
                     file_suffix
@@ -131,7 +136,6 @@ class FSNeptuneCSVLoader(Loader):
 
                 file_suffix = '{}_{}_{}'.format(key2[0], key2[1], key2[2])
                 relation_writer = self._get_writer(relation_dicts[0],
-                                                   self._relation_file_mapping,
                                                    key2,
                                                    self._relation_dir,
                                                    file_suffix)
@@ -140,34 +144,16 @@ class FSNeptuneCSVLoader(Loader):
 
     def _get_writer(self,
                     csv_record_dict: Dict[str, Any],
-                    file_mapping: Dict[Any, DictWriter],
                     key: Any,
                     dir_path: str,
                     file_suffix: str
                     ) -> DictWriter:
         """
         Finds a writer based on csv record, key.
-        If writer does not exist, it's creates a csv writer and update the
-        mapping.
+        If the file of the key does not exist, it creates it, with the keys of
+        the csv record as header.
         """
-        writer = file_mapping.get(key)
-        if writer:
-            return writer
-
-        LOGGER.info('Creating file for {}'.format(key))
-
-        file_out = open('{}/{}.csv'.format(dir_path, file_suffix), 'w', encoding='utf8')
-        writer = csv.DictWriter(file_out, fieldnames=csv_record_dict.keys(), quoting=csv.QUOTE_NONNUMERIC)
-
-        def file_out_close() -> None:
-            LOGGER.info('Closing file IO {}'.format(file_out))
-            file_out.close()
-        self._closer.register(file_out_close)
-
-        writer.writeheader()
-        file_mapping[key] = writer
-
-        return writer
+        return self._writer_pool.get_writer(key, '{}/{}.csv'.format(dir_path, file_suffix), csv_record_dict.keys())
 
     def close(self) -> None:
         """
@@ -0,0 +1,175 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+import queue
+import threading
+from typing import (
+    Iterator, List, Optional, Tuple, Union,
+)
+
+from pyhocon import ConfigFactory, ConfigTree
+
+from databuilder.loader.base_loader import Loader
+from databuilder.loader.file_system_neo4j_csv_loader import FsNeo4jCSVLoader
+from databuilder.models.graph_node import GraphNode
+from databuilder.models.graph_relationship import GraphRelationship
+from databuilder.models.graph_serializable import GraphSerializable
+
+LOGGER = logging.getLogger(__name__)
+
+# Nodes and relations of one or more records
+GraphBatch = Tuple[List[GraphNode], List[GraphRelationship]]
+
+
+class _GraphBatchSerializable(GraphSerializable):
+    """
+    Nodes and relations of a batch, as a GraphSerializable that can be written by FsNeo4jCSVLoader.
+    """
+
+    def __init__(self, nodes: List[GraphNode], relations: List[GraphRelationship]) -> None:
+        self._node_iter = iter(nodes)
+        self._relation_iter = iter(relations)
+
+    def create_next_node(self) -> Union[GraphNode, None]:
+        return next(self._node_iter, None)
+
+    def create_next_relation(self) -> Union[GraphRelationship, None]:
+        return next(self._relation_iter, None)
+
+
+class GraphStreamingLoader(Loader):
+    """
+    Hands the nodes and relations of the records it loads, in batches, to a publisher that publishes them while the
+    task runs, such as Neo4jStreamingPublisher, instead of writing them to CSV files that the publisher reads and
+    parses once the task is done.
+
+    Batches go through a queue of at most QUEUE_SIZE batches, so loading blocks while the publisher is behind. If the
+    publisher fails, loading fails as well. If the task fails, the publisher fails as well, and rolls back its
+    transaction.
+
+    When NODE_DIR_PATH and RELATION_DIR_PATH of FsNeo4jCSVLoader are set, nodes and relations are also written to CSV
+    files there, e.g. to audit what was published, with any other configuration of FsNeo4jCSVLoader.
+    """
+    # Config keys
+    # Number of nodes and relations of a batch. A record is never split across batches
+    BATCH_SIZE = 'batch_size'
+    # Maximum number of batches waiting for the publisher
+    QUEUE_SIZE = 'queue_size'
+
+    _DEFAULT_CONFIG = ConfigFactory.from_dict({
+        BATCH_SIZE: 1000,
+        QUEUE_SIZE: 10,
+    })
+
+    # Seconds between checks of whether the publisher failed, while waiting on the queue
+    _POLL_INTERVAL_SEC = 1.0
+
+    def __init__(self) -> None:
+        self._nodes: List[GraphNode] = []
+        self._relations: List[GraphRelationship] = []
+        self._csv_loader: Optional[FsNeo4jCSVLoader] = None
+        self._closed = False
+        self._aborted = threading.Event()
+        self._failed = threading.Event()
+
+    def init(self, conf: ConfigTree) -> None:
+        conf = conf.with_fallback(GraphStreamingLoader._DEFAULT_CONFIG)
+
+        self._batch_size = conf.get_int(GraphStreamingLoader.BATCH_SIZE)
+        self._queue: 'queue.Queue[Optional[GraphBatch]]' = \
+            queue.Queue(maxsize=conf.get_int(GraphStreamingLoader.QUEUE_SIZE))
+
+        if FsNeo4jCSVLoader.NODE_DIR_PATH in conf:
+            self._csv_loader = FsNeo4jCSVLoader()
+            self._csv_loader.init(conf)
+
+    def load(self, csv_serializable: GraphSerializable) -> None:
+        """
+        Adds the nodes and relations of the record to the current batch, and hands the batch to the publisher once
+        it has BATCH_SIZE nodes and relations.
+        :param csv_serializable:
+        :return:
+        """
+        node = csv_serializable.next_node()
+        while node:
+            self._nodes.append(node)
+            node = csv_serializable.next_node()
+
+        relation = csv_serializable.next_relation()
+        while relation:
+            self._relations.append(relation)
+            relation = csv_serializable.next_relation()
+
+        if len(self._nodes) + len(self._relations) >= self._batch_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._nodes and not self._relations:
+            return
+
+        if self._csv_loader:
+            self._csv_loader.load(_GraphBatchSerializable(self._nodes, self._relations))
+        self._put((self._nodes, self._relations))
+        self._nodes = []
+        self._relations = []
+
+    def _put(self, batch: Optional[GraphBatch]) -> None:
+        while True:
+            if self._aborted.is_set():
+                raise RuntimeError('Publisher failed, no more records can be loaded')
+            try:
+                self._queue.put(batch, timeout=GraphStreamingLoader._POLL_INTERVAL_SEC)
+                return
+            except queue.Full:
+                continue
+
+    def iter_batches(self) -> Iterator[GraphBatch]:
+        """
+        Yields the batches handed to the publisher, until the loader is closed. Meant to be called by the publisher,
+        on another thread than the task.
+        :return:
+        """
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                if self._failed.is_set():
+                    raise RuntimeError('Task failed, the loaded records must not be published')
+                return
+            yield batch
+
+    def abort(self) -> None:
+        """
+        Called by the publisher when it fails, to make loading fail instead of waiting for it.
+        :return:
+        """
+        self._aborted.set()
+
+    def fail(self) -> None:
+        """
+        Called by the task when it fails, before the loader is closed, to make the publisher fail instead of
+        committing.
+        :return:
+        """
+        self._failed.set()
+
+    def close(self) -> None:
+        """
+        Hands the last batch to the publisher and tells it that there are no more batches, or that the task failed.
+        :return:
+        """
+        if self._closed:
+            return
+        self._closed = True
+
+        try:
+            if not self._aborted.is_set():
+                if not self._failed.is_set():
+                    self._flush()
+                self._put(None)
+        finally:
+            if self._csv_loader:
+                self._csv_loader.close()
+
+    def get_scope(self) -> str:
+        return 'loader.graph_streaming'
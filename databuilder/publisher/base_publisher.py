@@ -49,6 +49,14 @@ class Publisher(Scoped):
         """
         pass
 
+    def is_streaming(self) -> bool:
+        """
+        A streaming publisher publishes what the loader hands to it while the task runs, instead of what the loader
+        wrote once the task is done. The job then initializes it before running the task, and publishes concurrently.
+        :return: True if the publisher is a streaming one
+        """
+        return False
+
     def register_call_back(self, callback: Callback) -> None:
         """
         Register any callback method that needs to be notified when publisher is either able to successfully publish
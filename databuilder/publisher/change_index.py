@@ -0,0 +1,124 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import (
+    Any, Dict, List, Optional,
+)
+
+from databuilder.callback.call_back import Callback
+
+LOGGER = logging.getLogger(__name__)
+
+
+class ChangeIndex(Callback):
+    """
+    An index of the content hash of every published record, kept in a SQLite file on local disk, to tell which records
+    have changed since the previous publish.
+    New hashes are staged while publishing and only committed once the publish succeeds, so that records of a failed
+    publish are published again in the next run. It is thread safe.
+
+    Callers that retry part of a publish can keep the new hashes of an attempt aside, by passing pending to
+    is_changed, and only stage them with stage once the attempt is committed.
+
+    With track_unseen, it also keeps track of the keys checked since it was opened, so that the records which were
+    published last time but not this time can be told by remove_unseen.
+    """
+
+    def __init__(self, path: str, track_unseen: bool = False) -> None:
+        """
+        :param path: Path of the SQLite file. It's created if it does not exist.
+        :param track_unseen: Whether to keep track of the keys checked, for remove_unseen
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS record_hash (key TEXT PRIMARY KEY, hash TEXT NOT NULL)')
+        self._connection.commit()
+        self._track_unseen = track_unseen
+        if track_unseen:
+            self._connection.execute('CREATE TEMP TABLE seen_key (key TEXT PRIMARY KEY)')
+        self._changed_count = 0
+        self._unchanged_count = 0
+        self._removed_count = 0
+
+    def is_changed(self, key: str, record: Dict[str, Any], pending: Optional[Dict[str, str]] = None) -> bool:
+        """
+        Compares the hash of the record with the one published last time, and stages the new hash if it differs.
+        :param key: Identifies the record, e.g. label and key of a node
+        :param record:
+        :param pending: If given, the new hash is added to it instead of being staged, to be staged with stage
+        :return: True if the record is new or has changed
+        """
+        record_hash = ChangeIndex.hash_record(record)
+        with self._lock:
+            if self._track_unseen:
+                self._connection.execute('INSERT OR IGNORE INTO seen_key (key) VALUES (?)', (key,))
+            row = self._connection.execute('SELECT hash FROM record_hash WHERE key = ?', (key,)).fetchone()
+            if row and row[0] == record_hash:
+                self._unchanged_count += 1
+                return False
+
+            if pending is not None:
+                pending[key] = record_hash
+                return True
+
+            self._connection.execute('INSERT OR REPLACE INTO record_hash (key, hash) VALUES (?, ?)',
+                                     (key, record_hash))
+            self._changed_count += 1
+            return True
+
+    def stage(self, pending: Dict[str, str]) -> None:
+        """
+        Stages the hashes kept aside by is_changed, once their records are published.
+        :param pending: Hashes by key
+        :return:
+        """
+        with self._lock:
+            self._connection.executemany('INSERT OR REPLACE INTO record_hash (key, hash) VALUES (?, ?)',
+                                         pending.items())
+            self._changed_count += len(pending)
+
+    def remove_unseen(self) -> List[str]:
+        """
+        Stages the removal of the records that were not checked with is_changed since the index was opened.
+        Only available with track_unseen.
+        :return: Keys of the removed records
+        """
+        if not self._track_unseen:
+            raise ValueError('Change index should be opened with track_unseen to remove unseen records')
+
+        with self._lock:
+            keys = [row[0] for row in self._connection.execute(
+                'SELECT key FROM record_hash WHERE key NOT IN (SELECT key FROM seen_key)')]
+            self._connection.executemany('DELETE FROM record_hash WHERE key = ?', [(key,) for key in keys])
+            self._removed_count += len(keys)
+        return keys
+
+    @staticmethod
+    def hash_record(record: Dict[str, Any]) -> str:
+        """
+        :param record:
+        :return: Hash of the record that does not depend on the order of its fields
+        """
+        return hashlib.sha1(json.dumps(record, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def on_success(self) -> None:
+        with self._lock:
+            self._connection.commit()
+        LOGGER.info('Committed change index: %i changed records, %i unchanged records, %i removed records',
+                    self._changed_count, self._unchanged_count, self._removed_count)
+
+    def on_failure(self) -> None:
+        with self._lock:
+            self._connection.rollback()
+        LOGGER.info('Discarded %i changed records from change index', self._changed_count)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
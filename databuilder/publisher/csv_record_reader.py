@@ -0,0 +1,153 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+import csv
+import ctypes
+import logging
+import re
+from itertools import chain, islice
+from typing import (
+    Any, Callable, Dict, Iterator, List, Optional,
+)
+
+from databuilder.utils import compression
+
+# Setting field_size_limit to solve the error below
+# _csv.Error: field larger than field limit (131072)
+# https://stackoverflow.com/a/54517228/5972935
+csv.field_size_limit(int(ctypes.c_ulong(-1).value // 2))
+
+LOGGER = logging.getLogger(__name__)
+
+# Kinds of column, in the order they widen to when a column holds values of different kinds
+BOOL = 'bool'
+INT = 'int'
+FLOAT = 'float'
+STR = 'str'
+
+_INT_PATTERN = re.compile(r'^[+-]?\d+$')
+_FLOAT_PATTERN = re.compile(r'^[+-]?(\d+\.\d*|\.\d+|\d+)([eE][+-]?\d+)?$')
+_TRUE_VALUES = frozenset(['True', 'TRUE', 'true'])
+_FALSE_VALUES = frozenset(['False', 'FALSE', 'false'])
+_INT64_MIN = -2 ** 63
+_INT64_MAX = 2 ** 63 - 1
+
+
+def _value_kind(value: str) -> str:
+    if _INT_PATTERN.match(value):
+        return INT if _INT64_MIN <= int(value) <= _INT64_MAX else STR
+    if _FLOAT_PATTERN.match(value):
+        return FLOAT
+    if value in _TRUE_VALUES or value in _FALSE_VALUES:
+        return BOOL
+    return STR
+
+
+def _widen(kind: Optional[str], value_kind: str) -> str:
+    if kind is None or kind == value_kind:
+        return value_kind
+    if {kind, value_kind} == {INT, FLOAT}:
+        return FLOAT
+    return STR
+
+
+def _to_bool(value: str) -> bool:
+    if value in _TRUE_VALUES:
+        return True
+    if value in _FALSE_VALUES:
+        return False
+    raise ValueError(f'Not a boolean value: {value}')
+
+
+_CONVERTERS: Dict[str, Callable[[str], Any]] = {
+    BOOL: _to_bool,
+    INT: int,
+    FLOAT: float,
+}
+
+
+class CsvRecordReader(object):
+    """
+    Reads the records of a CSV file as dicts, streaming the file so that memory stays bounded by the size of a record
+    rather than the size of the file.
+
+    Values are typed the way pandas.read_csv(na_filter=False) did for the publishers: a column whose values are all
+    integers, floats or booleans (True/False) is converted to int, float or bool, and anything else, including empty
+    values, is kept as a string. The kind of each column is inferred from all the records of the file, so that a
+    column has the same type in every record. As a file is not held in memory, a file of more than
+    type_inference_rows records is read twice: once to infer the kind of each column, and once to convert its records.
+    """
+
+    def __init__(self, type_inference_rows: int = 10000) -> None:
+        """
+        :param type_inference_rows: Number of records buffered, so that smaller files are only read once
+        """
+        if type_inference_rows < 1:
+            raise ValueError(f'type_inference_rows should be positive: {type_inference_rows}')
+        self._type_inference_rows = type_inference_rows
+
+    def read(self, path: str) -> Iterator[Dict[str, Any]]:
+        """
+        :param path: Path of a CSV file with a header, decompressed if gzip (.gz) or zstd (.zst)
+        :return: Iterator of records of the file
+        """
+        with compression.open_for_read(path) as csv_file:
+            reader = csv.DictReader(csv_file)
+            head = list(islice(reader, self._type_inference_rows))
+            column_kinds = self._infer_column_kinds(chain(head, reader))
+            if len(head) < self._type_inference_rows:
+                for row in head:
+                    yield self._convert(row, column_kinds)
+                return
+
+        with compression.open_for_read(path) as csv_file:
+            for row in csv.DictReader(csv_file):
+                yield self._convert(row, column_kinds)
+
+    def read_batches(self, path: str, batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+        """
+        :param path: Path of a CSV file with a header
+        :param batch_size: Maximum number of records of a batch
+        :return: Iterator of lists of records of the file
+        """
+        records = self.read(path)
+        batch = list(islice(records, batch_size))
+        while batch:
+            yield batch
+            batch = list(islice(records, batch_size))
+
+    @staticmethod
+    def _infer_column_kinds(rows: Iterator[Dict[str, str]]) -> Dict[str, str]:
+        """
+        :param rows: Rows of a file, read until every column is known to be a string column
+        :return: Kind of each column
+        """
+        column_kinds: Dict[str, Optional[str]] = {}
+        # Columns that may still be of another kind than STR
+        columns: List[str] = []
+        for row in rows:
+            if not column_kinds:
+                column_kinds = dict.fromkeys(row.keys())
+                columns = list(row.keys())
+            for column in columns:
+                value = row[column]
+                column_kinds[column] = _widen(column_kinds[column], _value_kind(value) if value is not None else STR)
+            columns = [column for column in columns if column_kinds[column] != STR]
+            if not columns:
+                break
+        return {column: kind or STR for column, kind in column_kinds.items()}
+
+    @staticmethod
+    def _convert(row: Dict[str, str], column_kinds: Dict[str, str]) -> Dict[str, Any]:
+        record: Dict[str, Any] = {}
+        for column, value in row.items():
+            converter = _CONVERTERS.get(column_kinds.get(column, STR))
+            if converter is None or value is None:
+                record[column] = value
+                continue
+            try:
+                record[column] = converter(value)
+            except ValueError:
+                LOGGER.debug('Keeping value %s of column %s as a string', value, column)
+                record[column] = value
+        return record
@@ -1,18 +1,29 @@
 # Copyright Contributors to the Amundsen project.
 # SPDX-License-Identifier: Apache-2.0
 
+import copy
+import itertools
 import json
 import logging
-from typing import List
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import (
+    Any, Deque, Dict, Iterator, List, Optional, Tuple,
+)
 
-from elasticsearch.exceptions import NotFoundError
+from elasticsearch.exceptions import NotFoundError, TransportError
 from pyhocon import ConfigTree
 
 from databuilder.publisher.base_publisher import Publisher
+from databuilder.publisher.change_index import ChangeIndex
 from databuilder.publisher.elasticsearch_constants import TABLE_ELASTICSEARCH_INDEX_MAPPING
 
 LOGGER = logging.getLogger(__name__)
 
+# Action of a bulk request, and the JSON document it indexes, if any
+BulkOperation = Tuple[Dict[str, Any], Optional[str]]
+
 
 class ElasticsearchPublisher(Publisher):
     """
@@ -22,6 +33,21 @@ class ElasticsearchPublisher(Publisher):
     and traffic is routed to new index.
 
     Old index is deleted after the alias swap is complete
+
+    Documents are streamed from the file. When ELASTICSEARCH_PUBLISHER_THREAD_COUNT is greater than 1, chunks of up to
+    batch_size documents and max_chunk_bytes bytes are sent with concurrent bulk requests, and documents rejected
+    with 429 (Too Many Requests) are sent again with exponential backoff.
+
+    When ELASTICSEARCH_PUBLISHER_INDEX_BUILD_TUNING is True, the new index is created with refresh disabled and no
+    replicas. Once loaded, its refresh interval is restored, it's force merged, its replicas are restored, and the
+    alias is only swapped once the index reaches ELASTICSEARCH_PUBLISHER_INDEX_BUILD_WAIT_FOR_STATUS.
+
+    When ELASTICSEARCH_PUBLISHER_CHANGE_INDEX_PATH is set, documents are indexed with the id taken from their
+    ELASTICSEARCH_DOCUMENT_ID_FIELD, and the hash of every document Elasticsearch indexed is kept in a local change
+    index, so that documents that failed to be indexed are sent again in the next run. As long as the
+    mapping stays the same, documents are then published incrementally to the index the alias points to: only new and
+    changed documents are indexed, and documents that are no longer in the file are deleted. A new index is built as
+    above on the first run, and whenever the mapping changes.
     """
     FILE_PATH_CONFIG_KEY = 'file_path'
     FILE_MODE_CONFIG_KEY = 'mode'
@@ -34,6 +60,38 @@ class ElasticsearchPublisher(Publisher):
 
     # config to control how many max documents to publish at a time
     ELASTICSEARCH_PUBLISHER_BATCH_SIZE = 'batch_size'
+    # Number of bulk requests in flight. With 1, bulk requests are sent one at a time.
+    ELASTICSEARCH_PUBLISHER_THREAD_COUNT = 'thread_count'
+    # Maximum size in bytes of the body of a bulk request, when sending them concurrently
+    ELASTICSEARCH_PUBLISHER_MAX_CHUNK_BYTES = 'max_chunk_bytes'
+    # Number of times documents rejected with 429 are sent again, when sending bulk requests concurrently
+    ELASTICSEARCH_PUBLISHER_MAX_RETRIES = 'max_retries'
+    # Seconds to wait before the first retry, doubled on every retry
+    ELASTICSEARCH_PUBLISHER_INITIAL_BACKOFF_SEC = 'initial_backoff_sec'
+    ELASTICSEARCH_PUBLISHER_MAX_BACKOFF_SEC = 'max_backoff_sec'
+    # If True, refresh and replicas of the new index are suspended while loading it
+    ELASTICSEARCH_PUBLISHER_INDEX_BUILD_TUNING = 'index_build_tuning'
+    # Number of segments per shard the new index is force merged to, with index build tuning
+    ELASTICSEARCH_PUBLISHER_FORCE_MERGE_MAX_NUM_SEGMENTS = 'force_merge_max_num_segments'
+    # Seconds to wait for the force merge, and then for the new index to reach the status below, with index build tuning
+    ELASTICSEARCH_PUBLISHER_INDEX_BUILD_TIMEOUT_SEC = 'index_build_timeout_sec'
+    # Health status the new index has to reach before the alias is swapped, with index build tuning. Defaults to
+    # yellow, as replicas can't be allocated on a single node cluster. Set to green to wait for the replicas as well.
+    ELASTICSEARCH_PUBLISHER_INDEX_BUILD_WAIT_FOR_STATUS = 'index_build_wait_for_status'
+
+    # Path of a SQLite file that keeps the hash of every document published, to publish incrementally
+    ELASTICSEARCH_PUBLISHER_CHANGE_INDEX_PATH = 'change_index_path'
+    # Field of the documents used as their id, when publishing incrementally, e.g. key for tables or email for users.
+    # Required with ELASTICSEARCH_PUBLISHER_CHANGE_INDEX_PATH
+    ELASTICSEARCH_DOCUMENT_ID_FIELD = 'document_id_field'
+
+    # Keys of the change index
+    _MAPPING_KEY = 'mapping'
+    _DOCUMENT_KEY_PREFIX = 'document:'
+
+    # Index settings suspended while loading the new index, with index build tuning
+    _REFRESH_INTERVAL = 'refresh_interval'
+    _NUMBER_OF_REPLICAS = 'number_of_replicas'
 
     DEFAULT_ELASTICSEARCH_INDEX_MAPPING = TABLE_ELASTICSEARCH_INDEX_MAPPING
 
@@ -55,8 +113,44 @@ class ElasticsearchPublisher(Publisher):
                                                    ElasticsearchPublisher.DEFAULT_ELASTICSEARCH_INDEX_MAPPING)
         self.elasticsearch_batch_size = self.conf.get(ElasticsearchPublisher.ELASTICSEARCH_PUBLISHER_BATCH_SIZE,
                                                       10000)
+        self.elasticsearch_thread_count = self.conf.get_int(ElasticsearchPublisher.ELASTICSEARCH_PUBLISHER_THREAD_COUNT,
+                                                            1)
+        self.elasticsearch_max_chunk_bytes = self.conf.get_int(
+            ElasticsearchPublisher.ELASTICSEARCH_PUBLISHER_MAX_CHUNK_BYTES, 10 * 1024 * 1024)
+        self.elasticsearch_max_retries = self.conf.get_int(ElasticsearchPublisher.ELASTICSEARCH_PUBLISHER_MAX_RETRIES,
+                                                           5)
+        self.elasticsearch_initial_backoff_sec = self.conf.get_float(
+            ElasticsearchPublisher.ELASTICSEARCH_PUBLISHER_INITIAL_BACKOFF_SEC, 2.0)
+        self.elasticsearch_max_backoff_sec = self.conf.get_float(
+            ElasticsearchPublisher.ELASTICSEARCH_PUBLISHER_MAX_BACKOFF_SEC, 60.0)
+        self.index_build_tuning = self.conf.get_bool(ElasticsearchPublisher.ELASTICSEARCH_PUBLISHER_INDEX_BUILD_TUNING,
+                                                     False)
+        self.force_merge_max_num_segments = self.conf.get_int(
+            ElasticsearchPublisher.ELASTICSEARCH_PUBLISHER_FORCE_MERGE_MAX_NUM_SEGMENTS, 1)
+        self.index_build_timeout_sec = self.conf.get_int(
+            ElasticsearchPublisher.ELASTICSEARCH_PUBLISHER_INDEX_BUILD_TIMEOUT_SEC, 1800)
+        self.index_build_wait_for_status = self.conf.get_string(
+            ElasticsearchPublisher.ELASTICSEARCH_PUBLISHER_INDEX_BUILD_WAIT_FOR_STATUS, 'yellow')
+        self.document_id_field = self.conf.get_string(ElasticsearchPublisher.ELASTICSEARCH_DOCUMENT_ID_FIELD, None)
+        self._change_index: Optional[ChangeIndex] = None
+        # New hashes of the documents sent, staged in the change index once Elasticsearch has indexed them
+        self._pending_hashes: Dict[str, str] = {}
+        if ElasticsearchPublisher.ELASTICSEARCH_PUBLISHER_CHANGE_INDEX_PATH in self.conf:
+            if not self.document_id_field:
+                raise ValueError(f'{ElasticsearchPublisher.ELASTICSEARCH_DOCUMENT_ID_FIELD} is required to publish '
+                                 f'incrementally, e.g. key for tables or email for users')
+            self._change_index = ChangeIndex(
+                self.conf.get_string(ElasticsearchPublisher.ELASTICSEARCH_PUBLISHER_CHANGE_INDEX_PATH),
+                track_unseen=True)
+            # New hashes are only kept if the publish succeeds
+            self.register_call_back(self._change_index)
         self.file_handler = open(self.file_path, self.file_mode)
 
+    def close(self) -> None:
+        change_index = getattr(self, '_change_index', None)
+        if change_index is not None:
+            change_index.close()
+
     def _fetch_old_index(self) -> List[str]:
         """
         Retrieve all indices that currently have {elasticsearch_alias} alias
@@ -77,35 +171,34 @@ class ElasticsearchPublisher(Publisher):
         After upload, swap alias from {old_index} to {new_index} in a atomic operation
         to route traffic to {new_index}
         """
-        actions = [json.loads(l) for l in self.file_handler.readlines()]
+        lines = self._iter_lines()
+        first_line = next(lines, None)
         # ensure new data exists
-        if not actions:
+        if first_line is None:
             LOGGER.warning("received no data to upload to Elasticsearch!")
             return
+        lines = itertools.chain([first_line], lines)
 
-        # Convert object to json for elasticsearch bulk upload
-        # Bulk load JSON format is defined here:
-        # https://www.elastic.co/guide/en/elasticsearch/reference/6.2/docs-bulk.html
-        bulk_actions = []
-        cnt = 0
+        if self._change_index is not None:
+            live_index = self._get_live_index(self._change_index)
+            if live_index is not None:
+                self._publish_incrementally(lines, live_index)
+                return
 
         # create new index with mapping
-        self.elasticsearch_client.indices.create(index=self.elasticsearch_new_index, body=self.elasticsearch_mapping)
-        for action in actions:
-            index_row = dict(index=dict(_index=self.elasticsearch_new_index,
-                                        _type=self.elasticsearch_type))
-            bulk_actions.append(index_row)
-            bulk_actions.append(action)
-            cnt += 1
-            if cnt == self.elasticsearch_batch_size:
-                self.elasticsearch_client.bulk(bulk_actions)
-                LOGGER.info('Publish %i of records to ES', cnt)
-                cnt = 0
-                bulk_actions = []
+        if self.index_build_tuning:
+            body, index_settings = self._suspend_index_settings(self.elasticsearch_mapping)
+            self.elasticsearch_client.indices.create(index=self.elasticsearch_new_index, body=body)
+        else:
+            self.elasticsearch_client.indices.create(index=self.elasticsearch_new_index,
+                                                     body=self.elasticsearch_mapping)
+        self._send(self._iter_index_operations(lines, self.elasticsearch_new_index, only_changed=False))
+        if self._change_index is not None:
+            # Documents no longer published are not in the new index, and only need to leave the change index
+            self._change_index.remove_unseen()
 
-        # Do the final bulk actions
-        if bulk_actions:
-            self.elasticsearch_client.bulk(bulk_actions)
+        if self.index_build_tuning:
+            self._finish_index_build(index_settings)
 
         # fetch indices that have {elasticsearch_alias} as alias
         elasticsearch_old_indices = self._fetch_old_index()
@@ -122,5 +215,285 @@ class ElasticsearchPublisher(Publisher):
         # perform alias update and index delete in single atomic operation
         self.elasticsearch_client.indices.update_aliases(update_action)
 
+    def _get_live_index(self, change_index: ChangeIndex) -> Optional[str]:
+        """
+        :return: The index the alias points to if documents can be published to it incrementally, or None if a new
+        index needs to be built
+        """
+        if change_index.is_changed(ElasticsearchPublisher._MAPPING_KEY, {'mapping': self.elasticsearch_mapping}):
+            LOGGER.info('Mapping has changed since the previous publish. Building a new index')
+            return None
+
+        old_indices = list(self._fetch_old_index())
+        if len(old_indices) != 1:
+            LOGGER.info('Alias %s points to %i indices. Building a new index', self.elasticsearch_alias,
+                        len(old_indices))
+            return None
+        return old_indices[0]
+
+    def _publish_incrementally(self, lines: Iterator[str], index: str) -> None:
+        """
+        Indexes new and changed documents into the index, then deletes the documents that were not published
+        """
+        LOGGER.info('Publishing changed documents to index %s', index)
+        self._send(self._iter_index_operations(lines, index, only_changed=True))
+        self._send(self._iter_delete_operations(index))
+
+    @staticmethod
+    def _suspend_index_settings(mapping: Any) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        Disables refresh and replicas in the settings of the index creation body
+        :param mapping: Index creation body, either as JSON or as a dict
+        :return: Index creation body with refresh and replicas disabled, and the index settings they replace, which
+        are None where the body did not set them
+        """
+        body = json.loads(mapping) if isinstance(mapping, str) else copy.deepcopy(dict(mapping))
+        settings = body.setdefault('settings', {})
+        index_settings = settings.setdefault('index', {})
+
+        original_settings = {}
+        for key in [ElasticsearchPublisher._REFRESH_INTERVAL, ElasticsearchPublisher._NUMBER_OF_REPLICAS]:
+            # Settings can be nested in "index", or flat with or without the "index." prefix
+            original_settings[key] = index_settings.pop(key, settings.pop(key, settings.pop(f'index.{key}', None)))
+
+        index_settings[ElasticsearchPublisher._REFRESH_INTERVAL] = '-1'
+        index_settings[ElasticsearchPublisher._NUMBER_OF_REPLICAS] = 0
+        return body, original_settings
+
+    def _finish_index_build(self, index_settings: Dict[str, Any]) -> None:
+        """
+        Restores refresh of the new index and force merges it, then restores its replicas and waits for it to reach
+        the configured health status. Merging before adding replicas saves the replicas from merging their own copy of
+        the segments.
+        :param index_settings: Index settings to restore. None resets a setting to the default of the cluster.
+        """
+        index = self.elasticsearch_new_index
+        start = time.time()
+        self.elasticsearch_client.indices.put_settings(
+            index=index, body={'index': {ElasticsearchPublisher._REFRESH_INTERVAL:
+                                         index_settings[ElasticsearchPublisher._REFRESH_INTERVAL]}})
+        self.elasticsearch_client.indices.refresh(index=index)
+        self.elasticsearch_client.indices.forcemerge(index=index,
+                                                     max_num_segments=self.force_merge_max_num_segments,
+                                                     request_timeout=self.index_build_timeout_sec)
+        LOGGER.info('Force merged index %s in %.1f seconds', index, time.time() - start)
+
+        self.elasticsearch_client.indices.put_settings(
+            index=index, body={'index': {ElasticsearchPublisher._NUMBER_OF_REPLICAS:
+                                         index_settings[ElasticsearchPublisher._NUMBER_OF_REPLICAS]}})
+        health = self.elasticsearch_client.cluster.health(index=index,
+                                                          wait_for_status=self.index_build_wait_for_status,
+                                                          timeout=f'{self.index_build_timeout_sec}s',
+                                                          request_timeout=self.index_build_timeout_sec)
+        if health.get('timed_out'):
+            raise RuntimeError(f'Index {index} is still {health.get("status")} after '
+                               f'{self.index_build_timeout_sec} seconds. Not swapping alias {self.elasticsearch_alias}')
+        LOGGER.info('Index %s is %s after %.1f seconds', index, health.get('status'), time.time() - start)
+
+    def _iter_lines(self) -> Iterator[str]:
+        """
+        Streams the JSON documents of the file, one per line
+        """
+        for line in self.file_handler:
+            line = line.strip()
+            if line:
+                yield line
+
+    def _iter_index_operations(self, lines: Iterator[str], index: str, only_changed: bool) -> Iterator[BulkOperation]:
+        """
+        :param lines: JSON documents
+        :param index: Index the documents are indexed into
+        :param only_changed: Whether to skip the documents that have not changed since the previous publish
+        """
+        for line in lines:
+            action = dict(_index=index, _type=self.elasticsearch_type)
+            if self._change_index is not None:
+                document = json.loads(line)
+                document_id = document.get(self.document_id_field)
+                if document_id is None:
+                    raise ValueError(f'Document has no {self.document_id_field} to be used as its id: {line}')
+                action['_id'] = document_id
+                changed = self._change_index.is_changed(f'{ElasticsearchPublisher._DOCUMENT_KEY_PREFIX}{document_id}',
+                                                        document, pending=self._pending_hashes)
+                if only_changed and not changed:
+                    continue
+            yield dict(index=action), line
+
+    def _iter_delete_operations(self, index: str) -> Iterator[BulkOperation]:
+        """
+        :param index: Index the documents are deleted from
+        """
+        assert self._change_index is not None
+        for key in self._change_index.remove_unseen():
+            if key.startswith(ElasticsearchPublisher._DOCUMENT_KEY_PREFIX):
+                document_id = key[len(ElasticsearchPublisher._DOCUMENT_KEY_PREFIX):]
+                yield dict(delete=dict(_index=index, _type=self.elasticsearch_type, _id=document_id)), None
+
+    def _send(self, operations: Iterator[BulkOperation]) -> None:
+        if self.elasticsearch_thread_count > 1:
+            self._parallel_bulk(operations)
+        else:
+            self._bulk(operations)
+
+    def _bulk(self, operations: Iterator[BulkOperation]) -> None:
+        """
+        Sends bulk requests of batch_size operations one at a time
+        """
+        # Convert object to json for elasticsearch bulk upload
+        # Bulk load JSON format is defined here:
+        # https://www.elastic.co/guide/en/elasticsearch/reference/6.2/docs-bulk.html
+        bulk_actions: List[Dict[str, Any]] = []
+        batch: List[BulkOperation] = []
+        for operation in operations:
+            action, source = operation
+            bulk_actions.append(action)
+            if source is not None:
+                bulk_actions.append(json.loads(source))
+            batch.append(operation)
+            if len(batch) == self.elasticsearch_batch_size:
+                self._handle_response(batch, self.elasticsearch_client.bulk(bulk_actions))
+                LOGGER.info('Publish %i of records to ES', len(batch))
+                batch = []
+                bulk_actions = []
+
+        # Do the final bulk actions
+        if bulk_actions:
+            self._handle_response(batch, self.elasticsearch_client.bulk(bulk_actions))
+
+    def _iter_chunks(self, operations: Iterator[BulkOperation]) -> Iterator[List[BulkOperation]]:
+        """
+        Groups operations into chunks of at most batch_size operations and max_chunk_bytes bytes of bulk request body.
+        A document larger than max_chunk_bytes is sent in a chunk of its own.
+        """
+        chunk: List[BulkOperation] = []
+        chunk_bytes = 0
+        for operation in operations:
+            action, source = operation
+            operation_bytes = len(json.dumps(action).encode('utf-8')) + 1
+            if source is not None:
+                operation_bytes += len(source.encode('utf-8')) + 1
+            if chunk and (len(chunk) >= self.elasticsearch_batch_size
+                          or chunk_bytes + operation_bytes > self.elasticsearch_max_chunk_bytes):
+                yield chunk
+                chunk = []
+                chunk_bytes = 0
+            chunk.append(operation)
+            chunk_bytes += operation_bytes
+        if chunk:
+            yield chunk
+
+    def _parallel_bulk(self, operations: Iterator[BulkOperation]) -> None:
+        """
+        Sends chunks with up to thread_count bulk requests in flight. Chunks are read from the file as requests
+        complete, so that only a bounded number of them are held in memory.
+        """
+        cnt = 0
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=self.elasticsearch_thread_count) as executor:
+            pending: Deque[Future] = deque()
+            for chunk in self._iter_chunks(operations):
+                pending.append(executor.submit(self._send_chunk, chunk))
+                if len(pending) >= self.elasticsearch_thread_count * 2:
+                    cnt += self._wait_for(pending)
+                    LOGGER.info('Publish %i of records to ES', cnt)
+
+            while pending:
+                cnt += self._wait_for(pending)
+
+        LOGGER.info('Published %i records to ES in %.1f seconds', cnt, time.time() - start)
+
+    @staticmethod
+    def _wait_for(pending: Deque[Future]) -> int:
+        """
+        Waits for the oldest bulk request, cancelling the others if it failed
+        :return: Number of operations of the bulk request
+        """
+        future = pending.popleft()
+        try:
+            return future.result()
+        except Exception as e:
+            for f in pending:
+                f.cancel()
+            raise e
+
+    def _send_chunk(self, operations: List[BulkOperation]) -> int:
+        """
+        Sends a chunk with a bulk request, and sends the operations rejected with 429 again with exponential backoff
+        :return: Number of operations of the chunk
+        """
+        count = len(operations)
+        retries = 0
+        while True:
+            retry_operations = self._send_bulk(operations)
+            if not retry_operations:
+                return count
+
+            if retries >= self.elasticsearch_max_retries:
+                raise RuntimeError(f'{len(retry_operations)} documents were still rejected by Elasticsearch '
+                                   f'after {retries} retries')
+            backoff = min(self.elasticsearch_initial_backoff_sec * 2 ** retries, self.elasticsearch_max_backoff_sec)
+            LOGGER.info('Elasticsearch rejected %i documents with 429. Retrying in %.1f seconds',
+                        len(retry_operations), backoff)
+            time.sleep(backoff)
+            retries += 1
+            operations = retry_operations
+
+    def _send_bulk(self, operations: List[BulkOperation]) -> List[BulkOperation]:
+        """
+        :return: Operations to send again
+        """
+        body = ''.join(json.dumps(action) + '\n' + (source + '\n' if source is not None else '')
+                       for action, source in operations)
+        try:
+            response = self.elasticsearch_client.bulk(body)
+        except TransportError as e:
+            if e.status_code == 429:
+                return operations
+            raise e
+        return self._handle_response(operations, response)
+
+    def _handle_response(self, operations: List[BulkOperation], response: Dict[str, Any]) -> List[BulkOperation]:
+        """
+        Stages the hashes of the documents indexed by a bulk request, and logs the operations that failed
+        :return: Operations rejected with 429, to send again
+        """
+        if not response.get('errors'):
+            self._stage_hashes(operations)
+            return []
+
+        succeeded_operations = []
+        retry_operations = []
+        error: Optional[Any] = None
+        error_count = 0
+        for operation, item in zip(operations, response['items']):
+            result = next(iter(item.values()))
+            if result.get('status') == 429:
+                retry_operations.append(operation)
+            elif 'error' in result:
+                error = result['error']
+                error_count += 1
+            else:
+                succeeded_operations.append(operation)
+        if error_count:
+            LOGGER.error('Elasticsearch failed %i operations, e.g. %s', error_count, error)
+        self._stage_hashes(succeeded_operations)
+        return retry_operations
+
+    def _stage_hashes(self, operations: List[BulkOperation]) -> None:
+        """
+        Stages in the change index the new hashes of the documents indexed by the operations
+        """
+        if self._change_index is None:
+            return
+
+        hashes = {}
+        for action, _ in operations:
+            if 'index' in action:
+                key = f'{ElasticsearchPublisher._DOCUMENT_KEY_PREFIX}{action["index"]["_id"]}'
+                record_hash = self._pending_hashes.pop(key, None)
+                if record_hash is not None:
+                    hashes[key] = record_hash
+        self._change_index.stage(hashes)
+
     def get_scope(self) -> str:
         return 'publisher.elasticsearch'
@@ -2,23 +2,30 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import logging
+import threading
 import time
+from collections import defaultdict
+from concurrent.futures import (
+    Future, ThreadPoolExecutor, as_completed,
+)
 from os import listdir
 from os.path import (
     basename, isfile, join, splitext,
 )
 from typing import (
-    Dict, List, Optional, Type,
+    Any, Dict, List, Optional, Tuple, Type,
 )
 
-import pandas
 from amundsen_rds.models import RDSModel
 from amundsen_rds.models.base import Base
 from pyhocon import ConfigFactory, ConfigTree
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 from sqlalchemy.orm import Session, sessionmaker
 
 from databuilder.publisher.base_publisher import Publisher
+from databuilder.publisher.record_reader import RecordReader
+from databuilder.utils import compression
 
 LOGGER = logging.getLogger(__name__)
 
@@ -26,12 +33,21 @@ LOGGER = logging.getLogger(__name__)
 class MySQLCSVPublisher(Publisher):
     """
     A Publisher takes the table record folder as input and publishes csv to MySQL.
-    The folder contains CSV file(s) for table records.
+    The folder contains CSV file(s) for table records, or Parquet file(s) (.parquet) written by FSMySQLCSVLoader with
+    its parquet file format.
 
     The publish job works with rds models and SQLAlchemy ORM for data ingestion into MySQL.
     For more information:
     rds models: https://github.com/amundsen-io/amundsenrds
     SQLAlchemy ORM: https://docs.sqlalchemy.org/en/13/orm/
+
+    When BULK_UPSERT is True, records are not merged one by one through the ORM, which costs a SELECT and then an
+    INSERT or UPDATE per record. They are upserted instead with INSERT ... ON DUPLICATE KEY UPDATE statements executed
+    for batches of BULK_BATCH_SIZE records. It requires a MySQL database.
+
+    When PUBLISH_WORKER_COUNT is greater than 1, tables are grouped into levels of dependency, where a table only
+    references tables of lower levels. Levels are published one after the other, and the files of a level are
+    published concurrently, each in its own session and connection.
     """
     # Config keys
     # A directory that contains CSV files for records
@@ -49,9 +65,22 @@ class MySQLCSVPublisher(Publisher):
     TRANSACTION_SIZE = 'transaction_size'
     # A progress report frequency that determines how often it report the progress.
     PROGRESS_REPORT_FREQUENCY = 'progress_report_frequency'
+    # Number of rows of a CSV file buffered while inferring the type of its columns. Files are streamed, and larger
+    # files are read twice, once to infer the types and once to publish.
+    CSV_TYPE_INFERENCE_ROWS = 'csv_type_inference_rows'
+    # If True, records are upserted in batches with INSERT ... ON DUPLICATE KEY UPDATE instead of merged one by one
+    BULK_UPSERT = 'bulk_upsert'
+    # Number of records upserted by a statement in bulk upsert
+    BULK_BATCH_SIZE = 'bulk_batch_size'
+    # Number of files published concurrently. With 1, all files are published serially in a single session.
+    PUBLISH_WORKER_COUNT = 'publish_worker_count'
 
     _DEFAULT_CONFIG = ConfigFactory.from_dict({TRANSACTION_SIZE: 500,
                                                PROGRESS_REPORT_FREQUENCY: 500,
+                                               CSV_TYPE_INFERENCE_ROWS: 10000,
+                                               BULK_UPSERT: False,
+                                               BULK_BATCH_SIZE: 1000,
+                                               PUBLISH_WORKER_COUNT: 1,
                                                ENGINE_ECHO: False})
 
     def __init__(self) -> None:
@@ -66,18 +95,40 @@ class MySQLCSVPublisher(Publisher):
         self._sorted_record_files = self._sort_record_files(self._record_files)
         self._record_files_iter = iter(self._sorted_record_files)
 
+        self._publish_worker_count = conf.get_int(MySQLCSVPublisher.PUBLISH_WORKER_COUNT)
+        # Holds the number of records in the transaction of the session of the current thread
+        self._thread_local = threading.local()
+        self._count_lock = threading.Lock()
+
         connect_args = {k: v for k, v in conf.get_config(MySQLCSVPublisher.CONNECT_ARGS,
                                                          default=ConfigTree()).items()}
+        engine_args: Dict[str, Any] = {}
+        if self._publish_worker_count > 1:
+            # A connection per worker
+            engine_args['pool_size'] = self._publish_worker_count
         self._engine = create_engine(conf.get_string(MySQLCSVPublisher.CONN_STRING),
                                      echo=conf.get_bool(MySQLCSVPublisher.ENGINE_ECHO),
-                                     connect_args=connect_args)
+                                     connect_args=connect_args,
+                                     **engine_args)
         self._session_factory = sessionmaker(bind=self._engine)
         self._transaction_size = conf.get_int(MySQLCSVPublisher.TRANSACTION_SIZE)
+        self._record_reader = RecordReader(
+            type_inference_rows=conf.get_int(MySQLCSVPublisher.CSV_TYPE_INFERENCE_ROWS))
 
         self._publish_tag: str = conf.get_string(MySQLCSVPublisher.JOB_PUBLISH_TAG)
         if not self._publish_tag:
             raise Exception(f'{MySQLCSVPublisher.JOB_PUBLISH_TAG} should not be empty')
 
+        self._bulk_upsert = conf.get_bool(MySQLCSVPublisher.BULK_UPSERT)
+        self._bulk_batch_size = conf.get_int(MySQLCSVPublisher.BULK_BATCH_SIZE)
+        if self._bulk_upsert and self._engine.dialect.name != 'mysql':
+            raise Exception(f'{MySQLCSVPublisher.BULK_UPSERT} requires MySQL, not {self._engine.dialect.name}')
+
+        self._table_models: Dict[str, Type[RDSModel]] = {
+            model.__tablename__: model for model in Base._decl_class_registry.values()
+            if hasattr(model, '__tablename__')
+        }
+
     def _list_files(self, conf: ConfigTree, path_key: str) -> List[str]:
         """
         List files from directory
@@ -107,7 +158,7 @@ class MySQLCSVPublisher(Publisher):
         :return:
         """
         try:
-            filename = splitext(basename(file))[0]
+            filename = splitext(basename(compression.strip_extension(file)))[0]
             table_name, _ = filename.rsplit('_', 1)
             return table_name
         except Exception as e:
@@ -121,6 +172,11 @@ class MySQLCSVPublisher(Publisher):
         """
         start = time.time()
 
+        if self._publish_worker_count > 1:
+            self._publish_concurrently()
+            LOGGER.info(f'Successfully published. Elapsed: {time.time() - start} seconds')
+            return
+
         LOGGER.info(f'Publishing record files: {self._sorted_record_files}')
         session = self._session_factory()
         try:
@@ -140,6 +196,72 @@ class MySQLCSVPublisher(Publisher):
         finally:
             session.close()
 
+    def _get_table_levels(self) -> Dict[str, int]:
+        """
+        Get the level of dependency of each table: 0 for a table without foreign key,
+        and otherwise one more than the highest level of the tables it references
+        :return:
+        """
+        levels: Dict[str, int] = {}
+        # Tables are sorted so that referenced tables come first
+        for table in Base.metadata.sorted_tables:
+            levels[table.name] = max((levels[fk.column.table.name] + 1 for fk in table.foreign_keys
+                                      if fk.column.table is not table and fk.column.table.name in levels),
+                                     default=0)
+        return levels
+
+    def _group_record_files_by_level(self) -> List[Tuple[int, List[str]]]:
+        """
+        Group record files by the level of dependency of their table
+        :return: Record files of each level, lowest level first
+        """
+        levels = self._get_table_levels()
+        files_by_level: Dict[int, List[str]] = defaultdict(list)
+        for record_file in self._sorted_record_files:
+            files_by_level[levels[self._get_table_name_from_file(record_file)]].append(record_file)
+        return sorted(files_by_level.items())
+
+    def _publish_concurrently(self) -> None:
+        """
+        Publish record files level by level, with the files of a level published concurrently.
+        If any of the files fails, pending files are cancelled and the exception is raised
+        once running files are finished.
+        :return:
+        """
+        with ThreadPoolExecutor(max_workers=self._publish_worker_count) as executor:
+            for level, record_files in self._group_record_files_by_level():
+                LOGGER.info(f'Publishing record files of level {level} with {self._publish_worker_count} workers: '
+                            f'{record_files}')
+                futures: List[Future] = [executor.submit(self._publish_file_in_session, record_file)
+                                         for record_file in record_files]
+                try:
+                    for future in as_completed(futures):
+                        future.result()
+                except Exception as e:
+                    LOGGER.exception('Failed to publish. Cancelling pending files.')
+                    for future in futures:
+                        future.cancel()
+                    raise e
+
+        LOGGER.info(f'Committed total {self._count} statements')
+
+    def _publish_file_in_session(self, record_file: str) -> None:
+        """
+        Publish a record file in a new session, rolling back its pending changes if it fails
+        :param record_file:
+        :return:
+        """
+        session = self._session_factory()
+        self._thread_local.count = 0
+        try:
+            self._publish(record_file=record_file, session=session)
+        except Exception as e:
+            LOGGER.exception(f'Failed to publish {record_file}. Rolling back.')
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+
     def _publish(self, record_file: str, session: Session) -> None:
         """
         Iterate over each row of the given csv file and convert each record to a rds model instance.
@@ -148,17 +270,42 @@ class MySQLCSVPublisher(Publisher):
         :param session:
         :return:
         """
-        with open(record_file, 'r', encoding='utf8') as record_csv:
-            table_name = self._get_table_name_from_file(record_file)
-            table_model = self._get_model_from_table_name(table_name)
-            if not table_model:
-                raise RuntimeError(f'Failed to get model for table: {table_name}')
+        table_name = self._get_table_name_from_file(record_file)
+        table_model = self._get_model_from_table_name(table_name)
+        if not table_model:
+            raise RuntimeError(f'Failed to get model for table: {table_name}')
 
-            for record_dict in pandas.read_csv(record_csv, na_filter=False).to_dict(orient='records'):
-                record = self._create_record(model=table_model, record_dict=record_dict)
-                session.merge(record)
-                self._execute(session)
-            session.commit()
+        if self._bulk_upsert:
+            self._publish_in_bulk(record_file=record_file, session=session, table_model=table_model)
+            return
+
+        for record_dict in self._record_reader.read(record_file):
+            record = self._create_record(model=table_model, record_dict=record_dict)
+            session.merge(record)
+            self._execute(session)
+        session.commit()
+
+    def _publish_in_bulk(self, record_file: str, session: Session, table_model: Type[RDSModel]) -> None:
+        """
+        Upsert the records of the given csv file in batches with INSERT ... ON DUPLICATE KEY UPDATE statements
+        :param record_file:
+        :param session:
+        :param table_model:
+        :return:
+        """
+        table = table_model.__table__
+        # Records are keyed by model attribute, statement parameters by table column
+        column_keys = {attr.key: attr.columns[0].key for attr in inspect(table_model).column_attrs}
+        primary_keys = {column.key for column in table.primary_key.columns}
+
+        for batch in self._record_reader.read_batches(record_file, self._bulk_batch_size):
+            rows = [self._create_row(column_keys=column_keys, record_dict=record_dict) for record_dict in batch]
+            stmt = mysql_insert(table)
+            stmt = stmt.on_duplicate_key_update({key: stmt.inserted[key] for key in rows[0]
+                                                 if key not in primary_keys})
+            session.execute(stmt, rows)
+            self._execute_batch(session, len(rows))
+        session.commit()
 
     def _get_model_from_table_name(self, table_name: str) -> Optional[Type[RDSModel]]:
         """
@@ -166,10 +313,7 @@ class MySQLCSVPublisher(Publisher):
         :param table_name:
         :return:
         """
-        for model in Base._decl_class_registry.values():
-            if hasattr(model, '__tablename__') and model.__tablename__ == table_name:
-                return model
-        return None
+        return self._table_models.get(table_name)
 
     def _create_record(self, model: Type[RDSModel], record_dict: Dict) -> RDSModel:
         """
@@ -184,6 +328,46 @@ class MySQLCSVPublisher(Publisher):
         record.publisher_last_updated_epoch_ms = int(time.time() * 1000)
         return record
 
+    def _create_row(self, column_keys: Dict[str, str], record_dict: Dict) -> Dict[str, Any]:
+        """
+        Convert the record dict to the parameters of an insert statement,
+        and set the same additional attributes as _create_record
+        :param column_keys: Column key of each model attribute
+        :param record_dict:
+        :return:
+        """
+        row = {column_keys.get(key, key): value for key, value in record_dict.items()}
+        row[column_keys['published_tag']] = self._publish_tag
+        row[column_keys['publisher_last_updated_epoch_ms']] = int(time.time() * 1000)
+        return row
+
+    def _execute_batch(self, session: Session, count: int) -> None:
+        """
+        Commit once every transaction_size records, for records executed in batches
+        :param session:
+        :param count: Number of records of the batch
+        :return:
+        """
+        session_count, total_count = self._increment_count(count)
+        if session_count // self._transaction_size > (session_count - count) // self._transaction_size:
+            session.commit()
+            LOGGER.info(f'Committed {total_count} records so far')
+
+        if total_count // self._progress_report_frequency > (total_count - count) // self._progress_report_frequency:
+            LOGGER.info(f'Processed {total_count} records so far')
+
+    def _increment_count(self, count: int) -> Tuple[int, int]:
+        """
+        Add to the number of records of the session of the current thread, and to the total number of records
+        :param count:
+        :return: Number of records of the session, and total number of records
+        """
+        session_count = getattr(self._thread_local, 'count', 0) + count
+        self._thread_local.count = session_count
+        with self._count_lock:
+            self._count += count
+            return session_count, self._count
+
     def _execute(self, session: Session) -> None:
         """
         Commit pending record changes
@@ -191,13 +375,13 @@ class MySQLCSVPublisher(Publisher):
         :return:
         """
         try:
-            self._count += 1
-            if self._count > 1 and self._count % self._transaction_size == 0:
+            session_count, total_count = self._increment_count(1)
+            if session_count > 1 and session_count % self._transaction_size == 0:
                 session.commit()
-                LOGGER.info(f'Committed {self._count} records so far')
+                LOGGER.info(f'Committed {total_count} records so far')
 
-            if self._count > 1 and self._count % self._progress_report_frequency == 0:
-                LOGGER.info(f'Processed {self._count} records so far')
+            if total_count > 1 and total_count % self._progress_report_frequency == 0:
+                LOGGER.info(f'Processed {total_count} records so far')
 
         except Exception as e:
             LOGGER.exception('Failed to commit changes')
@@ -0,0 +1,147 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+import csv
+import logging
+import os
+import re
+import shlex
+import subprocess
+import time
+from os import listdir
+from os.path import isfile, join
+from typing import List, Set
+
+from pyhocon import ConfigFactory, ConfigTree
+
+from databuilder.publisher.base_publisher import Publisher
+from databuilder.utils import compression
+
+LOGGER = logging.getLogger(__name__)
+
+# Label of a node file, as the ID space of its key:ID(<label>) header
+_ID_HEADER_PATTERN = re.compile(r'^\w*:ID\((?P<label>\w+)\)$')
+
+
+class Neo4jAdminImportPublisher(Publisher):
+    """
+    A Publisher that takes the node and relationship CSV files written by FsNeo4jAdminImportCSVLoader and imports them
+    with neo4j-admin import, which builds a new database offline. It is meant for initial loads and rebuilds, where
+    merging every record through Neo4jCsvPublisher takes too long.
+
+    The database should not exist, or be stopped and dropped first. As neo4j-admin import does not create constraints,
+    the statements creating the unique constraints on the keys of the imported labels, that Neo4jCsvPublisher creates,
+    can be written to CONSTRAINTS_FILE_PATH, to run e.g. with cypher-shell once the database is started.
+    Files compressed with gzip are imported as is. Files compressed with zstd, which neo4j-admin can't read, fail the
+    publish before the import starts.
+
+    https://neo4j.com/docs/operations-manual/4.4/tools/neo4j-admin/neo4j-admin-import/
+    """
+    # Config keys
+    # A directory that contains CSV files for nodes
+    NODE_FILES_DIR = 'node_files_directory'
+    # A directory that contains CSV files for relationships
+    RELATION_FILES_DIR = 'relation_files_directory'
+    # Command of neo4j-admin, e.g. /var/lib/neo4j/bin/neo4j-admin
+    NEO4J_ADMIN_COMMAND = 'neo4j_admin_command'
+    # Neo4j home directory of the database, if not the one of neo4j-admin
+    NEO4J_HOME = 'neo4j_home'
+    # Name of the database to import into
+    DATABASE = 'database'
+    # Additional arguments of neo4j-admin import, e.g. ['--high-io=true']
+    EXTRA_ARGS = 'extra_args'
+    # Path of a file the constraint creation statements are written to
+    CONSTRAINTS_FILE_PATH = 'constraints_file_path'
+
+    _DEFAULT_CONFIG = ConfigFactory.from_dict({
+        NEO4J_ADMIN_COMMAND: 'neo4j-admin',
+        DATABASE: 'neo4j',
+        EXTRA_ARGS: [],
+    })
+
+    CONSTRAINT_STATEMENT = 'CREATE CONSTRAINT ON (node:{label}) ASSERT node.key IS UNIQUE;\n'
+
+    def __init__(self) -> None:
+        super(Neo4jAdminImportPublisher, self).__init__()
+
+    def init(self, conf: ConfigTree) -> None:
+        conf = conf.with_fallback(Neo4jAdminImportPublisher._DEFAULT_CONFIG)
+
+        self._node_files_dir = conf.get_string(Neo4jAdminImportPublisher.NODE_FILES_DIR)
+        self._relation_files_dir = conf.get_string(Neo4jAdminImportPublisher.RELATION_FILES_DIR)
+        self._neo4j_admin_command = conf.get_string(Neo4jAdminImportPublisher.NEO4J_ADMIN_COMMAND)
+        self._neo4j_home = conf.get_string(Neo4jAdminImportPublisher.NEO4J_HOME, None)
+        self._database = conf.get_string(Neo4jAdminImportPublisher.DATABASE)
+        self._extra_args = conf.get_list(Neo4jAdminImportPublisher.EXTRA_ARGS)
+        self._constraints_file_path = conf.get_string(Neo4jAdminImportPublisher.CONSTRAINTS_FILE_PATH, None)
+
+    def publish_impl(self) -> None:
+        node_files = self._list_files(self._node_files_dir)
+        relation_files = self._list_files(self._relation_files_dir)
+        if not node_files and not relation_files:
+            LOGGER.info('No files to import')
+            return
+
+        unsupported_files = [f for f in node_files + relation_files
+                             if f.endswith(compression.EXTENSIONS[compression.ZSTD])]
+        if unsupported_files:
+            raise ValueError(f'neo4j-admin import does not support files compressed with {compression.ZSTD}: '
+                             f'{unsupported_files}')
+
+        command = self.create_import_command(node_files, relation_files)
+        LOGGER.info('Importing %i node files and %i relation files: %s',
+                    len(node_files), len(relation_files), ' '.join(command))
+
+        env = dict(os.environ)
+        if self._neo4j_home:
+            env['NEO4J_HOME'] = self._neo4j_home
+
+        start = time.time()
+        subprocess.run(command, check=True, env=env)
+        LOGGER.info('Imported into database %s in %.1f seconds', self._database, time.time() - start)
+
+        if self._constraints_file_path:
+            self._write_constraints(node_files)
+
+    def create_import_command(self, node_files: List[str], relation_files: List[str]) -> List[str]:
+        """
+        Duplicate nodes, as well as relationships between nodes that don't exist, are skipped rather than failing
+        the import, the same way merging them with Neo4jCsvPublisher would.
+        :param node_files:
+        :param relation_files:
+        :return: neo4j-admin import command
+        """
+        command = shlex.split(self._neo4j_admin_command) + [
+            'import',
+            f'--database={self._database}',
+            '--id-type=STRING',
+            '--skip-duplicate-nodes=true',
+            '--skip-bad-relationships=true',
+            '--multiline-fields=true',
+        ]
+        command.extend(f'--nodes={node_file}' for node_file in node_files)
+        command.extend(f'--relationships={relation_file}' for relation_file in relation_files)
+        command.extend(self._extra_args)
+        return command
+
+    def _write_constraints(self, node_files: List[str]) -> None:
+        labels: Set[str] = set()
+        for node_file in node_files:
+            with compression.open_for_read(node_file) as f:
+                header = next(csv.reader(f), [])
+            for column in header:
+                match = _ID_HEADER_PATTERN.match(column)
+                if match:
+                    labels.add(match.group('label'))
+
+        LOGGER.info('Writing constraints of %i labels to %s', len(labels), self._constraints_file_path)
+        with open(self._constraints_file_path, 'w', encoding='utf8') as f:
+            for label in sorted(labels):
+                f.write(Neo4jAdminImportPublisher.CONSTRAINT_STATEMENT.format(label=label))
+
+    @staticmethod
+    def _list_files(directory: str) -> List[str]:
+        return sorted(join(directory, f) for f in listdir(directory) if isfile(join(directory, f)))
+
+    def get_scope(self) -> str:
+        return 'publisher.neo4j_admin_import'
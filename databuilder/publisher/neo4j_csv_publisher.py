@@ -1,29 +1,30 @@
 # Copyright Contributors to the Amundsen project.
 # SPDX-License-Identifier: Apache-2.0
 
-import csv
-import ctypes
 import logging
+import threading
 import time
-from io import open
+from concurrent.futures import (
+    Future, ThreadPoolExecutor, as_completed,
+)
 from os import listdir
 from os.path import isfile, join
-from typing import List, Set
+from typing import (
+    Any, Callable, Dict, Iterable, List, Optional, Set,
+)
 
 import neo4j
-import pandas
 from jinja2 import Template
-from neo4j import GraphDatabase, Transaction
+from neo4j import (
+    GraphDatabase, Session, Transaction,
+)
 from neo4j.exceptions import CypherError, TransientError
 from pyhocon import ConfigFactory, ConfigTree
 
 from databuilder.publisher.base_publisher import Publisher
+from databuilder.publisher.change_index import ChangeIndex
 from databuilder.publisher.neo4j_preprocessor import NoopRelationPreprocessor
-
-# Setting field_size_limit to solve the error below
-# _csv.Error: field larger than field limit (131072)
-# https://stackoverflow.com/a/54517228/5972935
-csv.field_size_limit(int(ctypes.c_ulong(-1).value // 2))
+from databuilder.publisher.record_reader import RecordReader
 
 # Config keys
 # A directory that contains CSV files for nodes
@@ -47,6 +48,24 @@ NEO4J_CREATE_ONLY_NODES = 'neo4j_create_only_nodes'
 # list of node labels that could attempt to be accessed simultaneously
 NEO4J_DEADLOCK_NODE_LABELS = 'neo4j_deadlock_node_labels'
 
+# A boolean flag to publish nodes and relations with UNWIND batched MERGE statements instead of one statement per row
+NEO4J_UNWIND_BATCH_ENABLED = 'neo4j_unwind_batch_enabled'
+# Maximum number of rows that are sent in a single UNWIND statement.
+NEO4J_UNWIND_BATCH_SIZE = 'neo4j_unwind_batch_size'
+
+# Number of files published concurrently, each on its own session. Node files are published first and relation files
+# are published once all node files are committed. With 1, all files are published serially in a single session.
+NEO4J_PUBLISH_WORKER_COUNT = 'neo4j_publish_worker_count'
+
+# Path of a SQLite file that keeps the hash of every node and relation published. When set, only nodes and relations
+# that have changed since the previous publish are merged, and unchanged ones only get their published tag and
+# timestamp updated.
+NEO4J_CHANGE_INDEX_PATH = 'neo4j_change_index_path'
+
+# Number of rows of a CSV file buffered while inferring the type of its columns. Files are streamed, and larger files
+# are read twice, once to infer the types and once to publish.
+CSV_TYPE_INFERENCE_ROWS = 'csv_type_inference_rows'
+
 NEO4J_USER = 'neo4j_user'
 NEO4J_PASSWORD = 'neo4j_password'
 NEO4J_ENCRYPTED = 'neo4j_encrypted'
@@ -99,12 +118,20 @@ DEFAULT_CONFIG = ConfigFactory.from_dict({NEO4J_TRANSACTION_SIZE: 500,
                                           NEO4J_MAX_CONN_LIFE_TIME_SEC: 50,
                                           NEO4J_ENCRYPTED: True,
                                           NEO4J_VALIDATE_SSL: False,
+                                          NEO4J_UNWIND_BATCH_ENABLED: False,
+                                          NEO4J_UNWIND_BATCH_SIZE: 1000,
+                                          NEO4J_PUBLISH_WORKER_COUNT: 1,
+                                          CSV_TYPE_INFERENCE_ROWS: 10000,
                                           RELATION_PREPROCESSOR: NoopRelationPreprocessor()})
 
 # transient error retries and sleep time
 RETRIES_NUMBER = 5
 SLEEP_TIME = 2
 
+# Cypher parameter name that holds the rows of an UNWIND batch
+UNWIND_BATCH_PARAM = 'batch'
+UNWIND_ROW_VAR = 'row'
+
 LOGGER = logging.getLogger(__name__)
 
 
@@ -112,11 +139,22 @@ class Neo4jCsvPublisher(Publisher):
     """
     A Publisher takes two folders for input and publishes to Neo4j.
     One folder will contain CSV file(s) for Node where the other folder will contain CSV file(s) for Relationship.
+    Parquet files (.parquet), written by FsNeo4jCSVLoader with its parquet file format, are read as well.
 
     Neo4j follows Label Node properties Graph and more information about this is in:
     https://neo4j.com/docs/developer-manual/current/introduction/graphdb-concepts/
 
-    #TODO User UNWIND batch operation for better performance
+    When NEO4J_UNWIND_BATCH_ENABLED is set, rows that render to the same MERGE statement (same label or relation type
+    and same set of properties) are grouped and sent as a single "UNWIND $batch AS row MERGE ..." statement, which
+    saves a round trip per row.
+
+    When NEO4J_PUBLISH_WORKER_COUNT is greater than 1, files are published concurrently where each file is committed in
+    its own session. As MERGE is idempotent, a file that fails with a TransientError (e.g. a deadlock between
+    concurrent transactions) is re-published as a whole.
+
+    When NEO4J_CHANGE_INDEX_PATH is set, records whose hash matches the one of the previous publish are not merged.
+    Their published tag and timestamp are updated in batches instead, so that staleness removal keeps them, and any of
+    them that can't be found (e.g. deleted since) is merged after all.
     """
 
     def __init__(self) -> None:
@@ -142,7 +180,13 @@ class Neo4jCsvPublisher(Publisher):
                                  encrypted=conf.get_bool(NEO4J_ENCRYPTED),
                                  trust=trust)
         self._transaction_size = conf.get_int(NEO4J_TRANSACTION_SIZE)
+        self._unwind_batch_enabled = conf.get_bool(NEO4J_UNWIND_BATCH_ENABLED)
+        self._unwind_batch_size = conf.get_int(NEO4J_UNWIND_BATCH_SIZE)
         self._session = self._driver.session()
+        self._publish_worker_count = conf.get_int(NEO4J_PUBLISH_WORKER_COUNT)
+        # Holds the session and the number of statements in the transaction of the worker thread
+        self._thread_local = threading.local()
+        self._count_lock = threading.Lock()
         self._confirm_rel_created = conf.get_bool(NEO4J_RELATIONSHIP_CREATION_CONFIRM)
 
         # config is list of node label.
@@ -155,6 +199,13 @@ class Neo4jCsvPublisher(Publisher):
             raise Exception(f'{JOB_PUBLISH_TAG} should not be empty')
 
         self._relation_preprocessor = conf.get(RELATION_PREPROCESSOR)
+        self._record_reader = RecordReader(type_inference_rows=conf.get_int(CSV_TYPE_INFERENCE_ROWS))
+
+        self._change_index: Optional[ChangeIndex] = None
+        if NEO4J_CHANGE_INDEX_PATH in conf:
+            self._change_index = ChangeIndex(conf.get_string(NEO4J_CHANGE_INDEX_PATH))
+            # New hashes are only kept if the publish succeeds
+            self.register_call_back(self._change_index)
 
         LOGGER.info('Publishing Node csv files %s, and Relation CSV files %s', self._node_files, self._relation_files)
 
@@ -183,6 +234,11 @@ class Neo4jCsvPublisher(Publisher):
         for node_file in self._node_files:
             self._create_indices(node_file=node_file)
 
+        if self._publish_worker_count > 1:
+            self._publish_concurrently()
+            LOGGER.info('Successfully published. Elapsed: %i seconds', time.time() - start)
+            return
+
         LOGGER.info('Publishing Node files: %s', self._node_files)
         try:
             tx = self._session.begin_transaction()
@@ -212,9 +268,93 @@ class Neo4jCsvPublisher(Publisher):
                 tx.rollback()
             raise e
 
+    def _publish_concurrently(self) -> None:
+        """
+        Publishes Node files concurrently and then, once all Node files are committed, Relation files concurrently.
+        :return:
+        """
+        LOGGER.info('Publishing Node files with %i workers: %s', self._publish_worker_count, self._node_files)
+        self._publish_files_concurrently(self._node_files, self._publish_node)
+
+        LOGGER.info('Publishing Relationship files with %i workers: %s',
+                    self._publish_worker_count, self._relation_files)
+        self._publish_files_concurrently(self._relation_files, self._publish_relation)
+
+        LOGGER.info('Committed total %i statements', self._count)
+
+    def _publish_files_concurrently(self,
+                                    files: List[str],
+                                    publish_file: Callable[[str, Transaction], Transaction]) -> None:
+        """
+        Publishes files on a pool of workers. If any of the files fails, pending files are cancelled and the exception
+        is raised once running files are finished.
+        :param files:
+        :param publish_file: either _publish_node or _publish_relation
+        :return:
+        """
+        with ThreadPoolExecutor(max_workers=self._publish_worker_count) as executor:
+            futures: List[Future] = [executor.submit(self._publish_file_in_session, file, publish_file)
+                                     for file in files]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except Exception as e:
+                LOGGER.exception('Failed to publish. Cancelling pending files.')
+                for future in futures:
+                    future.cancel()
+                raise e
+
+    def _publish_file_in_session(self,
+                                 file: str,
+                                 publish_file: Callable[[str, Transaction], Transaction]) -> None:
+        """
+        Publishes a file in a new session and commits it. On TransientError, the file is published again up to
+        RETRIES_NUMBER times.
+        :param file:
+        :param publish_file:
+        :return:
+        """
+        retries_for_exception = RETRIES_NUMBER
+        while True:
+            session = self._driver.session()
+            self._thread_local.session = session
+            self._thread_local.count = 0
+            # Nothing of a failed attempt is kept: new hashes are only staged once the file is committed
+            self._thread_local.unchanged_batches = {}
+            self._thread_local.pending_hashes = {}
+            tx = session.begin_transaction()
+            try:
+                tx = publish_file(file, tx)
+                tx.commit()
+                if self._change_index is not None:
+                    self._change_index.stage(self._thread_local.pending_hashes)
+                return
+            except TransientError as e:
+                retries_for_exception -= 1
+                if retries_for_exception <= 0:
+                    raise e
+                LOGGER.warning('Transient error while publishing %s. Retrying in %i seconds', file, SLEEP_TIME)
+                time.sleep(SLEEP_TIME)
+            finally:
+                if not tx.closed():
+                    tx.rollback()
+                session.close()
+
+    def _get_session(self) -> Session:
+        """
+        Session of current worker thread if it is publishing concurrently, or the publisher's session otherwise.
+        :return:
+        """
+        return getattr(self._thread_local, 'session', self._session)
+
     def get_scope(self) -> str:
         return 'publisher.neo4j'
 
+    def close(self) -> None:
+        change_index = getattr(self, '_change_index', None)
+        if change_index is not None:
+            change_index.close()
+
     def _create_indices(self, node_file: str) -> None:
         """
         Go over the node file and try creating unique index
@@ -223,18 +363,26 @@ class Neo4jCsvPublisher(Publisher):
         """
         LOGGER.info('Creating indices. (Existing indices will be ignored)')
 
-        with open(node_file, 'r', encoding='utf8') as node_csv:
-            for node_record in pandas.read_csv(node_csv, na_filter=False).to_dict(orient='records'):
-                label = node_record[NODE_LABEL_KEY]
-                if label not in self.labels:
-                    self._try_create_index(label)
-                    self.labels.add(label)
+        for node_record in self._record_reader.read(node_file):
+            label = node_record[NODE_LABEL_KEY]
+            if label not in self.labels:
+                self._try_create_index(label)
+                self.labels.add(label)
 
         LOGGER.info('Indices have been created.')
 
     def _publish_node(self, node_file: str, tx: Transaction) -> Transaction:
         """
-        Iterate over the csv records of a file, each csv record transform to Merge statement and will be executed.
+        Publishes the csv records of a node file
+        :param node_file:
+        :param tx:
+        :return:
+        """
+        return self._publish_node_records(self._record_reader.read(node_file), tx=tx)
+
+    def _publish_node_records(self, node_records: Iterable[dict], tx: Transaction) -> Transaction:
+        """
+        Iterate over the node records, each record transform to Merge statement and will be executed.
         All nodes should have a unique key, and this method will try to create unique index on the LABEL when it sees
         first time within a job scope.
         Example of Cypher query executed by this method:
@@ -246,16 +394,53 @@ class Neo4jCsvPublisher(Publisher):
                      col_test_id1.order_pos = 2,
                      col_test_id1.type = 'bigint'
 
-        :param node_file:
+        :param node_records:
         :return:
         """
+        if self._unwind_batch_enabled:
+            return self._publish_node_batch(node_records, tx=tx)
 
-        with open(node_file, 'r', encoding='utf8') as node_csv:
-            for node_record in pandas.read_csv(node_csv, na_filter=False).to_dict(orient="records"):
-                stmt = self.create_node_merge_statement(node_record=node_record)
-                params = self._create_props_param(node_record)
-                tx = self._execute_statement(stmt, tx, params)
-        return tx
+        for node_record in node_records:
+            if not self._is_changed(node_record):
+                tx = self._touch_unchanged(node_record, tx)
+                continue
+
+            stmt = self.create_node_merge_statement(node_record=node_record)
+            params = self._create_props_param(node_record)
+            tx = self._execute_statement(stmt, tx, params)
+        return self._flush_unchanged(tx)
+
+    def _publish_node_batch(self, node_records: Iterable[dict], tx: Transaction) -> Transaction:
+        """
+        Same as _publish_node_records, but groups the records by their MERGE statement and executes each group with
+        UNWIND in batches of NEO4J_UNWIND_BATCH_SIZE rows.
+        Example of Cypher query executed by this method:
+        UNWIND $batch AS row
+        MERGE (node:Column {key: row.KEY})
+        ON CREATE SET node.name = row.name, node.order_pos = row.order_pos, node.type = row.type
+        ON MATCH SET node.name = row.name, node.order_pos = row.order_pos, node.type = row.type
+
+        :param node_records:
+        :param tx:
+        :return:
+        """
+        batches: Dict[str, List[dict]] = {}
+        for node_record in node_records:
+            if not self._is_changed(node_record):
+                tx = self._touch_unchanged(node_record, tx)
+                continue
+
+            stmt = self.create_node_unwind_statement(node_record=node_record)
+            batch = batches.setdefault(stmt, [])
+            batch.append(self._create_props_param(node_record))
+            if len(batch) >= self._unwind_batch_size:
+                tx = self._execute_statement(stmt, tx, {UNWIND_BATCH_PARAM: batch}, count=len(batch))
+                batches[stmt] = []
+
+        for stmt, batch in batches.items():
+            if batch:
+                tx = self._execute_statement(stmt, tx, {UNWIND_BATCH_PARAM: batch}, count=len(batch))
+        return self._flush_unchanged(tx)
 
     def is_create_only_node(self, node_record: dict) -> bool:
         """
@@ -286,6 +471,28 @@ class Neo4jCsvPublisher(Publisher):
                                PROP_BODY=prop_body,
                                update=(not self.is_create_only_node(node_record)))
 
+    def create_node_unwind_statement(self, node_record: dict) -> str:
+        """
+        Creates node merge statement that merges every row of the $batch parameter
+        :param node_record:
+        :return:
+        """
+        template = Template("""
+            UNWIND ${{ BATCH }} AS {{ ROW }}
+            MERGE (node:{{ LABEL }} {key: {{ ROW }}.KEY})
+            ON CREATE SET {{ PROP_BODY }}
+            {% if update %} ON MATCH SET {{ PROP_BODY }} {% endif %}
+        """)
+
+        prop_body = self._create_props_body(node_record, NODE_REQUIRED_KEYS, 'node',
+                                            param_prefix=f'{UNWIND_ROW_VAR}.')
+
+        return template.render(BATCH=UNWIND_BATCH_PARAM,
+                               ROW=UNWIND_ROW_VAR,
+                               LABEL=node_record["LABEL"],
+                               PROP_BODY=prop_body,
+                               update=(not self.is_create_only_node(node_record)))
+
     def _publish_relation(self, relation_file: str, tx: Transaction) -> Transaction:
         """
         Creates relation between two nodes.
@@ -302,47 +509,149 @@ class Neo4jCsvPublisher(Publisher):
         """
 
         if self._relation_preprocessor.is_perform_preprocess():
-            LOGGER.info('Pre-processing relation with %s', self._relation_preprocessor)
-
-            count = 0
-            with open(relation_file, 'r', encoding='utf8') as relation_csv:
-                for rel_record in pandas.read_csv(relation_csv, na_filter=False).to_dict(orient="records"):
-                    # TODO not sure if deadlock on badge node arises in preporcessing or not
-                    stmt, params = self._relation_preprocessor.preprocess_cypher(
-                        start_label=rel_record[RELATION_START_LABEL],
-                        end_label=rel_record[RELATION_END_LABEL],
-                        start_key=rel_record[RELATION_START_KEY],
-                        end_key=rel_record[RELATION_END_KEY],
-                        relation=rel_record[RELATION_TYPE],
-                        reverse_relation=rel_record[RELATION_REVERSE_TYPE])
-
-                    if stmt:
-                        tx = self._execute_statement(stmt, tx=tx, params=params)
-                        count += 1
-
-            LOGGER.info('Executed pre-processing Cypher statement %i times', count)
-
-        with open(relation_file, 'r', encoding='utf8') as relation_csv:
-            for rel_record in pandas.read_csv(relation_csv, na_filter=False).to_dict(orient="records"):
-                exception_exists = True
-                retries_for_exception = RETRIES_NUMBER
-                while exception_exists and retries_for_exception > 0:
-                    try:
-                        stmt = self.create_relationship_merge_statement(rel_record=rel_record)
-                        params = self._create_props_param(rel_record)
-                        tx = self._execute_statement(stmt, tx, params,
-                                                     expect_result=self._confirm_rel_created)
-                        exception_exists = False
-                    except TransientError as e:
-                        if rel_record[RELATION_START_LABEL] in self.deadlock_node_labels \
-                                or rel_record[RELATION_END_LABEL] in self.deadlock_node_labels:
-                            time.sleep(SLEEP_TIME)
-                            retries_for_exception -= 1
-                        else:
-                            raise e
+            tx = self._preprocess_relation(self._record_reader.read(relation_file), tx=tx)
+
+        return self._publish_relation_records(self._record_reader.read(relation_file), tx=tx)
+
+    def _publish_relation_records(self, rel_records: Iterable[dict], tx: Transaction) -> Transaction:
+        """
+        Merges the relation records, without pre-processing them
+        :param rel_records:
+        :param tx:
+        :return:
+        """
+        if self._unwind_batch_enabled:
+            return self._publish_relation_batch(rel_records, tx=tx)
+
+        for rel_record in rel_records:
+            if not self._is_changed(rel_record):
+                tx = self._touch_unchanged(rel_record, tx)
+                continue
+
+            stmt = self.create_relationship_merge_statement(rel_record=rel_record)
+            params = self._create_props_param(rel_record)
+            retry = rel_record[RELATION_START_LABEL] in self.deadlock_node_labels \
+                or rel_record[RELATION_END_LABEL] in self.deadlock_node_labels
+            tx = self._execute_relation_statement(stmt, params, tx, retry=retry)
 
+        return self._flush_unchanged(tx)
+
+    def _preprocess_relation(self, rel_records: Iterable[dict], tx: Transaction) -> Transaction:
+        """
+        Executes the Cypher statement of the relation preprocessor for each relation record
+        :param rel_records:
+        :param tx:
+        :return:
+        """
+        LOGGER.info('Pre-processing relation with %s', self._relation_preprocessor)
+
+        count = 0
+        for rel_record in rel_records:
+            # TODO not sure if deadlock on badge node arises in preporcessing or not
+            stmt, params = self._relation_preprocessor.preprocess_cypher(
+                start_label=rel_record[RELATION_START_LABEL],
+                end_label=rel_record[RELATION_END_LABEL],
+                start_key=rel_record[RELATION_START_KEY],
+                end_key=rel_record[RELATION_END_KEY],
+                relation=rel_record[RELATION_TYPE],
+                reverse_relation=rel_record[RELATION_REVERSE_TYPE])
+
+            if stmt:
+                tx = self._execute_statement(stmt, tx=tx, params=params)
+                count += 1
+
+        LOGGER.info('Executed pre-processing Cypher statement %i times', count)
         return tx
 
+    def _publish_relation_batch(self, rel_records: Iterable[dict], tx: Transaction) -> Transaction:
+        """
+        Same as the per row publishing in _publish_relation_records, but groups the records by their MERGE statement and
+        executes each group with UNWIND in batches of NEO4J_UNWIND_BATCH_SIZE rows.
+        Example of Cypher query executed by this method:
+        UNWIND $batch AS row
+        MATCH (n1:Table {key: row.START_KEY}), (n2:Column {key: row.END_KEY})
+        MERGE (n1)-[r1:COLUMN]->(n2)-[r2:BELONG_TO_TABLE]->(n1)
+        RETURN count(*) AS count
+
+        :param rel_records:
+        :param tx:
+        :return:
+        """
+        batches: Dict[str, List[dict]] = {}
+        deadlock_prone: Dict[str, bool] = {}
+        for rel_record in rel_records:
+            if not self._is_changed(rel_record):
+                tx = self._touch_unchanged(rel_record, tx)
+                continue
+
+            stmt = self.create_relationship_unwind_statement(rel_record=rel_record)
+            batch = batches.setdefault(stmt, [])
+            batch.append(self._create_props_param(rel_record))
+            deadlock_prone[stmt] = rel_record[RELATION_START_LABEL] in self.deadlock_node_labels \
+                or rel_record[RELATION_END_LABEL] in self.deadlock_node_labels
+            if len(batch) >= self._unwind_batch_size:
+                tx = self._execute_relation_batch(stmt, batch, tx, retry=deadlock_prone[stmt])
+                batches[stmt] = []
+
+        for stmt, batch in batches.items():
+            if batch:
+                tx = self._execute_relation_batch(stmt, batch, tx, retry=deadlock_prone[stmt])
+        return self._flush_unchanged(tx)
+
+    def _execute_relation_batch(self,
+                                stmt: str,
+                                batch: List[dict],
+                                tx: Transaction,
+                                retry: bool) -> Transaction:
+        """
+        Executes UNWIND relation statement, retrying on TransientError if the relation touches a deadlock prone label.
+        If NEO4J_RELATIONSHIP_CREATION_CONFIRM is set, it confirms that every row in the batch was merged.
+        :param stmt:
+        :param batch:
+        :param tx:
+        :param retry: retries on TransientError when True
+        :return:
+        """
+        return self._execute_relation_statement(stmt, {UNWIND_BATCH_PARAM: batch}, tx, retry=retry,
+                                                count=len(batch))
+
+    def _execute_relation_statement(self,
+                                    stmt: str,
+                                    params: dict,
+                                    tx: Transaction,
+                                    retry: bool,
+                                    count: int = 1) -> Transaction:
+        """
+        Executes relation statement, retrying on TransientError if the relation touches a deadlock prone label.
+
+        A failed statement rolls back its transaction, so a retried statement runs in a transaction of its own: the
+        statements before it are committed first, and it is committed once it succeeds.
+        :param stmt:
+        :param params:
+        :param tx:
+        :param retry: retries on TransientError when True
+        :param count: Number of rows the statement covers
+        :return:
+        """
+        if not retry:
+            return self._execute_statement(stmt, tx, params, expect_result=self._confirm_rel_created,
+                                           count=count)
+
+        tx.commit()
+        retries_for_exception = RETRIES_NUMBER
+        while True:
+            tx = self._get_session().begin_transaction()
+            try:
+                tx = self._execute_statement(stmt, tx, params, expect_result=self._confirm_rel_created,
+                                             count=count)
+                tx.commit()
+                return self._get_session().begin_transaction()
+            except TransientError as e:
+                retries_for_exception -= 1
+                if retries_for_exception <= 0:
+                    raise e
+                time.sleep(SLEEP_TIME)
+
     def create_relationship_merge_statement(self, rel_record: dict) -> str:
         """
         Creates relationship merge statement
@@ -370,6 +679,173 @@ class Neo4jCsvPublisher(Publisher):
                                update_prop_body=prop_body_r1,
                                prop_body=prop_body)
 
+    def create_relationship_unwind_statement(self, rel_record: dict) -> str:
+        """
+        Creates relationship merge statement that merges every row of the $batch parameter
+        :param rel_record:
+        :return:
+        """
+        template = Template("""
+            UNWIND ${{ BATCH }} AS {{ ROW }}
+            MATCH (n1:{{ START_LABEL }} {key: {{ ROW }}.START_KEY}), (n2:{{ END_LABEL }} {key: {{ ROW }}.END_KEY})
+            MERGE (n1)-[r1:{{ TYPE }}]->(n2)-[r2:{{ REVERSE_TYPE }}]->(n1)
+            {% if update_prop_body %}
+            ON CREATE SET {{ prop_body }}
+            ON MATCH SET {{ prop_body }}
+            {% endif %}
+            RETURN count(*) AS count
+        """)
+
+        prop_body_r1 = self._create_props_body(rel_record, RELATION_REQUIRED_KEYS, 'r1',
+                                               param_prefix=f'{UNWIND_ROW_VAR}.')
+        prop_body_r2 = self._create_props_body(rel_record, RELATION_REQUIRED_KEYS, 'r2',
+                                               param_prefix=f'{UNWIND_ROW_VAR}.')
+        prop_body = ' , '.join([prop_body_r1, prop_body_r2])
+
+        return template.render(BATCH=UNWIND_BATCH_PARAM,
+                               ROW=UNWIND_ROW_VAR,
+                               START_LABEL=rel_record["START_LABEL"],
+                               END_LABEL=rel_record["END_LABEL"],
+                               TYPE=rel_record["TYPE"],
+                               REVERSE_TYPE=rel_record["REVERSE_TYPE"],
+                               update_prop_body=prop_body_r1,
+                               prop_body=prop_body)
+
+    def _is_changed(self, record: dict) -> bool:
+        """
+        :param record: A node or relation record
+        :return: False if the record is the same as the one published last time
+        """
+        if self._change_index is None:
+            return True
+
+        if RELATION_START_KEY in record:
+            key = f'{record[RELATION_START_LABEL]}:{record[RELATION_START_KEY]}-[{record[RELATION_TYPE]}]->' \
+                  f'{record[RELATION_END_LABEL]}:{record[RELATION_END_KEY]}'
+        else:
+            key = f'{record[NODE_LABEL_KEY]}:{record[NODE_KEY_KEY]}'
+        # When publishing concurrently, the file being published may be published again
+        return self._change_index.is_changed(key, record, pending=getattr(self._thread_local, 'pending_hashes', None))
+
+    def _touch_unchanged(self, record: dict, tx: Transaction) -> Transaction:
+        """
+        Adds an unchanged record to the batch of its touch statement, and executes the batch once it is full.
+        :param record: A node or relation record
+        :param tx:
+        :return:
+        """
+        if RELATION_START_KEY in record:
+            stmt = self.create_relationship_touch_statement(rel_record=record)
+        else:
+            stmt = self.create_node_touch_statement(node_record=record)
+
+        # Batches are per thread as files are published concurrently
+        batches = self._get_unchanged_batches()
+        batch = batches.setdefault(stmt, [])
+        batch.append(record)
+        if len(batch) >= self._unwind_batch_size:
+            tx = self._execute_touch(stmt, batch, tx)
+            batches[stmt] = []
+        return tx
+
+    def _flush_unchanged(self, tx: Transaction) -> Transaction:
+        """
+        Executes the remaining batches of unchanged records
+        :param tx:
+        :return:
+        """
+        batches = self._get_unchanged_batches()
+        for stmt, batch in batches.items():
+            if batch:
+                tx = self._execute_touch(stmt, batch, tx)
+        batches.clear()
+        return tx
+
+    def _get_unchanged_batches(self) -> Dict[str, List[dict]]:
+        if not hasattr(self._thread_local, 'unchanged_batches'):
+            self._thread_local.unchanged_batches = {}
+        return self._thread_local.unchanged_batches
+
+    def _execute_touch(self, stmt: str, batch: List[dict], tx: Transaction) -> Transaction:
+        """
+        Updates published tag and timestamp of unchanged records. Records that are not found are merged.
+        :param stmt: Touch statement
+        :param batch: Unchanged records
+        :param tx:
+        :return:
+        """
+        params = []
+        for i, record in enumerate(batch):
+            param = {k: record[k] for k in (NODE_KEY_KEY, RELATION_START_KEY, RELATION_END_KEY) if k in record}
+            param['id'] = i
+            params.append(param)
+
+        touched_ids: Set[int] = set()
+
+        def collect_touched(result: Any) -> None:
+            record = result.single()
+            if record:
+                touched_ids.update(record['ids'])
+
+        tx = self._execute_statement(stmt, tx, {UNWIND_BATCH_PARAM: params}, count=len(batch),
+                                     on_result=collect_touched)
+
+        missing = [record for i, record in enumerate(batch) if i not in touched_ids]
+        if missing:
+            LOGGER.info('%i unchanged records are not found, merging them', len(missing))
+        for record in missing:
+            if RELATION_START_KEY in record:
+                tx = self._execute_statement(self.create_relationship_merge_statement(rel_record=record), tx,
+                                             self._create_props_param(record),
+                                             expect_result=self._confirm_rel_created)
+            else:
+                tx = self._execute_statement(self.create_node_merge_statement(node_record=record), tx,
+                                             self._create_props_param(record))
+        return tx
+
+    def create_node_touch_statement(self, node_record: dict) -> str:
+        """
+        Creates statement that updates published tag and timestamp of every node of the $batch parameter, and
+        returns the ids of the rows whose node was found.
+        :param node_record:
+        :return:
+        """
+        template = Template("""
+            UNWIND ${{ BATCH }} AS {{ ROW }}
+            MATCH (node:{{ LABEL }} {key: {{ ROW }}.KEY})
+            SET {{ PROP_BODY }}
+            RETURN collect({{ ROW }}.id) AS ids
+        """)
+
+        return template.render(BATCH=UNWIND_BATCH_PARAM,
+                               ROW=UNWIND_ROW_VAR,
+                               LABEL=node_record[NODE_LABEL_KEY],
+                               PROP_BODY=', '.join(self._create_published_props('node')))
+
+    def create_relationship_touch_statement(self, rel_record: dict) -> str:
+        """
+        Creates statement that updates published tag and timestamp of every relation, and its reverse relation, of the
+        $batch parameter, and returns the ids of the rows whose relations were found.
+        :param rel_record:
+        :return:
+        """
+        template = Template("""
+            UNWIND ${{ BATCH }} AS {{ ROW }}
+            MATCH (n1:{{ START_LABEL }} {key: {{ ROW }}.START_KEY})-[r1:{{ TYPE }}]->
+                  (n2:{{ END_LABEL }} {key: {{ ROW }}.END_KEY})-[r2:{{ REVERSE_TYPE }}]->(n1)
+            SET {{ PROP_BODY }}
+            RETURN collect({{ ROW }}.id) AS ids
+        """)
+
+        return template.render(BATCH=UNWIND_BATCH_PARAM,
+                               ROW=UNWIND_ROW_VAR,
+                               START_LABEL=rel_record[RELATION_START_LABEL],
+                               END_LABEL=rel_record[RELATION_END_LABEL],
+                               TYPE=rel_record[RELATION_TYPE],
+                               REVERSE_TYPE=rel_record[RELATION_REVERSE_TYPE],
+                               PROP_BODY=', '.join(self._create_published_props('r1')
+                                                   + self._create_published_props('r2')))
+
     def _create_props_param(self, record_dict: dict) -> dict:
         params = {}
         for k, v in record_dict.items():
@@ -382,7 +858,8 @@ class Neo4jCsvPublisher(Publisher):
     def _create_props_body(self,
                            record_dict: dict,
                            excludes: Set,
-                           identifier: str) -> str:
+                           identifier: str,
+                           param_prefix: str = '$') -> str:
         """
         Creates properties body with params required for resolving template.
 
@@ -392,6 +869,7 @@ class Neo4jCsvPublisher(Publisher):
         :param record_dict: A dict represents CSV row
         :param excludes: set of excluded columns that does not need to be in properties (e.g: KEY, LABEL ...)
         :param identifier: identifier that will be used in CYPHER query as shown on above example
+        :param param_prefix: prefix to reference the value, '$' for a parameter or e.g. 'row.' for an UNWIND variable
         :return: Properties body for Cypher statement
         """
         props = []
@@ -402,42 +880,67 @@ class Neo4jCsvPublisher(Publisher):
             if k.endswith(UNQUOTED_SUFFIX):
                 k = k[:-len(UNQUOTED_SUFFIX)]
 
-            props.append(f'{identifier}.{k} = ${k}')
+            props.append(f'{identifier}.{k} = {param_prefix}{k}')
 
-        props.append(f"{identifier}.{PUBLISHED_TAG_PROPERTY_NAME} = '{self.publish_tag}'")
-        props.append(f"{identifier}.{LAST_UPDATED_EPOCH_MS} = timestamp()")
+        props.extend(self._create_published_props(identifier))
 
         return ', '.join(props)
 
+    def _create_published_props(self, identifier: str) -> List[str]:
+        """
+        :param identifier: identifier of the node or relation in the Cypher query
+        :return: Properties that mark the node or relation as published by this publisher
+        """
+        return [f"{identifier}.{PUBLISHED_TAG_PROPERTY_NAME} = '{self.publish_tag}'",
+                f"{identifier}.{LAST_UPDATED_EPOCH_MS} = timestamp()"]
+
     def _execute_statement(self,
                            stmt: str,
                            tx: Transaction,
                            params: dict = None,
-                           expect_result: bool = False) -> Transaction:
+                           expect_result: bool = False,
+                           count: int = 1,
+                           on_result: Optional[Callable[[Any], None]] = None) -> Transaction:
         """
         Executes statement against Neo4j. If execution fails, it rollsback and raise exception.
         If 'expect_result' flag is True, it confirms if result object is not null.
         :param stmt:
         :param tx:
-        :param count:
-        :param expect_result: By having this True, it will validate if result object is not None.
+        :param params:
+        :param expect_result: By having this True, it will validate if result object is not None. For an UNWIND
+        statement it validates that the returned count matches the number of rows.
+        :param count: Number of rows the statement covers. Greater than 1 for an UNWIND statement.
+        :param on_result: Called with the result of the statement before the transaction may be committed
         :return:
         """
         try:
             LOGGER.debug('Executing statement: %s with params %s', stmt, params)
 
             result = tx.run(str(stmt).encode('utf-8', 'ignore'), parameters=params)
-            if expect_result and not result.single():
-                raise RuntimeError(f'Failed to executed statement: {stmt}')
-
-            self._count += 1
-            if self._count > 1 and self._count % self._transaction_size == 0:
+            if expect_result:
+                record = result.single()
+                if not record or ('count' in record.keys() and record['count'] != count):
+                    raise RuntimeError(f'Failed to executed statement: {stmt}')
+            if on_result:
+                on_result(result)
+
+            with self._count_lock:
+                prev_count = self._count
+                self._count += count
+                total_count = self._count
+
+            # Commit frequency is based on the statements within the transaction of this thread
+            prev_tx_count = getattr(self._thread_local, 'count', 0)
+            tx_count = prev_tx_count + count
+            self._thread_local.count = tx_count
+            if tx_count > 1 and tx_count // self._transaction_size > prev_tx_count // self._transaction_size:
                 tx.commit()
-                LOGGER.info(f'Committed {self._count} statements so far')
-                return self._session.begin_transaction()
+                LOGGER.info(f'Committed {total_count} statements so far')
+                return self._get_session().begin_transaction()
 
-            if self._count > 1 and self._count % self._progress_report_frequency == 0:
-                LOGGER.info(f'Processed {self._count} statements so far')
+            if total_count > 1 and \
+                    total_count // self._progress_report_frequency > prev_count // self._progress_report_frequency:
+                LOGGER.info(f'Processed {total_count} statements so far')
 
             return tx
         except Exception as e:
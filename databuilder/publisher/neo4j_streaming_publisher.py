@@ -0,0 +1,119 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+import time
+from typing import List, Optional
+
+from neo4j import Transaction
+from pyhocon import ConfigFactory, ConfigTree
+
+from databuilder.loader.graph_streaming_loader import GraphStreamingLoader
+from databuilder.models.graph_relationship import GraphRelationship
+from databuilder.publisher.neo4j_csv_publisher import NODE_LABEL_KEY, Neo4jCsvPublisher
+from databuilder.serializers import neo4_serializer
+
+LOGGER = logging.getLogger(__name__)
+
+# Config keys
+# A boolean flag to publish the relations of a batch right after its nodes, instead of once all nodes are published.
+# Only for extractors whose records come with the nodes their relations point to, or with nodes that already exist.
+PUBLISH_RELATIONS_WITH_NODES = 'publish_relations_with_nodes'
+
+DEFAULT_CONFIG = ConfigFactory.from_dict({PUBLISH_RELATIONS_WITH_NODES: False})
+
+
+class Neo4jStreamingPublisher(Neo4jCsvPublisher):
+    """
+    A Publisher that publishes to Neo4j the nodes and relations handed by a GraphStreamingLoader, while the task that
+    loads them runs, instead of reading them from CSV files once the task is done. Extraction and publishing overlap,
+    and records are not serialized to CSV and parsed back, so their properties keep their types.
+
+    It takes the same configuration as Neo4jCsvPublisher, under the same scope, except for the file directories, and
+    publishes nodes and relations the same way, e.g. in UNWIND batches or with a change index. Files are published
+    by a single worker, in the order the records are loaded.
+
+    As a relation can only be merged once both of its nodes are, relations are kept in memory and published once all
+    nodes are, unless PUBLISH_RELATIONS_WITH_NODES is set.
+
+    As with Neo4jCsvPublisher, statements are committed in transactions of NEO4J_TRANSACTION_SIZE statements, so a
+    failed publish, e.g. as the task failed, leaves a partial graph behind. Publishing again completes it.
+
+    Usage:
+        loader = GraphStreamingLoader()
+        job = DefaultJob(conf=job_config,
+                         task=DefaultTask(extractor=extractor, loader=loader),
+                         publisher=Neo4jStreamingPublisher(loader))
+    """
+
+    def __init__(self, loader: GraphStreamingLoader) -> None:
+        super(Neo4jStreamingPublisher, self).__init__()
+        self._loader = loader
+
+    def init(self, conf: ConfigTree) -> None:
+        conf = conf.with_fallback(DEFAULT_CONFIG)
+        super(Neo4jStreamingPublisher, self).init(conf)
+        self._publish_relations_with_nodes = conf.get_bool(PUBLISH_RELATIONS_WITH_NODES)
+
+    def is_streaming(self) -> bool:
+        return True
+
+    def publish_impl(self) -> None:
+        """
+        Publishes the batches of the loader as they come, until the loader is closed. The transaction is rolled back
+        if the task fails, but what was committed before, every NEO4J_TRANSACTION_SIZE statements or before an index
+        is created, stays published.
+        :return:
+        """
+        start = time.time()
+        tx: Optional[Transaction] = None
+        try:
+            tx = self._session.begin_transaction()
+            relations: List[GraphRelationship] = []
+            for nodes, batch_relations in self._loader.iter_batches():
+                node_records = [neo4_serializer.serialize_node(node) for node in nodes]
+                tx = self._create_new_indices(node_records, tx)
+                tx = self._publish_node_records(node_records, tx=tx)
+
+                if self._publish_relations_with_nodes:
+                    tx = self._publish_relations(batch_relations, tx)
+                else:
+                    relations.extend(batch_relations)
+
+            LOGGER.info('Publishing %i relations', len(relations))
+            tx = self._publish_relations(relations, tx)
+
+            tx.commit()
+            LOGGER.info('Committed total %i statements', self._count)
+            LOGGER.info('Successfully published. Elapsed: %i seconds', time.time() - start)
+        except Exception as e:
+            LOGGER.exception('Failed to publish. Rolling back.')
+            self._loader.abort()
+            if tx is not None and not tx.closed():
+                tx.rollback()
+            raise e
+
+    def _create_new_indices(self, node_records: List[dict], tx: Transaction) -> Transaction:
+        """
+        Creates the unique index of the labels seen for the first time. The transaction is committed first, as the
+        creation of an index waits for the transactions writing nodes of its label.
+        :param node_records:
+        :param tx:
+        :return:
+        """
+        new_labels = {node_record[NODE_LABEL_KEY] for node_record in node_records} - self.labels
+        if not new_labels:
+            return tx
+
+        tx.commit()
+        for label in sorted(new_labels):
+            self._try_create_index(label)
+            self.labels.add(label)
+        self._thread_local.count = 0
+        return self._session.begin_transaction()
+
+    def _publish_relations(self, relations: List[GraphRelationship], tx: Transaction) -> Transaction:
+        rel_records = [neo4_serializer.serialize_relationship(relation) for relation in relations]
+        if self._relation_preprocessor.is_perform_preprocess():
+            tx = self._preprocess_relation(rel_records, tx=tx)
+        return self._publish_relation_records(rel_records, tx=tx)
@@ -2,15 +2,23 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import datetime
+import gzip
+import hashlib
 import logging
 import os
+import shutil
+import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from os import listdir
 from os.path import isfile, join
-from typing import List, Tuple
+from typing import (
+    IO, Any, List, Optional, Tuple,
+)
 
 from amundsen_gremlin.neptune_bulk_loader.api import NeptuneBulkLoaderApi, NeptuneBulkLoaderLoadStatusErrorLogEntry
 from boto3.session import Session
+from botocore.exceptions import ClientError
 from pyhocon import ConfigTree
 
 from databuilder.publisher.base_publisher import Publisher
@@ -29,6 +37,19 @@ class NeptuneCSVPublisher(Publisher):
     which is a client for the the api found
     https://docs.aws.amazon.com/neptune/latest/userguide/bulk-load.html
     https://docs.aws.amazon.com/neptune/latest/userguide/bulk-load-tutorial-format-gremlin.html
+
+    Files are uploaded by UPLOAD_WORKER_COUNT concurrent uploads, each of them being a multipart upload for large
+    files. With COMPRESS, files are gzipped on upload, which the bulk loader reads as is.
+    With SKIP_UNCHANGED_FILES, the SHA-256 of a file is stored along with its S3 object, and a file is not uploaded
+    again if the object of the same key has the same hash. As the S3 folder is named after the time of the publish by
+    default, set S3_FOLDER_NAME (e.g. to the execution date of the job) for a rerun to skip the files that are
+    already uploaded.
+
+    The status of a load is polled every STATUS_POLLING_PERIOD seconds at first, and less and less often, up to every
+    MAX_STATUS_POLLING_PERIOD seconds, for as long as the status doesn't change.
+    With LOAD_BATCH_FILE_COUNT, files are split into batches of that many files, node files before relation files,
+    each batch being uploaded to its own S3 folder and loaded by its own bulk load. Each load is queued as soon as its
+    batch is uploaded and depends on the previous one, so that Neptune loads a batch while the next one is uploaded.
     """
 
     # A directory that contains CSV files for nodes
@@ -53,6 +74,23 @@ class NeptuneCSVPublisher(Publisher):
 
     FAIL_ON_ERROR = "fail_on_error"
     STATUS_POLLING_PERIOD = "status_polling_period"
+    MAX_STATUS_POLLING_PERIOD = "max_status_polling_period"
+    # Number of files of a bulk load. All files are loaded by a single bulk load if 0
+    LOAD_BATCH_FILE_COUNT = "load_batch_file_count"
+
+    # Name of the S3 folder the files are uploaded to, within AWS_BASE_S3_DATA_PATH. Defaults to the current time.
+    S3_FOLDER_NAME = "s3_folder_name"
+    # Number of files uploaded concurrently
+    UPLOAD_WORKER_COUNT = "upload_worker_count"
+    # If True, files are gzipped on upload
+    COMPRESS = "compress"
+    # If True, files already uploaded to the same S3 key with the same content are not uploaded again
+    SKIP_UNCHANGED_FILES = "skip_unchanged_files"
+
+    # S3 object metadata holding the SHA-256 of the content of the file
+    CONTENT_HASH_METADATA = 'content-sha256'
+    # Size above which a compressed file is spooled to disk rather than memory
+    MAX_IN_MEMORY_COMPRESSED_BYTES = 64 * 1024 * 1024
 
     def __init__(self) -> None:
         super(NeptuneCSVPublisher, self).__init__()
@@ -85,35 +123,35 @@ class NeptuneCSVPublisher(Publisher):
         self.base_amundsen_data_path = conf.get_string(NeptuneCSVPublisher.AWS_BASE_S3_DATA_PATH)
         self.fail_on_error = conf.get_bool(NeptuneCSVPublisher.FAIL_ON_ERROR, default=False)
         self.status_polling_period = conf.get_int(NeptuneCSVPublisher.STATUS_POLLING_PERIOD, default=5)
+        self.max_status_polling_period = conf.get_int(NeptuneCSVPublisher.MAX_STATUS_POLLING_PERIOD,
+                                                      default=max(self.status_polling_period, 60))
+        self.load_batch_file_count = conf.get_int(NeptuneCSVPublisher.LOAD_BATCH_FILE_COUNT, default=0)
+        self.s3_folder_name = conf.get_string(NeptuneCSVPublisher.S3_FOLDER_NAME, default=None)
+        self.upload_worker_count = conf.get_int(NeptuneCSVPublisher.UPLOAD_WORKER_COUNT, default=1)
+        self.compress = conf.get_bool(NeptuneCSVPublisher.COMPRESS, default=False)
+        self.skip_unchanged_files = conf.get_bool(NeptuneCSVPublisher.SKIP_UNCHANGED_FILES, default=False)
+        # boto3 clients, unlike sessions, can be shared by threads
+        self._s3_client: Any = None
 
     def publish_impl(self) -> None:
         if not self._is_upload_required():
             return
 
-        datetime_portion = datetime.datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
+        datetime_portion = self.s3_folder_name or datetime.datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
         s3_folder_location = "{base_directory}/{datetime_portion}".format(
             base_directory=self.base_amundsen_data_path,
             datetime_portion=datetime_portion,
         )
 
-        self.upload_files(s3_folder_location)
+        if self.load_batch_file_count > 0:
+            load_ids = self._upload_and_load_in_batches(s3_folder_location)
+        else:
+            self.upload_files(s3_folder_location)
+            load_ids = [self._load(s3_folder_location, dependencies=[])]
 
-        bulk_upload_response = self.neptune_api_client.load(
-            s3_object_key=s3_folder_location,
-            failOnError=self.fail_on_error
-        )
-
-        try:
-            load_id = bulk_upload_response['payload']['loadId']
-        except KeyError:
-            raise Exception("Failed to load csv. Response: {0}".format(str(bulk_upload_response)))
-
-        load_status = "LOAD_NOT_STARTED"
         all_errors: List[NeptuneBulkLoaderLoadStatusErrorLogEntry] = []
-        while load_status in ("LOAD_IN_PROGRESS", "LOAD_NOT_STARTED", "LOAD_IN_QUEUE"):
-            time.sleep(self.status_polling_period)
-            load_status, errors = self._poll_status(load_id)
-            all_errors.extend(errors)
+        for load_id in load_ids:
+            all_errors.extend(self._wait_for_load(load_id))
 
         for error in all_errors:
             exception_message = """
@@ -127,6 +165,71 @@ class NeptuneCSVPublisher(Publisher):
             )
             LOGGER.exception(exception_message)
 
+    def _upload_and_load_in_batches(self, s3_folder_location: str) -> List[str]:
+        """
+        Uploads batches of LOAD_BATCH_FILE_COUNT files to their own S3 folders, queuing the load of a batch once it's
+        uploaded, depending on the load of the previous batch.
+        :param s3_folder_location:
+        :return: Ids of the loads, in the order they were queued
+        """
+        batches: List[List[str]] = []
+        for file_paths in (self._list_files(self.node_files_dir), self._list_files(self.relation_files_dir)):
+            batches.extend(file_paths[i:i + self.load_batch_file_count]
+                           for i in range(0, len(file_paths), self.load_batch_file_count))
+
+        load_ids: List[str] = []
+        for i, file_paths in enumerate(batches):
+            batch_folder_location = "{s3_folder_location}/{batch:04d}".format(
+                s3_folder_location=s3_folder_location,
+                batch=i
+            )
+            self.upload_files(batch_folder_location, file_paths=file_paths)
+            load_ids.append(self._load(batch_folder_location, dependencies=load_ids[-1:]))
+            LOGGER.info('Queued load %s of batch %i of %i', load_ids[-1], i + 1, len(batches))
+        return load_ids
+
+    def _load(self, s3_object_key: str, dependencies: List[str]) -> str:
+        """
+        Queues a bulk load of the S3 folder.
+        :param s3_object_key:
+        :param dependencies: Ids of the loads that need to succeed before this one starts
+        :return: Id of the load
+        """
+        bulk_upload_response = self.neptune_api_client.load(
+            s3_object_key=s3_object_key,
+            failOnError=self.fail_on_error,
+            queueRequest=True,
+            dependencies=dependencies
+        )
+
+        try:
+            return bulk_upload_response['payload']['loadId']
+        except KeyError:
+            raise Exception("Failed to load csv. Response: {0}".format(str(bulk_upload_response)))
+
+    def _wait_for_load(self, load_id: str) -> List[NeptuneBulkLoaderLoadStatusErrorLogEntry]:
+        """
+        Polls the status of the load until it's done. The polling period doubles, up to MAX_STATUS_POLLING_PERIOD,
+        while the status stays the same, and is reset when it changes.
+        :param load_id:
+        :return: Errors of the load
+        """
+        polling_period = self.status_polling_period
+        load_status = "LOAD_NOT_STARTED"
+        all_errors: List[NeptuneBulkLoaderLoadStatusErrorLogEntry] = []
+        while load_status in ("LOAD_IN_PROGRESS", "LOAD_NOT_STARTED", "LOAD_IN_QUEUE"):
+            time.sleep(polling_period)
+            previous_load_status = load_status
+            load_status, errors = self._poll_status(load_id)
+            all_errors.extend(errors)
+            if load_status == previous_load_status:
+                polling_period = min(polling_period * 2, self.max_status_polling_period)
+            else:
+                polling_period = self.status_polling_period
+
+        LOGGER.info('Load %s finished with status %s', load_id, load_status)
+        return all_errors
+
     def _poll_status(self, load_id: str) -> Tuple[str, List[NeptuneBulkLoaderLoadStatusErrorLogEntry]]:
         load_status_response = self.neptune_api_client.load_status(
             load_id=load_id,
@@ -143,33 +246,115 @@ class NeptuneCSVPublisher(Publisher):
         return load_status, load_status_payload.get('errors', {}).get('errorLogs', [])
 
     def _get_file_paths(self) -> List[str]:
-        node_names = [
-            join(self.node_files_dir, f) for f in listdir(self.node_files_dir)
-            if isfile(join(self.node_files_dir, f))
-        ]
-        edge_names = [
-            join(self.relation_files_dir, f) for f in listdir(self.relation_files_dir)
-            if isfile(join(self.relation_files_dir, f))
-        ]
-        return node_names + edge_names
+        return self._list_files(self.node_files_dir) + self._list_files(self.relation_files_dir)
+
+    @staticmethod
+    def _list_files(directory: str) -> List[str]:
+        return sorted(join(directory, f) for f in listdir(directory) if isfile(join(directory, f)))
 
     def _is_upload_required(self) -> bool:
         file_names = self._get_file_paths()
         return len(file_names) > 0
 
-    def upload_files(self, s3_folder_location: str) -> None:
-        file_paths = self._get_file_paths()
-        for file_location in file_paths:
+    def upload_files(self, s3_folder_location: str, file_paths: Optional[List[str]] = None) -> None:
+        """
+        :param s3_folder_location:
+        :param file_paths: Files to upload. All node and relation files if not given
+        :return:
+        """
+        if file_paths is None:
+            file_paths = self._get_file_paths()
+        if self.upload_worker_count <= 1 and not self.compress and not self.skip_unchanged_files:
+            for file_location in file_paths:
+                self._upload_file(file_location, s3_folder_location)
+            return
+
+        if self._s3_client is None:
+            self._s3_client = self._boto_session.client('s3')
+
+        start = time.time()
+        uploaded_count = 0
+        with ThreadPoolExecutor(max_workers=self.upload_worker_count) as executor:
+            futures = [executor.submit(self._upload_file, file_location, s3_folder_location)
+                       for file_location in file_paths]
+            try:
+                for future in as_completed(futures):
+                    uploaded_count += 1 if future.result() else 0
+            except Exception as e:
+                LOGGER.exception('Failed to upload files. Cancelling pending uploads.')
+                for future in futures:
+                    future.cancel()
+                raise e
+
+        LOGGER.info('Uploaded %i files, skipped %i unchanged files, in %.1f seconds',
+                    uploaded_count, len(file_paths) - uploaded_count, time.time() - start)
+
+    def _upload_file(self, file_location: str, s3_folder_location: str) -> bool:
+        """
+        Uploads a file to the S3 folder, gzipped if COMPRESS, unless it's unchanged and SKIP_UNCHANGED_FILES.
+        :param file_location:
+        :param s3_folder_location:
+        :return: True if the file was uploaded
+        """
+        file_name = os.path.basename(file_location)
+        s3_object_key = "{s3_folder_location}/{file_name}{extension}".format(
+            s3_folder_location=s3_folder_location,
+            file_name=file_name,
+            extension='.gz' if self.compress else ''
+        )
+        if self._s3_client is None:
             with open(file_location, 'rb') as file_csv:
-                file_name = os.path.basename(file_location)
-                s3_object_key = "{s3_folder_location}/{file_name}".format(
-                    s3_folder_location=s3_folder_location,
-                    file_name=file_name
-                )
                 self.neptune_api_client.upload(
                     f=file_csv,
                     s3_object_key=s3_object_key
                 )
+            return True
+
+        extra_args = {}
+        if self.skip_unchanged_files:
+            content_hash = self._get_content_hash(file_location)
+            if self._get_uploaded_content_hash(s3_object_key) == content_hash:
+                LOGGER.info('Skipping upload of unchanged %s', file_location)
+                return False
+            extra_args['Metadata'] = {NeptuneCSVPublisher.CONTENT_HASH_METADATA: content_hash}
+
+        with self._open_for_upload(file_location) as file_csv:
+            self._s3_client.upload_fileobj(file_csv, self.bucket_name, s3_object_key, ExtraArgs=extra_args,
+                                           Config=self.neptune_api_client.s3_transfer_config)
+        return True
+
+    def _open_for_upload(self, file_location: str) -> IO[bytes]:
+        """
+        Opens the file, or a gzipped copy of it if COMPRESS. The copy is spooled to a temporary file if large.
+        """
+        if not self.compress:
+            return open(file_location, 'rb')
+
+        compressed = tempfile.SpooledTemporaryFile(max_size=NeptuneCSVPublisher.MAX_IN_MEMORY_COMPRESSED_BYTES)
+        with open(file_location, 'rb') as file_csv, gzip.GzipFile(fileobj=compressed, mode='wb') as gzip_file:
+            shutil.copyfileobj(file_csv, gzip_file)
+        compressed.seek(0)
+        return compressed
+
+    def _get_uploaded_content_hash(self, s3_object_key: str) -> Optional[str]:
+        """
+        :return: Hash of the content of the object of the key, None if there's no such object
+        """
+        try:
+            response = self._s3_client.head_object(Bucket=self.bucket_name, Key=s3_object_key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise e
+        return response.get('Metadata', {}).get(NeptuneCSVPublisher.CONTENT_HASH_METADATA)
+
+    @staticmethod
+    def _get_content_hash(file_location: str) -> str:
+        sha256 = hashlib.sha256()
+        with open(file_location, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+        return sha256.hexdigest()
 
     def get_scope(self) -> str:
         return 'publisher.neptune_csv_publisher'
@@ -0,0 +1,43 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+from typing import (
+    Any, Dict, Iterator, List,
+)
+
+from databuilder.utils import parquet
+
+
+class ParquetRecordReader(object):
+    """
+    Reads the records of a Parquet file as dicts, one record batch at a time, with the types of the columns of the
+    file instead of types inferred from text. Requires pyarrow.
+    """
+
+    def __init__(self, batch_size: int = 10000) -> None:
+        """
+        :param batch_size: Maximum number of records read at once by read
+        """
+        self._pyarrow = parquet.import_pyarrow()
+        self._batch_size = batch_size
+
+    def read(self, path: str) -> Iterator[Dict[str, Any]]:
+        """
+        :param path: Path of a Parquet file
+        :return: Iterator of records of the file
+        """
+        for batch in self.read_batches(path, self._batch_size):
+            yield from batch
+
+    def read_batches(self, path: str, batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+        """
+        :param path: Path of a Parquet file
+        :param batch_size: Maximum number of records of a batch
+        :return: Iterator of lists of records of the file
+        """
+        parquet_file = self._pyarrow.parquet.ParquetFile(path)
+        try:
+            for record_batch in parquet_file.iter_batches(batch_size=batch_size):
+                yield record_batch.to_pylist()
+        finally:
+            parquet_file.close()
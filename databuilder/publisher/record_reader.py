@@ -0,0 +1,53 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+from typing import (
+    Any, Dict, Iterator, List, Optional,
+)
+
+from databuilder.publisher.csv_record_reader import CsvRecordReader
+from databuilder.publisher.parquet_record_reader import ParquetRecordReader
+from databuilder.utils import parquet
+
+
+class RecordReader(object):
+    """
+    Reads the records of the files written by the loaders, with ParquetRecordReader for Parquet files and with
+    CsvRecordReader for any other file.
+    """
+
+    def __init__(self, type_inference_rows: int = 10000) -> None:
+        """
+        :param type_inference_rows: Number of records of a CSV file buffered, so that smaller files are only read once
+        """
+        self._csv_reader = CsvRecordReader(type_inference_rows=type_inference_rows)
+        # Created on the first Parquet file, as it requires pyarrow
+        self._parquet_reader: Optional[ParquetRecordReader] = None
+
+    def read(self, path: str) -> Iterator[Dict[str, Any]]:
+        """
+        :param path: Path of a CSV or Parquet file
+        :return: Iterator of records of the file
+        """
+        if self._is_parquet(path):
+            return self._get_parquet_reader().read(path)
+        return self._csv_reader.read(path)
+
+    def read_batches(self, path: str, batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+        """
+        :param path: Path of a CSV or Parquet file
+        :param batch_size: Maximum number of records of a batch
+        :return: Iterator of lists of records of the file
+        """
+        if self._is_parquet(path):
+            return self._get_parquet_reader().read_batches(path, batch_size)
+        return self._csv_reader.read_batches(path, batch_size)
+
+    @staticmethod
+    def _is_parquet(path: str) -> bool:
+        return path.endswith(parquet.EXTENSIONS[parquet.PARQUET])
+
+    def _get_parquet_reader(self) -> ParquetRecordReader:
+        if self._parquet_reader is None:
+            self._parquet_reader = ParquetRecordReader()
+        return self._parquet_reader
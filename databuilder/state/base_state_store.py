@@ -0,0 +1,58 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+import abc
+from typing import Any, Optional
+
+from databuilder import Scoped
+from databuilder.callback.call_back import Callback
+
+
+class StateStore(Scoped, Callback):
+    """
+    A store of state that is kept between runs of a job, e.g. the watermark of an incremental extraction.
+    Values put into the store are staged and only persisted on commit(). Registered as a callback of the publisher,
+    the state is committed once the publisher succeeds and discarded if it fails, so that a failed run is retried
+    from the previous state.
+    """
+
+    @abc.abstractmethod
+    def get(self, key: str, default: Optional[Any] = None) -> Any:
+        """
+        :param key:
+        :param default: Value returned if there's no value for the key
+        :return: Value for the key, staged or persisted. Values are JSON serializable.
+        """
+        return None
+
+    @abc.abstractmethod
+    def put(self, key: str, value: Any) -> None:
+        """
+        Stages a value until commit()
+        :param key:
+        :param value: JSON serializable value
+        :return: None
+        """
+        pass
+
+    @abc.abstractmethod
+    def commit(self) -> None:
+        """
+        Persists the staged values
+        :return: None
+        """
+        pass
+
+    @abc.abstractmethod
+    def rollback(self) -> None:
+        """
+        Discards the staged values
+        :return: None
+        """
+        pass
+
+    def on_success(self) -> None:
+        self.commit()
+
+    def on_failure(self) -> None:
+        self.rollback()
@@ -0,0 +1,66 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import logging
+import os
+from typing import (
+    Any, Dict, Optional,
+)
+
+from pyhocon import ConfigTree
+
+from databuilder.state.base_state_store import StateStore
+
+LOGGER = logging.getLogger(__name__)
+
+
+class FsStateStore(StateStore):
+    """
+    A StateStore that keeps the state in a JSON file on local disk. The file is replaced atomically on commit, so
+    a job failing while committing leaves the previous state intact.
+    """
+    # Config keys
+    STATE_FILE_PATH = 'state_file_path'
+
+    def init(self, conf: ConfigTree) -> None:
+        self._state_file_path = conf.get_string(FsStateStore.STATE_FILE_PATH)
+        self._state: Dict[str, Any] = {}
+        self._staged: Dict[str, Any] = {}
+
+        if os.path.exists(self._state_file_path):
+            with open(self._state_file_path, 'r', encoding='utf8') as state_file:
+                self._state = json.load(state_file)
+        LOGGER.info('Loaded %i state entries from %s', len(self._state), self._state_file_path)
+
+    def get(self, key: str, default: Optional[Any] = None) -> Any:
+        if key in self._staged:
+            return self._staged[key]
+        return self._state.get(key, default)
+
+    def put(self, key: str, value: Any) -> None:
+        self._staged[key] = value
+
+    def commit(self) -> None:
+        if not self._staged:
+            return
+
+        state = dict(self._state, **self._staged)
+        state_dir = os.path.dirname(os.path.abspath(self._state_file_path))
+        os.makedirs(state_dir, exist_ok=True)
+
+        tmp_file_path = f'{self._state_file_path}.tmp'
+        with open(tmp_file_path, 'w', encoding='utf8') as state_file:
+            json.dump(state, state_file)
+        os.replace(tmp_file_path, self._state_file_path)
+
+        LOGGER.info('Committed %i state entries to %s', len(self._staged), self._state_file_path)
+        self._state = state
+        self._staged = {}
+
+    def rollback(self) -> None:
+        LOGGER.info('Discarding %i staged state entries', len(self._staged))
+        self._staged = {}
+
+    def get_scope(self) -> str:
+        return 'state_store.fs'
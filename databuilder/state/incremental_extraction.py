@@ -0,0 +1,80 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+from typing import (
+    Iterable, List, Optional, Set,
+)
+
+from databuilder.state.base_state_store import StateStore
+
+LOGGER = logging.getLogger(__name__)
+
+
+class IncrementalExtraction(object):
+    """
+    Keeps track of an incremental extraction of the tables of a source, using the time that tables were last altered
+    as a watermark.
+    The extractor only fetches tables altered after the watermark, records every table it extracts and, once done,
+    lists all tables of the source. The new watermark is the latest alteration time seen, and the tables that exist
+    but were not extracted are recorded as untouched so that staleness removal can keep them.
+    Both are staged in the state store, and only persisted once the state store commits.
+    """
+    WATERMARK_KEY_FORMAT = '{source}.watermark'
+    UNTOUCHED_TABLE_KEYS_KEY_FORMAT = '{source}.untouched_table_keys'
+
+    def __init__(self, state_store: StateStore, source: str) -> None:
+        """
+        :param state_store: An initialized state store
+        :param source: Identifies the source, and the set of tables extracted from it, in the state store
+        """
+        self._state_store = state_store
+        self._source = source
+        self._watermark: Optional[int] = state_store.get(
+            IncrementalExtraction.WATERMARK_KEY_FORMAT.format(source=source))
+        self._latest_altered = self._watermark
+        self._extracted_table_keys: Set[str] = set()
+        LOGGER.info('Watermark of %s: %s', source, self._watermark)
+
+    @property
+    def watermark(self) -> Optional[int]:
+        """
+        :return: Latest alteration time, in epoch, seen in the previous run. None if all tables need to be extracted.
+        """
+        return self._watermark
+
+    def record_table(self, table_key: str, last_altered: Optional[int]) -> None:
+        """
+        Records a table that has been extracted
+        :param table_key: Key of the table, e.g. TableMetadata.TABLE_KEY_FORMAT
+        :param last_altered: Time, in epoch, that the table was last altered
+        :return: None
+        """
+        self._extracted_table_keys.add(table_key)
+        if last_altered is not None and (self._latest_altered is None or last_altered > self._latest_altered):
+            self._latest_altered = last_altered
+
+    def finish(self, table_keys: Iterable[str]) -> None:
+        """
+        Stages the new watermark and the untouched tables in the state store
+        :param table_keys: Keys of all tables of the source, extracted or not
+        :return: None
+        """
+        untouched_table_keys = sorted(set(table_keys) - self._extracted_table_keys)
+        LOGGER.info('Extracted %i tables of %s, %i tables are untouched since %s',
+                    len(self._extracted_table_keys), self._source, len(untouched_table_keys), self._watermark)
+
+        self._state_store.put(IncrementalExtraction.UNTOUCHED_TABLE_KEYS_KEY_FORMAT.format(source=self._source),
+                              untouched_table_keys)
+        if self._latest_altered is not None:
+            self._state_store.put(IncrementalExtraction.WATERMARK_KEY_FORMAT.format(source=self._source),
+                                  self._latest_altered)
+
+    @staticmethod
+    def get_untouched_table_keys(state_store: StateStore, source: str) -> List[str]:
+        """
+        :param state_store: An initialized state store
+        :param source:
+        :return: Keys of the tables that were not extracted in the last run of the source as they had not changed
+        """
+        return state_store.get(IncrementalExtraction.UNTOUCHED_TABLE_KEYS_KEY_FORMAT.format(source=source), [])
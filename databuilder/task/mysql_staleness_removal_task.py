@@ -4,13 +4,15 @@
 import logging
 import time
 from typing import (
-    Any, Dict, Set, Type,
+    Any, Dict, List, Set, Type,
 )
 
 from amundsen_rds.models import RDSModel
 from amundsen_rds.models.base import Base
 from pyhocon import ConfigFactory, ConfigTree
-from sqlalchemy import create_engine, func
+from sqlalchemy import (
+    create_engine, func, tuple_,
+)
 from sqlalchemy.orm import sessionmaker
 
 from databuilder import Scoped
@@ -29,6 +31,9 @@ class MySQLStalenessRemovalTask(Task):
     Note: This task performs a cascade delete and will delete all the orphan records in the child tables of the stale
     records.
 
+    When DELETE_BATCH_SIZE is set, stale records of a table are not deleted with a single DELETE statement, which holds
+    locks on the whole table for as long as it runs. Primary keys of stale records are walked in order instead, and
+    deleted in batches of DELETE_BATCH_SIZE records, each in its own transaction, with an optional pause in between.
     """
     # Connection string
     CONN_STRING = "conn_string"
@@ -48,12 +53,18 @@ class MySQLStalenessRemovalTask(Task):
     # Using this milliseconds and published timestamp to determine staleness
     MS_TO_EXPIRE = "milliseconds_to_expire"
     MIN_MS_TO_EXPIRE = "minimum_milliseconds_to_expire"
+    # Number of stale records deleted per transaction. If 0, the stale records of a table are deleted at once.
+    DELETE_BATCH_SIZE = "delete_batch_size"
+    # Milliseconds to sleep between two batches of deletion, to throttle the load on the database
+    DELETE_BATCH_SLEEP_MS = "delete_batch_sleep_ms"
 
     _DEFAULT_CONFIG = ConfigFactory.from_dict({STALENESS_MAX_PCT: 5,
                                               TARGET_TABLES: [],
                                               STALENESS_PCT_MAX_DICT: {},
                                               MIN_MS_TO_EXPIRE: 86400000,
                                               DRY_RUN: False,
+                                              DELETE_BATCH_SIZE: 0,
+                                              DELETE_BATCH_SLEEP_MS: 0,
                                               ENGINE_ECHO: False})
 
     def get_scope(self) -> str:
@@ -68,6 +79,8 @@ class MySQLStalenessRemovalTask(Task):
         self.dry_run = conf.get_bool(MySQLStalenessRemovalTask.DRY_RUN)
         self.staleness_max_pct = conf.get_int(MySQLStalenessRemovalTask.STALENESS_MAX_PCT)
         self.staleness_max_pct_dict = conf.get(MySQLStalenessRemovalTask.STALENESS_PCT_MAX_DICT)
+        self.delete_batch_size = conf.get_int(MySQLStalenessRemovalTask.DELETE_BATCH_SIZE)
+        self.delete_batch_sleep_ms = conf.get_int(MySQLStalenessRemovalTask.DELETE_BATCH_SLEEP_MS)
 
         if MySQLStalenessRemovalTask.PUBLISHED_TAG in conf and MySQLStalenessRemovalTask.MS_TO_EXPIRE in conf:
             raise Exception(f'Cannot have both {MySQLStalenessRemovalTask.PUBLISHED_TAG} and '
@@ -159,6 +172,10 @@ class MySQLStalenessRemovalTask(Task):
         return staleness_pct
 
     def _delete_stale_records(self, target_model_class: Type[RDSModel]) -> None:
+        if self.delete_batch_size > 0:
+            self._delete_stale_records_in_batches(target_model_class=target_model_class)
+            return
+
         target_table = target_model_class.__tablename__
         try:
             deleted_records_count = self._session.query(target_model_class).filter(
@@ -169,6 +186,66 @@ class MySQLStalenessRemovalTask(Task):
             LOGGER.exception(f'Failed to delete stale records for {target_table}')
             raise e
 
+    def _delete_stale_records_in_batches(self, target_model_class: Type[RDSModel]) -> None:
+        """
+        Walks the primary keys of stale records in order, and deletes them in batches of delete_batch_size records,
+        committing each batch.
+        :param target_model_class:
+        :return:
+        """
+        target_table = target_model_class.__tablename__
+        primary_key_columns = list(target_model_class.__table__.primary_key.columns)
+        primary_key = primary_key_columns[0] if len(primary_key_columns) == 1 else tuple_(*primary_key_columns)
+        # The condition is computed once, so that the cutoff time does not move while walking the table
+        filter_condition = self._get_stale_records_filter_condition(target_model_class=target_model_class)
+
+        start = time.time()
+        deleted_records_count = 0
+        last_key = None
+        try:
+            while True:
+                query = self._session.query(*primary_key_columns).filter(filter_condition)
+                if last_key is not None:
+                    query = query.filter(primary_key > last_key)
+                keys = self._get_keys(query.order_by(*primary_key_columns).limit(self.delete_batch_size).all(),
+                                      len(primary_key_columns))
+                if not keys:
+                    break
+
+                deleted_records_count += self._session.query(target_model_class) \
+                    .filter(primary_key.in_(keys)) \
+                    .delete(synchronize_session=False)
+                self._session.commit()
+                last_key = keys[-1]
+
+                elapsed = time.time() - start
+                LOGGER.info(f'Deleted {deleted_records_count} record(s) of {target_table} so far '
+                            f'({deleted_records_count / max(elapsed, 0.001):.1f} records/s)')
+                if len(keys) < self.delete_batch_size:
+                    break
+                if self.delete_batch_sleep_ms > 0:
+                    time.sleep(self.delete_batch_sleep_ms / 1000)
+        except Exception as e:
+            LOGGER.exception(f'Failed to delete stale records for {target_table} '
+                             f'after deleting {deleted_records_count} record(s)')
+            raise e
+
+        elapsed = time.time() - start
+        LOGGER.info(f'Deleted {deleted_records_count} record(s) of {target_table} in {elapsed:.1f} seconds '
+                    f'({deleted_records_count / max(elapsed, 0.001):.1f} records/s)')
+
+    @staticmethod
+    def _get_keys(rows: List[Any], primary_key_column_count: int) -> List[Any]:
+        """
+        Returns primary keys of the rows, as values for a single column primary key and as tuples otherwise
+        :param rows:
+        :param primary_key_column_count:
+        :return:
+        """
+        if primary_key_column_count == 1:
+            return [row[0] for row in rows]
+        return [tuple(row) for row in rows]
+
     def _get_stale_records_filter_condition(self, target_model_class: Type[RDSModel]) -> Any:
         """
         Return the appropriate stale records filter condition depending on which field is used to expire stale data.
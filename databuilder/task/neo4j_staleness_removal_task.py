@@ -4,16 +4,23 @@
 import logging
 import textwrap
 import time
+from concurrent.futures import (
+    Future, ThreadPoolExecutor, as_completed,
+)
 from typing import (
-    Any, Dict, Iterable,
+    Any, Dict, Iterable, List, Optional,
 )
 
 import neo4j
 from neo4j import GraphDatabase
+from neo4j.exceptions import TransientError
 from pyhocon import ConfigFactory, ConfigTree
 
 from databuilder import Scoped
+from databuilder.models.table_metadata import DescriptionMetadata, TableMetadata
 from databuilder.publisher.neo4j_csv_publisher import JOB_PUBLISH_TAG
+from databuilder.state.base_state_store import StateStore
+from databuilder.state.incremental_extraction import IncrementalExtraction
 from databuilder.task.base_task import Task
 
 # A end point for Neo4j e.g: bolt://localhost:9999
@@ -37,6 +44,15 @@ STALENESS_PCT_MAX_DICT = "staleness_max_pct_dict"
 # Using this milliseconds and published timestamp to determine staleness
 MS_TO_EXPIRE = "milliseconds_to_expire"
 MIN_MS_TO_EXPIRE = "minimum_milliseconds_to_expire"
+# Sources extracted incrementally. Tables of these sources that were untouched by the extraction, as they had not
+# changed, are kept along with the nodes derived from them and the relations published with them.
+# Requires a state store.
+UNTOUCHED_TABLES_SOURCES = "untouched_tables_sources"
+# If True, ids of the stale nodes (or relations) of each target are collected first, and then deleted by id in batches
+# of BATCH_SIZE, with targets processed concurrently
+DELETE_BY_ID = "delete_by_id"
+# Number of targets whose stale data is deleted concurrently, when deleting by id
+DELETE_WORKER_COUNT = "delete_worker_count"
 
 DEFAULT_CONFIG = ConfigFactory.from_dict({BATCH_SIZE: 100,
                                           NEO4J_MAX_CONN_LIFE_TIME_SEC: 50,
@@ -46,6 +62,9 @@ DEFAULT_CONFIG = ConfigFactory.from_dict({BATCH_SIZE: 100,
                                           TARGET_NODES: [],
                                           TARGET_RELATIONS: [],
                                           STALENESS_PCT_MAX_DICT: {},
+                                          UNTOUCHED_TABLES_SOURCES: [],
+                                          DELETE_BY_ID: False,
+                                          DELETE_WORKER_COUNT: 4,
                                           MIN_MS_TO_EXPIRE: 86400000,
                                           DRY_RUN: False})
 
@@ -53,6 +72,10 @@ LOGGER = logging.getLogger(__name__)
 
 MARKER_VAR_NAME = 'marker'
 
+# transient error retries and sleep time, when deleting by id
+RETRIES_NUMBER = 5
+SLEEP_TIME = 2
+
 
 class Neo4jStalenessRemovalTask(Task):
     """
@@ -62,10 +85,21 @@ class Neo4jStalenessRemovalTask(Task):
     Not all resource is being published by Neo4jCsvPublisher and you can only set specific LABEL of the node or TYPE
     of relation to perform this deletion.
 
+    Tables that were not extracted because they had not changed since the previous run are not published either. With
+    a state store and the incrementally extracted sources configured, these tables, along with their columns,
+    descriptions and relations, are marked as published in this run before looking for stale data.
+
+    By default, stale data of a label (or type) is deleted by repeating a query that matches a batch of stale data
+    until there's none left, which scans the label again on every batch. With DELETE_BY_ID, the ids of the stale data
+    of a label are collected in a single pass instead, and deleted by id in batches. Labels are processed concurrently
+    by DELETE_WORKER_COUNT workers, nodes first and then relations, and progress is reported per label.
     """
 
-    def __init__(self) -> None:
-        pass
+    def __init__(self, state_store: Optional[StateStore] = None) -> None:
+        """
+        :param state_store: State store the untouched tables are read from
+        """
+        self._state_store = state_store
 
     def get_scope(self) -> str:
         return 'task.remove_stale_data'
@@ -80,6 +114,8 @@ class Neo4jStalenessRemovalTask(Task):
         self.dry_run = conf.get_bool(DRY_RUN)
         self.staleness_pct = conf.get_int(STALENESS_MAX_PCT)
         self.staleness_pct_dict = conf.get(STALENESS_PCT_MAX_DICT)
+        self.delete_by_id = conf.get_bool(DELETE_BY_ID)
+        self.delete_worker_count = conf.get_int(DELETE_WORKER_COUNT)
 
         if JOB_PUBLISH_TAG in conf and MS_TO_EXPIRE in conf:
             raise Exception(f'Cannot have both {JOB_PUBLISH_TAG} and {MS_TO_EXPIRE} in job config')
@@ -93,6 +129,17 @@ class Neo4jStalenessRemovalTask(Task):
         else:
             self.marker = conf.get_string(JOB_PUBLISH_TAG)
 
+        self.untouched_table_keys: List[str] = []
+        untouched_tables_sources = conf.get_list(UNTOUCHED_TABLES_SOURCES)
+        if untouched_tables_sources:
+            if self._state_store is None:
+                raise Exception(f'{UNTOUCHED_TABLES_SOURCES} requires a state store')
+
+            self._state_store.init(Scoped.get_scoped_conf(conf, self._state_store.get_scope()))
+            for source in untouched_tables_sources:
+                self.untouched_table_keys.extend(
+                    IncrementalExtraction.get_untouched_table_keys(self._state_store, source))
+
         trust = neo4j.TRUST_SYSTEM_CA_SIGNED_CERTIFICATES if conf.get_bool(NEO4J_VALIDATE_SSL) \
             else neo4j.TRUST_ALL_CERTIFICATES
         self._driver = \
@@ -109,6 +156,7 @@ class Neo4jStalenessRemovalTask(Task):
         relations.
         :return:
         """
+        self._keep_untouched_tables()
         self.validate()
         self._delete_stale_nodes()
         self._delete_stale_relations()
@@ -122,7 +170,71 @@ class Neo4jStalenessRemovalTask(Task):
         self._validate_node_staleness_pct()
         self._validate_relation_staleness_pct()
 
+    def _keep_untouched_tables(self) -> None:
+        """
+        Marks the untouched tables as published in this run, along with their columns and descriptions, and the
+        descriptions of their columns, whose keys are derived from the table key. Only the outgoing COLUMN and
+        DESCRIPTION relations of the table and its columns are followed, so that the match does not fan out through
+        nodes shared by many tables, such as schemas or tags. Relations between those nodes are marked as well,
+        and so are their relations to other nodes, such as schema or owners, that were published along with the table,
+        i.e. that have the published tag of the table. Other nodes, and relations published by other jobs, are left
+        as they are, so that their own staleness is unchanged.
+        :return:
+        """
+        if not self.untouched_table_keys:
+            return
+
+        if self.ms_to_expire:
+            mark = 'x.publisher_last_updated_epoch_ms = timestamp()'
+        else:
+            mark = f'x.published_tag = ${MARKER_VAR_NAME}'
+
+        derived_types = f'{TableMetadata.TABLE_COL_RELATION_TYPE}|{DescriptionMetadata.DESCRIPTION_RELATION_TYPE}'
+        statement = textwrap.dedent(f"""
+        UNWIND $keys AS key
+        MATCH (table:{TableMetadata.TABLE_NODE_LABEL} {{key: key}})
+        OPTIONAL MATCH (table)-[:{derived_types}*1..2]->(n)
+        WHERE n.key STARTS WITH key + '/'
+        WITH table, table.published_tag AS tag, [table] + collect(DISTINCT n) AS nodes
+        UNWIND nodes AS node
+        OPTIONAL MATCH (node)-[r]-(m)
+        WHERE m IN nodes OR r.published_tag = tag
+        WITH table, nodes, collect(DISTINCT r) AS relations
+        FOREACH (x IN nodes | SET {mark})
+        FOREACH (x IN relations | SET {mark})
+        RETURN sum(size(nodes)) AS count;
+        """)
+
+        LOGGER.info('Keeping %i untouched tables', len(self.untouched_table_keys))
+        total_count = 0
+        for i in range(0, len(self.untouched_table_keys), self.batch_size):
+            results = self._execute_cypher_query(statement=statement,
+                                                 param_dict={'keys': self.untouched_table_keys[i:i + self.batch_size],
+                                                             MARKER_VAR_NAME: self.marker},
+                                                 dry_run=self.dry_run)
+            record = next(iter(results), None)
+            total_count += record['count'] if record else 0
+        LOGGER.info('Kept %i nodes of untouched tables', total_count)
+
     def _delete_stale_nodes(self) -> None:
+        if self.delete_by_id:
+            collect_statement = textwrap.dedent("""
+            MATCH (n:{{type}})
+            WHERE {}
+            RETURN id(n) as id;
+            """)
+            delete_statement = textwrap.dedent("""
+            UNWIND $ids AS stale_id
+            MATCH (n:{{type}})
+            WHERE id(n) = stale_id AND ({})
+            DETACH DELETE (n)
+            RETURN count(*) as count;
+            """)
+            self._delete_by_id(collect_statement=self._decorate_staleness(collect_statement),
+                               delete_statement=self._decorate_staleness(delete_statement),
+                               targets=self.target_nodes)
+            return
+
         statement = textwrap.dedent("""
         MATCH (n:{{type}})
         WHERE {}
@@ -150,6 +262,24 @@ class Neo4jStalenessRemovalTask(Task):
         OR NOT EXISTS(n.published_tag)"""))
 
     def _delete_stale_relations(self) -> None:
+        if self.delete_by_id:
+            collect_statement = textwrap.dedent("""
+            MATCH ()-[n:{{type}}]->()
+            WHERE {}
+            RETURN id(n) as id;
+            """)
+            delete_statement = textwrap.dedent("""
+            UNWIND $ids AS stale_id
+            MATCH ()-[n:{{type}}]->()
+            WHERE id(n) = stale_id AND ({})
+            DELETE n
+            RETURN count(*) as count;
+            """)
+            self._delete_by_id(collect_statement=self._decorate_staleness(collect_statement),
+                               delete_statement=self._decorate_staleness(delete_statement),
+                               targets=self.target_relations)
+            return
+
         statement = textwrap.dedent("""
         MATCH ()-[n:{{type}}]-()
         WHERE {}
@@ -184,6 +314,87 @@ class Neo4jStalenessRemovalTask(Task):
                     break
             LOGGER.info('Deleted %i stale data of %s', total_count, t)
 
+    def _delete_by_id(self,
+                      collect_statement: str,
+                      delete_statement: str,
+                      targets: Iterable[str]
+                      ) -> None:
+        """
+        Deletes stale data of the targets by id, with targets processed concurrently. If any of the targets fails,
+        pending targets are cancelled and the exception is raised once running targets are finished.
+        :param collect_statement: Statement returning the ids of the stale data of a target
+        :param delete_statement: Statement deleting the stale data of a target among the ids of $ids
+        :param targets:
+        :return:
+        """
+        with ThreadPoolExecutor(max_workers=self.delete_worker_count) as executor:
+            futures: List[Future] = [executor.submit(self._delete_target_by_id, collect_statement, delete_statement, t)
+                                     for t in sorted(targets)]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except Exception as e:
+                LOGGER.exception('Failed to delete stale data. Cancelling pending targets.')
+                for future in futures:
+                    future.cancel()
+                raise e
+
+    def _delete_target_by_id(self,
+                             collect_statement: str,
+                             delete_statement: str,
+                             target: str
+                             ) -> None:
+        """
+        Collects the ids of the stale data of the target, then deletes them in batches of ascending ids.
+        Staleness is checked again on deletion, so that data published in the meantime is kept.
+        :param collect_statement:
+        :param delete_statement:
+        :param target:
+        :return:
+        """
+        start = time.time()
+        results = self._execute_cypher_query(statement=collect_statement.format(type=target),
+                                             param_dict={MARKER_VAR_NAME: self.marker},
+                                             dry_run=self.dry_run)
+        ids = sorted(record['id'] for record in results)
+        LOGGER.info('Collected %i ids of stale data of %s in %.1f seconds', len(ids), target, time.time() - start)
+
+        start = time.time()
+        total_count = 0
+        for i in range(0, len(ids), self.batch_size):
+            total_count += self._delete_batch_by_id(statement=delete_statement.format(type=target),
+                                                    ids=ids[i:i + self.batch_size])
+            elapsed = time.time() - start
+            LOGGER.info('Deleted %i of %i stale data of %s (%.1f per second)',
+                        total_count, len(ids), target, total_count / max(elapsed, 0.001))
+        LOGGER.info('Deleted %i stale data of %s in %.1f seconds', total_count, target, time.time() - start)
+
+    def _delete_batch_by_id(self,
+                            statement: str,
+                            ids: List[int]
+                            ) -> int:
+        """
+        Deletes a batch of ids. As batches of other targets are deleted concurrently, a batch that fails with a
+        TransientError (e.g. a deadlock) is deleted again up to RETRIES_NUMBER times.
+        :param statement:
+        :param ids:
+        :return: Number of deleted nodes or relations
+        """
+        retries_for_exception = RETRIES_NUMBER
+        while True:
+            try:
+                results = self._execute_cypher_query(statement=statement,
+                                                     param_dict={'ids': ids, MARKER_VAR_NAME: self.marker},
+                                                     dry_run=self.dry_run)
+                record = next(iter(results), None)
+                return record['count'] if record else 0
+            except TransientError as e:
+                retries_for_exception -= 1
+                if retries_for_exception <= 0:
+                    raise e
+                LOGGER.warning('Transient error while deleting stale data. Retrying in %i seconds', SLEEP_TIME)
+                time.sleep(SLEEP_TIME)
+
     def _validate_staleness_pct(self,
                                 total_records: Iterable[Dict[str, Any]],
                                 stale_records: Iterable[Dict[str, Any]],
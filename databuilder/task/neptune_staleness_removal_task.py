@@ -2,12 +2,18 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import logging
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED, Future, ThreadPoolExecutor, wait,
+)
 from datetime import datetime, timedelta
 from typing import (
-    Any, Callable, Dict, List, Optional, Tuple,
+    Any, Callable, Dict, List, Optional, Set, Tuple,
 )
 
+from gremlin_python.driver.protocol import GremlinServerError
 from gremlin_python.process import traversal
+from gremlin_python.process.graph_traversal import GraphTraversal
 from gremlin_python.process.traversal import Column, T
 from pyhocon import ConfigFactory, ConfigTree  # noqa: F401
 
@@ -30,6 +36,13 @@ class NeptuneStalenessRemovalTask(Task):
     the one it is getting it from the config, it will regard the node/relation as stale.
     Not all resources are being published by NeptuneCSVPublisher and you can only set specific LABEL of the node or TYPE
     of relation to perform this deletion.
+
+    Deleting all stale nodes (or relations) with a single traversal may hit the query timeout of Neptune when there are
+    many of them. With DELETE_BATCH_SIZE, the ids of the stale nodes of each label are listed a page of that size at a
+    time, each page being dropped by one of DELETE_WORKER_COUNT concurrent requests, checking staleness again, while
+    the next page, excluding the ids being dropped, is listed. A batch failing
+    with a ConcurrentModificationException, as batches of connected nodes and relations may conflict, is retried.
+    Either way, labels that validation found no stale data of are not traversed again.
     """
 
     NEPTUNE_HOST = 'neptune_host'
@@ -51,15 +64,27 @@ class NeptuneStalenessRemovalTask(Task):
     STALENESS_PCT_MAX_DICT = "staleness_max_pct_dict"
     # Sets how old the nodes and relationships can be
     STALENESS_CUT_OFF_IN_SECONDS = "staleness_cut_off_in_seconds"
+    # Number of nodes (or relations) dropped by a single request. Stale data is dropped with a single traversal if 0
+    DELETE_BATCH_SIZE = "delete_batch_size"
+    # Number of concurrent requests dropping batches
+    DELETE_WORKER_COUNT = "delete_worker_count"
+    # Number of retries of a batch failing with a ConcurrentModificationException
+    DELETE_MAX_RETRIES = "delete_max_retries"
     DEFAULT_CONFIG = ConfigFactory.from_dict({
         GRAPH_LABEL_ID_PROPERTY_NAME: T.label,
         STALENESS_MAX_PCT: 5,
         TARGET_NODES: [],
         TARGET_RELATIONS: [],
         STALENESS_PCT_MAX_DICT: {},
-        DRY_RUN: False
+        DRY_RUN: False,
+        DELETE_BATCH_SIZE: 0,
+        DELETE_WORKER_COUNT: 4,
+        DELETE_MAX_RETRIES: 5,
     })
 
+    # Seconds to wait before the first retry of a batch, doubled on every retry
+    RETRY_BACKOFF_SEC = 1.0
+
     def get_scope(self) -> str:
         return 'task.remove_stale_data'
 
@@ -75,6 +100,12 @@ class NeptuneStalenessRemovalTask(Task):
         self.graph_label_id = conf.get(NeptuneStalenessRemovalTask.GRAPH_LABEL_ID_PROPERTY_NAME)
         self.staleness_cut_off_in_seconds = conf.get_int(NeptuneStalenessRemovalTask.STALENESS_CUT_OFF_IN_SECONDS)
         self.cutoff_datetime = datetime.utcnow() - timedelta(seconds=self.staleness_cut_off_in_seconds)
+        self.delete_batch_size = conf.get_int(NeptuneStalenessRemovalTask.DELETE_BATCH_SIZE)
+        self.delete_worker_count = conf.get_int(NeptuneStalenessRemovalTask.DELETE_WORKER_COUNT)
+        self.delete_max_retries = conf.get_int(NeptuneStalenessRemovalTask.DELETE_MAX_RETRIES)
+        # Number of stale nodes and relations per label, as counted by the validation
+        self._stale_node_counts: Optional[Dict[str, int]] = None
+        self._stale_relation_counts: Optional[Dict[str, int]] = None
         self.gremlin_client = NeptuneSessionClient()
         gremlin_client_conf = Scoped.get_scoped_conf(conf, self.gremlin_client.get_scope())
         self.gremlin_client.init(gremlin_client_conf)
@@ -105,9 +136,23 @@ class NeptuneStalenessRemovalTask(Task):
             (NEPTUNE_CREATION_TYPE_NODE_PROPERTY_NAME, NEPTUNE_CREATION_TYPE_JOB, traversal.eq),
             (NEPTUNE_LAST_EXTRACTED_AT_NODE_PROPERTY_NAME, self.cutoff_datetime, traversal.lt)
         ]
+        labels = self._get_labels_to_delete(self.target_nodes, self._stale_node_counts)
+        if labels is not None and not labels:
+            LOGGER.info('No stale nodes to delete')
+            return
+
+        if self.delete_batch_size > 0:
+            self._delete_in_batches(
+                get_traversal=lambda: self.gremlin_client.get_graph().V(),
+                filter_properties=filter_properties,
+                labels=labels if labels is not None else self.target_nodes,
+                stale_counts=self._stale_node_counts or {}
+            )
+            return
+
         self.gremlin_client.delete_nodes(
             filter_properties=filter_properties,
-            node_labels=list(self.target_nodes)
+            node_labels=labels
         )
 
     def _delete_stale_relations(self) -> None:
@@ -115,18 +160,172 @@ class NeptuneStalenessRemovalTask(Task):
             (NEPTUNE_CREATION_TYPE_RELATIONSHIP_PROPERTY_NAME, NEPTUNE_CREATION_TYPE_JOB, traversal.eq),
             (NEPTUNE_LAST_EXTRACTED_AT_RELATIONSHIP_PROPERTY_NAME, self.cutoff_datetime, traversal.lt),
         ]
+        labels = self._get_labels_to_delete(self.target_relations, self._stale_relation_counts)
+        if labels is not None and not labels:
+            LOGGER.info('No stale relations to delete')
+            return
+
+        if self.delete_batch_size > 0:
+            self._delete_in_batches(
+                get_traversal=lambda: self.gremlin_client.get_graph().E(),
+                filter_properties=filter_properties,
+                labels=labels if labels is not None else self.target_relations,
+                stale_counts=self._stale_relation_counts or {}
+            )
+            return
 
         self.gremlin_client.delete_edges(
             filter_properties=filter_properties,
-            edge_labels=list(self.target_relations)
+            edge_labels=labels
         )
 
+    @staticmethod
+    def _get_labels_to_delete(
+            targets: List[str],
+            stale_counts: Optional[Dict[str, int]]
+    ) -> Optional[List[str]]:
+        """
+        Narrows down the targets to the labels that have stale data according to the validation. All labels are
+        targeted if there's no target.
+        :param targets:
+        :param stale_counts: Number of stale nodes (or relations) per label, None if not validated
+        :return: Labels to delete stale data of, or None if they are not known
+        """
+        if stale_counts is None:
+            return list(targets) if targets else None
+
+        return sorted(label for label, count in stale_counts.items()
+                      if count > 0 and (not targets or label in targets))
+
+    def _delete_in_batches(
+            self,
+            get_traversal: Callable[[], GraphTraversal],
+            filter_properties: List[Tuple[str, Any, Callable]],
+            labels: List[str],
+            stale_counts: Dict[str, int]
+    ) -> None:
+        """
+        Deletes the stale data of each label in batches of DELETE_BATCH_SIZE ids, dropped by DELETE_WORKER_COUNT
+        concurrent requests.
+        :param get_traversal: Returns a new traversal of either the nodes or the relations
+        :param filter_properties: Filters matching stale data
+        :param labels:
+        :param stale_counts: Number of stale data per label, as counted by the validation
+        :return:
+        """
+        with ThreadPoolExecutor(max_workers=self.delete_worker_count) as executor:
+            for label in labels:
+                self._delete_label_in_batches(executor, get_traversal, filter_properties, label,
+                                              stale_counts.get(label))
+
+    def _delete_label_in_batches(
+            self,
+            executor: ThreadPoolExecutor,
+            get_traversal: Callable[[], GraphTraversal],
+            filter_properties: List[Tuple[str, Any, Callable]],
+            label: str,
+            stale_count: Optional[int]
+    ) -> None:
+        """
+        Lists the ids of the stale data of the label a page of DELETE_BATCH_SIZE ids at a time, so that no single
+        traversal goes over all of them, and submits each page to be dropped as it comes. Pages exclude the ids being
+        dropped, and at most DELETE_WORKER_COUNT pages are dropped at once. Dropped data is no longer stale, so
+        listing stops once a page is empty. If a batch fails, running batches are cancelled and the exception is
+        raised.
+        """
+        start = time.time()
+        running: Dict[Future, List[Any]] = {}
+        submitted: Set[Any] = set()
+        processed_count = 0
+        expected_count = stale_count if stale_count is not None else 'unknown'
+        try:
+            listing = True
+            while listing or running:
+                if listing:
+                    ids = self._list_stale_ids(get_traversal, filter_properties, label,
+                                               excluded_ids=[i for batch in running.values() for i in batch])
+                    if submitted.intersection(ids):
+                        raise RuntimeError(f'Stale {label} are still there after being dropped: '
+                                           f'{sorted(submitted.intersection(ids), key=str)[:10]}')
+                    submitted.update(ids)
+                    if ids:
+                        running[executor.submit(self._delete_batch, get_traversal, filter_properties, ids)] = ids
+                    listing = bool(ids)
+
+                if running and (not listing or len(running) >= self.delete_worker_count):
+                    processed_count += NeptuneStalenessRemovalTask._wait_for_batches(running)
+                    LOGGER.info('Processed %i of %s stale %s (%.1f per second)', processed_count, expected_count,
+                                label, processed_count / max(time.time() - start, 0.001))
+        except Exception as e:
+            LOGGER.exception('Failed to delete stale %s. Cancelling pending batches.', label)
+            for future in running:
+                future.cancel()
+            raise e
+
+    @staticmethod
+    def _wait_for_batches(running: Dict[Future, List[Any]]) -> int:
+        """
+        Waits for at least one of the running batches to be done, and removes the ones that are done.
+        :param running: Ids of the running batches
+        :return: Number of ids processed by the batches done
+        """
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        processed_count = 0
+        for future in done:
+            running.pop(future)
+            processed_count += future.result()
+        return processed_count
+
+    def _list_stale_ids(
+            self,
+            get_traversal: Callable[[], GraphTraversal],
+            filter_properties: List[Tuple[str, Any, Callable]],
+            label: str,
+            excluded_ids: List[Any]
+    ) -> List[Any]:
+        """
+        :return: Ids of up to DELETE_BATCH_SIZE stale nodes (or relations) of the label, other than the excluded ones
+        """
+        tx = NeptuneSessionClient.filter_traversal(get_traversal().hasLabel(label), filter_properties)
+        if excluded_ids:
+            tx = tx.hasId(traversal.without(excluded_ids))
+        return tx.id().limit(self.delete_batch_size).toList()
+
+    def _delete_batch(
+            self,
+            get_traversal: Callable[[], GraphTraversal],
+            filter_properties: List[Tuple[str, Any, Callable]],
+            ids: List[Any]
+    ) -> int:
+        """
+        Drops a batch of nodes (or relations) by id, checking again that they are stale. Retried with an exponential
+        backoff when failing with a ConcurrentModificationException.
+        :return: Number of ids of the batch processed, some of which may not have been dropped as no longer stale
+        """
+        backoff_sec = NeptuneStalenessRemovalTask.RETRY_BACKOFF_SEC
+        for attempt in range(self.delete_max_retries + 1):
+            try:
+                tx = NeptuneSessionClient.filter_traversal(get_traversal().hasId(*ids), filter_properties)
+                tx.drop().iterate()
+                return len(ids)
+            except GremlinServerError as e:
+                if 'ConcurrentModificationException' not in str(e) or attempt >= self.delete_max_retries:
+                    raise e
+                LOGGER.warning('Concurrent modification while deleting a batch of %i. Retrying in %.1f seconds',
+                               len(ids), backoff_sec)
+                time.sleep(backoff_sec)
+                backoff_sec *= 2
+        return 0
+
     def _validate_staleness_pct(
             self,
             total_records: List[Dict[str, Any]],
             stale_records: List[Dict[str, Any]],
             types: List[str]
-    ) -> None:
+    ) -> Dict[str, int]:
+        """
+        :return: Number of stale records per type, for the deletion to reuse
+        """
         total_count_dict = {record['type']: int(record['count']) for record in total_records}
 
         for record in stale_records:
@@ -154,6 +353,8 @@ class NeptuneStalenessRemovalTask(Task):
                 )
             )
 
+        return {record['type']: int(record['count']) for record in stale_records}
+
     def _validate_node_staleness_pct(self) -> None:
         total_records = self.get_number_of_nodes_grouped_by_label()
         filter_properties = [
@@ -163,7 +364,7 @@ class NeptuneStalenessRemovalTask(Task):
         stale_records = self.get_number_of_nodes_grouped_by_label(
             filter_properties=filter_properties
         )
-        self._validate_staleness_pct(
+        self._stale_node_counts = self._validate_staleness_pct(
             total_records=total_records,
             stale_records=stale_records,
             types=self.target_nodes
@@ -206,7 +407,7 @@ class NeptuneStalenessRemovalTask(Task):
         stale_records = self.get_number_of_edges_grouped_by_label(
             filter_properties=filter_properties
         )
-        self._validate_staleness_pct(
+        self._stale_relation_counts = self._validate_staleness_pct(
             total_records=total_records,
             stale_records=stale_records,
             types=self.target_relations
@@ -0,0 +1,161 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+import queue
+import threading
+from typing import (
+    Any, Iterator, List,
+)
+
+from pyhocon import ConfigTree
+
+from databuilder.extractor.base_extractor import Extractor
+from databuilder.loader.base_loader import Loader
+from databuilder.task.task import DefaultTask
+from databuilder.transformer.base_transformer import NoopTransformer, Transformer
+
+LOGGER = logging.getLogger(__name__)
+
+# Marks the end of the records in a queue
+_END_OF_RECORDS = object()
+
+
+class PipelinedTask(DefaultTask):
+    """
+    A task that extracts, transforms and loads on separate threads so that I/O of each stage overlaps.
+    Extractor and transformer run on their own threads and the loader runs on the calling thread. Stages are
+    connected by bounded queues, which makes a faster stage wait for a slower one instead of buffering all records.
+
+    If any stage fails, the other stages are stopped and the exception is raised from run(). Extractor, transformer
+    and loader are closed once all stages have finished, same as DefaultTask.
+    """
+
+    # Maximum number of records buffered between two stages
+    QUEUE_SIZE = 'queue_size'
+    # Interval in seconds that a blocked stage checks whether the pipeline has been stopped
+    POLL_INTERVAL_SEC = 'poll_interval_sec'
+
+    def __init__(self,
+                 extractor: Extractor,
+                 loader: Loader,
+                 transformer: Transformer = NoopTransformer()) -> None:
+        super(PipelinedTask, self).__init__(extractor=extractor, loader=loader, transformer=transformer)
+        self._stop_event = threading.Event()
+        self._errors: List[Exception] = []
+
+    def init(self, conf: ConfigTree) -> None:
+        super(PipelinedTask, self).init(conf)
+        self._queue_size = conf.get_int(f'{self.get_scope()}.{PipelinedTask.QUEUE_SIZE}', 1000)
+        self._poll_interval_sec = conf.get_float(f'{self.get_scope()}.{PipelinedTask.POLL_INTERVAL_SEC}', 0.1)
+
+    def run(self) -> None:
+        """
+        Runs a task
+        """
+        LOGGER.info('Running a pipelined task')
+        self._stop_event.clear()
+        self._errors = []
+        extracted: queue.Queue = queue.Queue(maxsize=self._queue_size)
+        transformed: queue.Queue = queue.Queue(maxsize=self._queue_size)
+        threads = [threading.Thread(target=self._run_stage, args=(self._extract, extracted),
+                                    name='pipelined-task-extract', daemon=True),
+                   threading.Thread(target=self._run_stage, args=(self._transform, transformed, extracted),
+                                    name='pipelined-task-transform', daemon=True)]
+        try:
+            for thread in threads:
+                thread.start()
+
+            count = 0
+            for record in self._iter_queue(transformed):
+                self.loader.load(record)
+                count += 1
+                if count % self._progress_report_frequency == 0:
+                    LOGGER.info('Extracted %i records so far', count)
+
+            if self._errors:
+                raise self._errors[0]
+        except Exception as e:
+            self.loader.fail()
+            raise e
+        finally:
+            self._stop_event.set()
+            for thread in threads:
+                if thread.is_alive():
+                    thread.join()
+            self._closer.close()
+
+    def _run_stage(self, stage: Any, out_queue: queue.Queue, *args: Any) -> None:
+        """
+        Runs a stage and marks the end of the records in its output queue. If the stage fails, the exception is
+        recorded and the pipeline is stopped.
+        :param stage: _extract or _transform
+        :param out_queue:
+        :param args: Additional arguments for the stage
+        :return:
+        """
+        try:
+            stage(out_queue, *args)
+        except Exception as e:
+            LOGGER.exception('Failed on %s', threading.current_thread().name)
+            self._errors.append(e)
+            self._stop_event.set()
+        finally:
+            self._put(out_queue, _END_OF_RECORDS)
+
+    def _extract(self, out_queue: queue.Queue) -> None:
+        record = self.extractor.extract()
+        while record and not self._stop_event.is_set():
+            self._put(out_queue, record)
+            record = self.extractor.extract()
+
+    def _transform(self, out_queue: queue.Queue, in_queue: queue.Queue) -> None:
+        for record in self._iter_queue(in_queue):
+            record = self.transformer.transform(record)
+            if not record:
+                # Move on if the transformer filtered the record out
+                continue
+
+            # Support transformers which return one record, or yield multiple
+            results = record if isinstance(record, Iterator) else [record]
+            for result in results:
+                if result:
+                    self._put(out_queue, result)
+
+        if self._stop_event.is_set():
+            return
+
+        # Pass on the records the transformer is still holding
+        for result in self.transformer.flush():
+            if result:
+                self._put(out_queue, result)
+
+    def _put(self, out_queue: queue.Queue, record: Any) -> None:
+        """
+        Puts the record into the queue, waiting for a free slot unless the pipeline has been stopped.
+        :param out_queue:
+        :param record:
+        :return:
+        """
+        while not self._stop_event.is_set():
+            try:
+                out_queue.put(record, timeout=self._poll_interval_sec)
+                return
+            except queue.Full:
+                continue
+
+    def _iter_queue(self, in_queue: queue.Queue) -> Iterator[Any]:
+        """
+        Yields records from the queue until the end of the records or until the pipeline has been stopped.
+        :param in_queue:
+        :return:
+        """
+        while not self._stop_event.is_set():
+            try:
+                record = in_queue.get(timeout=self._poll_interval_sec)
+            except queue.Empty:
+                continue
+
+            if record is _END_OF_RECORDS:
+                return
+            yield record
@@ -73,5 +73,13 @@ class DefaultTask(Task):
 
                 # Prepare the next record
                 record = self.extractor.extract()
+
+            # Load the records the transformer is still holding
+            for result in self.transformer.flush():
+                if result:
+                    self.loader.load(result)
+        except Exception as e:
+            self.loader.fail()
+            raise e
         finally:
             self._closer.close()
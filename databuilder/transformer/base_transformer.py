@@ -23,6 +23,14 @@ class Transformer(Scoped):
     def transform(self, record: Any) -> Any:
         pass
 
+    def flush(self) -> Iterator[Any]:
+        """
+        Called by the task once there is no more record to transform. A transformer that holds records back, such as
+        ParallelTransformer, yields the remaining records here.
+        :return: Iterator of the remaining records
+        """
+        return iter([])
+
 
 class NoopTransformer(Transformer):
     """
@@ -61,20 +69,35 @@ class ChainedTransformer(Transformer):
     def transform(self, record: Any) -> Any:
         records = [record]
         for t in self.transformers:
-            new_records: List[Any] = []
-            for r in records:
-                result = t.transform(r)
-                # Get all records if the transformer returns an Iterator.
-                if isinstance(result, Iterator):
-                    new_records += list(result)
-
-                # Filter the record if it is None
-                elif result is not None:
-                    new_records.append(result)
-            records = new_records
+            records = self._transform_records(t, records)
+
+        yield from records
+
+    def flush(self) -> Iterator[Any]:
+        """
+        Flushes each transformer in order, where the records flushed from a transformer are passed to the next ones.
+        :return:
+        """
+        records: List[Any] = []
+        for t in self.transformers:
+            records = self._transform_records(t, records)
+            records += list(t.flush())
 
         yield from records
 
+    def _transform_records(self, transformer: Transformer, records: List[Any]) -> List[Any]:
+        new_records: List[Any] = []
+        for r in records:
+            result = transformer.transform(r)
+            # Get all records if the transformer returns an Iterator.
+            if isinstance(result, Iterator):
+                new_records += list(result)
+
+            # Filter the record if it is None
+            elif result is not None:
+                new_records.append(result)
+        return new_records
+
     def get_scope(self) -> str:
         return 'transformer.chained'
 
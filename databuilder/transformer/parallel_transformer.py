@@ -0,0 +1,196 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+import multiprocessing
+from collections import deque
+from multiprocessing.pool import AsyncResult
+from multiprocessing.synchronize import Barrier
+from typing import (
+    Any, Callable, Deque, Iterator, List, Optional,
+)
+
+from pyhocon import ConfigFactory, ConfigTree
+
+from databuilder import Scoped
+from databuilder.transformer.base_transformer import Transformer
+
+LOGGER = logging.getLogger(__name__)
+
+# Transformer initialized in each worker process
+_worker_transformer: Optional[Transformer] = None
+# Barrier shared by the workers, so that each one of them runs exactly one flush or close task
+_worker_barrier: Optional[Barrier] = None
+
+
+def _init_worker(transformer: Transformer, conf: ConfigTree, barrier: Barrier) -> None:
+    global _worker_transformer, _worker_barrier
+    transformer.init(conf)
+    _worker_transformer = transformer
+    _worker_barrier = barrier
+
+
+def _transform_batch(records: List[Any]) -> List[Any]:
+    """
+    Transforms a batch of records in a worker process. Transformer which yields multiple records is expanded and
+    filtered out records are dropped.
+    :param records:
+    :return: transformed records
+    """
+    assert _worker_transformer is not None
+    results: List[Any] = []
+    for record in records:
+        result = _worker_transformer.transform(record)
+        if isinstance(result, Iterator):
+            results.extend(r for r in result if r is not None)
+        elif result is not None:
+            results.append(result)
+    return results
+
+
+def _flush_worker() -> List[Any]:
+    """
+    Flushes the transformer of a worker process, and waits for the other workers to take their flush task.
+    :return: flushed records
+    """
+    assert _worker_transformer is not None and _worker_barrier is not None
+    try:
+        return [r for r in _worker_transformer.flush() if r is not None]
+    finally:
+        _worker_barrier.wait()
+
+
+def _close_worker() -> None:
+    """
+    Closes the transformer of a worker process, and waits for the other workers to take their close task.
+    :return:
+    """
+    assert _worker_transformer is not None and _worker_barrier is not None
+    try:
+        _worker_transformer.close()
+    finally:
+        _worker_barrier.wait()
+
+
+class ParallelTransformer(Transformer):
+    """
+    A transformer that fans records out to a pool of processes, for CPU-bound transformers that are otherwise
+    limited to a single core. Records are sent to the workers in batches, and the transformed records are returned
+    once the batch is done, either in the original order or in the order the batches finished.
+
+    The wrapped transformer is initialized in each worker process with the config within its scope, and it as well as
+    the records needs to be picklable.
+    e.g: transformer.parallel.transformer.regex_str_replace.attribute_name
+
+    As records are held back until their batch is done, the task needs to call flush() at the end to get the remaining
+    records, which DefaultTask does. flush() and close() are passed on to the transformer of every worker process, as
+    in the serial path.
+    """
+    # Config keys
+    # Number of worker processes. Defaults to the number of CPUs.
+    WORKER_COUNT = 'worker_count'
+    # Number of records sent to a worker at a time
+    BATCH_SIZE = 'batch_size'
+    # Whether to return records in the order they are received
+    PRESERVE_ORDER = 'preserve_order'
+    # Maximum number of batches in flight before transform() waits for one to finish
+    MAX_PENDING_BATCHES = 'max_pending_batches'
+
+    _DEFAULT_CONFIG = ConfigFactory.from_dict({BATCH_SIZE: 500,
+                                               PRESERVE_ORDER: True})
+
+    def __init__(self, transformer: Transformer) -> None:
+        self._transformer = transformer
+        self._pool: Optional[multiprocessing.pool.Pool] = None
+        self._buffer: List[Any] = []
+        self._pending: Deque[AsyncResult] = deque()
+
+    def init(self, conf: ConfigTree) -> None:
+        conf = conf.with_fallback(ParallelTransformer._DEFAULT_CONFIG)
+        self._worker_count = conf.get_int(ParallelTransformer.WORKER_COUNT, multiprocessing.cpu_count())
+        self._batch_size = conf.get_int(ParallelTransformer.BATCH_SIZE)
+        self._preserve_order = conf.get_bool(ParallelTransformer.PRESERVE_ORDER)
+        self._max_pending_batches = conf.get_int(ParallelTransformer.MAX_PENDING_BATCHES, self._worker_count * 2)
+
+        transformer_conf = Scoped.get_scoped_conf(conf, self._transformer.get_scope())
+        LOGGER.info('Transforming with %s on %i processes', self._transformer, self._worker_count)
+        self._pool = multiprocessing.Pool(processes=self._worker_count,
+                                          initializer=_init_worker,
+                                          initargs=(self._transformer, transformer_conf,
+                                                    multiprocessing.Barrier(self._worker_count)))
+
+    def transform(self, record: Any) -> Any:
+        """
+        Adds the record to the current batch and returns the records of the batches that are done, if any.
+        :param record:
+        :return: Iterator of transformed records
+        """
+        self._buffer.append(record)
+        if len(self._buffer) >= self._batch_size:
+            self._submit_batch()
+
+        results: List[Any] = []
+        # Bound the number of records held in memory by waiting for the oldest batch
+        while len(self._pending) > self._max_pending_batches:
+            results.extend(self._pending.popleft().get())
+        results.extend(self._collect_done())
+        return iter(results)
+
+    def flush(self) -> Iterator[Any]:
+        """
+        Sends the last batch and waits for all the batches in flight, then flushes the transformer of each worker.
+        :return:
+        """
+        if self._buffer:
+            self._submit_batch()
+
+        while self._pending:
+            yield from self._pending.popleft().get()
+
+        for flushed in self._run_on_workers(_flush_worker):
+            yield from flushed
+
+    def _submit_batch(self) -> None:
+        assert self._pool is not None
+        self._pending.append(self._pool.apply_async(_transform_batch, (self._buffer,)))
+        self._buffer = []
+
+    def _run_on_workers(self, func: Callable[[], Any]) -> List[Any]:
+        """
+        Runs the function once in every worker process. Each worker waits on the barrier after its call, so that the
+        other calls go to the other workers.
+        :param func:
+        :return: result of each call
+        """
+        assert self._pool is not None
+        results = [self._pool.apply_async(func) for _ in range(self._worker_count)]
+        return [r.get() for r in results]
+
+    def _collect_done(self) -> List[Any]:
+        """
+        Collects the records of the batches that are done. If the order is preserved, it stops at the first batch
+        that is not done yet.
+        :return:
+        """
+        results: List[Any] = []
+        if self._preserve_order:
+            while self._pending and self._pending[0].ready():
+                results.extend(self._pending.popleft().get())
+            return results
+
+        for pending in [p for p in self._pending if p.ready()]:
+            self._pending.remove(pending)
+            results.extend(pending.get())
+        return results
+
+    def get_scope(self) -> str:
+        return 'transformer.parallel'
+
+    def close(self) -> None:
+        if self._pool is not None:
+            try:
+                self._run_on_workers(_close_worker)
+            finally:
+                self._pool.close()
+                self._pool.join()
+                self._pool = None
@@ -0,0 +1,122 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+import gzip
+import io
+from typing import (
+    IO, Any, Optional,
+)
+
+# Compression formats of the files written by the loaders
+GZIP = 'gzip'
+ZSTD = 'zstd'
+
+EXTENSIONS = {
+    GZIP: '.gz',
+    ZSTD: '.zst',
+}
+
+DEFAULT_LEVELS = {
+    GZIP: 6,
+    ZSTD: 3,
+}
+
+
+class _ClosingTextIOWrapper(io.TextIOWrapper):
+    """
+    A TextIOWrapper that also closes the file underneath the stream it wraps, which GzipFile leaves open.
+    """
+
+    def __init__(self, buffer: Any, file: IO[bytes], **kwargs: Any) -> None:
+        super(_ClosingTextIOWrapper, self).__init__(buffer, **kwargs)
+        self._file = file
+
+    def close(self) -> None:
+        try:
+            super(_ClosingTextIOWrapper, self).close()
+        finally:
+            self._file.close()
+
+
+def _import_zstandard() -> Any:
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError('zstd compression requires zstandard. Install amundsen-databuilder[zstd]')
+    return zstandard
+
+
+def get_extension(compression: Optional[str]) -> str:
+    """
+    :param compression: One of GZIP, ZSTD, or None for no compression
+    :return: Extension appended to the names of files of the compression
+    """
+    if compression is None:
+        return ''
+    if compression not in EXTENSIONS:
+        raise ValueError(f'Unsupported compression {compression}. Supported: {list(EXTENSIONS.keys())}')
+    return EXTENSIONS[compression]
+
+
+def strip_extension(path: str) -> str:
+    """
+    :param path:
+    :return: Path without the extension of its compression, if compressed
+    """
+    for extension in EXTENSIONS.values():
+        if path.endswith(extension):
+            return path[:-len(extension)]
+    return path
+
+
+def open_for_write(path: str,
+                   compression: Optional[str] = None,
+                   level: Optional[int] = None,
+                   buffer_size: int = io.DEFAULT_BUFFER_SIZE,
+                   mode: str = 'w') -> IO[str]:
+    """
+    Opens a text file to write to, compressed unless compression is None. A compressed file opened in append mode
+    gets a new gzip member (or zstd frame), which open_for_read reads through.
+    :param path: Path of the file, to which the extension of the compression is appended
+    :param compression: One of GZIP, ZSTD, or None for no compression
+    :param level: Compression level. Defaults to DEFAULT_LEVELS
+    :param buffer_size: Size of the buffer of the file, to write it in large chunks
+    :param mode: Either 'w' or 'a' to append to the file
+    :return: File object of the file, opened in text mode
+    """
+    path = path + get_extension(compression)
+    if compression is None:
+        return open(path, mode, encoding='utf8', buffering=buffer_size)
+
+    level = level if level is not None else DEFAULT_LEVELS[compression]
+    file_out = open(path, mode + 'b', buffering=buffer_size)
+    try:
+        if compression == GZIP:
+            stream: Any = gzip.GzipFile(fileobj=file_out, mode='wb', compresslevel=level)
+        else:
+            zstandard = _import_zstandard()
+            stream = zstandard.ZstdCompressor(level=level).stream_writer(file_out, closefd=False)
+        return _ClosingTextIOWrapper(stream, file_out, encoding='utf8', newline='')
+    except Exception:
+        file_out.close()
+        raise
+
+
+def open_for_read(path: str) -> IO[str]:
+    """
+    Opens a text file to read from, decompressing it if its extension is the one of a compression.
+    :param path:
+    :return: File object of the file, opened in text mode
+    """
+    if path.endswith(EXTENSIONS[GZIP]):
+        return gzip.open(path, 'rt', encoding='utf8', newline='')
+    if path.endswith(EXTENSIONS[ZSTD]):
+        zstandard = _import_zstandard()
+        file_in = open(path, 'rb')
+        try:
+            stream = zstandard.ZstdDecompressor().stream_reader(file_in, read_across_frames=True, closefd=False)
+            return _ClosingTextIOWrapper(stream, file_in, encoding='utf8', newline='')
+        except Exception:
+            file_in.close()
+            raise
+    return open(path, 'r', encoding='utf8')
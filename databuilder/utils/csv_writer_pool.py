@@ -0,0 +1,83 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+import csv
+import logging
+from collections import OrderedDict
+from csv import DictWriter
+from typing import (
+    IO, Any, Callable, Dict, Iterable, List, Tuple,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _open_file(path: str, mode: str) -> IO[str]:
+    return open(path, mode, encoding='utf8')
+
+
+class CsvWriterPool(object):
+    """
+    Keeps the CSV writers of the files written by a loader, one file per key, with at most max_open_files files open
+    at once. When the limit is reached, the least recently written file is closed, and it is reopened in append mode,
+    without writing its header again, the next time it is written to.
+    """
+
+    def __init__(self,
+                 max_open_files: int = 0,
+                 open_file: Callable[[str, str], IO[str]] = _open_file) -> None:
+        """
+        :param max_open_files: Maximum number of files open at once. No limit if 0
+        :param open_file: Opens the file of a path in a mode, either 'w' or 'a'
+        """
+        self._max_open_files = max_open_files
+        self._open_file = open_file
+        # Path and header of every file created so far
+        self._files: Dict[Any, Tuple[str, List[str]]] = {}
+        # Open files and their writers, from the least to the most recently used
+        self._open_files: 'OrderedDict[Any, Tuple[IO[str], DictWriter]]' = OrderedDict()
+        self._reopen_count = 0
+
+    def get_writer(self, key: Any, path: str, fieldnames: Iterable[str]) -> DictWriter:
+        """
+        :param key: Key of the file
+        :param path: Path of the file, if it's not created yet
+        :param fieldnames: Header of the file, if it's not created yet
+        :return: Writer of the file of the key
+        """
+        entry = self._open_files.get(key)
+        if entry is not None:
+            self._open_files.move_to_end(key)
+            return entry[1]
+
+        if key in self._files:
+            path, header = self._files[key]
+            file_out = self._open_file(path, 'a')
+            writer = csv.DictWriter(file_out, fieldnames=header, quoting=csv.QUOTE_NONNUMERIC)
+            self._reopen_count += 1
+        else:
+            LOGGER.info('Creating file for %s', key)
+            header = list(fieldnames)
+            file_out = self._open_file(path, 'w')
+            writer = csv.DictWriter(file_out, fieldnames=header, quoting=csv.QUOTE_NONNUMERIC)
+            writer.writeheader()
+            self._files[key] = (path, header)
+
+        self._open_files[key] = (file_out, writer)
+        while 0 < self._max_open_files < len(self._open_files):
+            _, (least_recent_file, _) = self._open_files.popitem(last=False)
+            least_recent_file.close()
+
+        return writer
+
+    def close(self) -> None:
+        """
+        Closes the files that are open.
+        """
+        if self._reopen_count:
+            LOGGER.info('Reopened files %i times, with at most %i files open', self._reopen_count,
+                        self._max_open_files)
+        for file_out, _ in self._open_files.values():
+            LOGGER.info('Closing file IO %s', file_out)
+            file_out.close()
+        self._open_files.clear()
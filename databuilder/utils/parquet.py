@@ -0,0 +1,216 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+import os
+from typing import (
+    Any, Dict, Iterable, List, Optional, Set,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+# Formats of the files written by the loaders
+CSV = 'csv'
+PARQUET = 'parquet'
+
+EXTENSIONS = {
+    CSV: '.csv',
+    PARQUET: '.parquet',
+}
+
+
+def import_pyarrow() -> Any:
+    try:
+        import pyarrow
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise ImportError('Parquet files require pyarrow. Install amundsen-databuilder[parquet]')
+    return pyarrow
+
+
+def get_extension(file_format: str) -> str:
+    """
+    :param file_format: One of CSV, PARQUET
+    :return: Extension of the files of the format
+    """
+    if file_format not in EXTENSIONS:
+        raise ValueError(f'Unsupported file format {file_format}. Supported: {list(EXTENSIONS.keys())}')
+    return EXTENSIONS[file_format]
+
+
+class ParquetRecordWriter(object):
+    """
+    Writes records, dicts with the same keys, to a Parquet file, in row groups of row_group_size records.
+
+    The type of each column is inferred from the records, and a column with no value yet is a string column. If a
+    row group has a wider type for a column than the one written so far, e.g. a float in an integer column or any
+    value in a column that had none, the file is rewritten with the wider type. Values of other types, e.g. a string
+    in an integer column, fail the write.
+    """
+
+    def __init__(self,
+                 path: str,
+                 fieldnames: Iterable[str],
+                 compression: Optional[str] = None,
+                 compression_level: Optional[int] = None,
+                 row_group_size: int = 10000) -> None:
+        """
+        :param path: Path of the file
+        :param fieldnames: Columns of the file
+        :param compression: Compression codec of the file, e.g. gzip or zstd. Defaults to the one of pyarrow
+        :param compression_level: Compression level. Defaults to the one of the codec
+        :param row_group_size: Number of records buffered and written at once
+        """
+        self._pyarrow = import_pyarrow()
+        self._path = path
+        self._fieldnames = list(fieldnames)
+        self._compression = compression
+        self._compression_level = compression_level
+        self._row_group_size = row_group_size
+        self._rows: List[Dict[str, Any]] = []
+        self._writer: Any = None
+        self._schema: Any = None
+        # Columns with a value written, whose type is no longer a placeholder
+        self._typed_columns: Set[str] = set()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def writerow(self, row: Dict[str, Any]) -> None:
+        self._rows.append(row)
+        if len(self._rows) >= self._row_group_size:
+            self._flush()
+
+    def writerows(self, rows: Iterable[Dict[str, Any]]) -> None:
+        for row in rows:
+            self.writerow(row)
+
+    def _flush(self) -> None:
+        pa = self._pyarrow
+        if not self._rows:
+            if self._writer is None:
+                self._open(pa.schema([(name, pa.string()) for name in self._fieldnames]))
+            return
+
+        try:
+            table = pa.Table.from_pylist(self._rows).select(self._fieldnames)
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            raise ValueError(f'Records of {self._path} have values of different types in a column: {e}') from e
+
+        schema = self._widen_schema(table.schema)
+        if self._writer is None:
+            self._open(schema)
+        elif not schema.equals(self._schema):
+            LOGGER.info('Rewriting %s with the column types %s', self._path, schema)
+            self._rewrite(schema)
+        self._typed_columns.update(field.name for field in table.schema if not pa.types.is_null(field.type))
+
+        self._writer.write_table(table.cast(self._schema))
+        self._rows = []
+
+    def _widen_schema(self, schema: Any) -> Any:
+        """
+        :param schema: Schema inferred from the records of a row group
+        :return: Schema of the file that fits the records written so far and the ones of the row group
+        """
+        pa = self._pyarrow
+        fields = []
+        for field in schema:
+            if self._schema is None or field.name not in self._typed_columns:
+                current_type = pa.null()
+            else:
+                current_type = self._schema.field(field.name).type
+
+            if pa.types.is_null(field.type) or field.type.equals(current_type):
+                column_type = current_type
+            elif pa.types.is_null(current_type):
+                column_type = field.type
+            elif all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in (field.type, current_type)):
+                column_type = pa.float64()
+            else:
+                raise ValueError(f'Column {field.name} of {self._path} has values of type {current_type} and '
+                                 f'{field.type}')
+            fields.append(pa.field(field.name, pa.string() if pa.types.is_null(column_type) else column_type))
+        return pa.schema(fields)
+
+    def _open(self, schema: Any) -> None:
+        kwargs: Dict[str, Any] = {}
+        if self._compression:
+            kwargs['compression'] = self._compression
+            kwargs['compression_level'] = self._compression_level
+        self._writer = self._pyarrow.parquet.ParquetWriter(self._path, schema, **kwargs)
+        self._schema = schema
+
+    def _rewrite(self, schema: Any) -> None:
+        """
+        Rewrites the row groups written so far with the column types of the schema, which are wider.
+        :param schema:
+        :return:
+        """
+        pa = self._pyarrow
+        self._writer.close()
+        written_path = f'{self._path}.written'
+        os.replace(self._path, written_path)
+        self._open(schema)
+
+        written_file = pa.parquet.ParquetFile(written_path)
+        try:
+            for i in range(written_file.num_row_groups):
+                self._writer.write_table(written_file.read_row_group(i).cast(schema))
+        finally:
+            written_file.close()
+        os.remove(written_path)
+
+    def close(self) -> None:
+        """
+        Writes the remaining records and closes the file.
+        """
+        self._flush()
+        self._writer.close()
+
+
+class ParquetWriterPool(object):
+    """
+    Keeps the Parquet writers of the files written by a loader, one file per key. Unlike CsvWriterPool, files are kept
+    open until the pool is closed, as a Parquet file can't be appended to once closed.
+    """
+
+    def __init__(self,
+                 compression: Optional[str] = None,
+                 compression_level: Optional[int] = None,
+                 row_group_size: int = 10000) -> None:
+        """
+        :param compression: Compression codec of the files, e.g. gzip or zstd
+        :param compression_level: Compression level
+        :param row_group_size: Number of records of a row group
+        """
+        self._compression = compression
+        self._compression_level = compression_level
+        self._row_group_size = row_group_size
+        self._writers: Dict[Any, ParquetRecordWriter] = {}
+
+    def get_writer(self, key: Any, path: str, fieldnames: Iterable[str]) -> ParquetRecordWriter:
+        """
+        :param key: Key of the file
+        :param path: Path of the file, if it's not created yet
+        :param fieldnames: Columns of the file, if it's not created yet
+        :return: Writer of the file of the key
+        """
+        writer = self._writers.get(key)
+        if writer is None:
+            LOGGER.info('Creating file for %s', key)
+            writer = ParquetRecordWriter(path, fieldnames, compression=self._compression,
+                                         compression_level=self._compression_level,
+                                         row_group_size=self._row_group_size)
+            self._writers[key] = writer
+        return writer
+
+    def close(self) -> None:
+        """
+        Writes the remaining records and closes the files.
+        """
+        for writer in self._writers.values():
+            LOGGER.info('Closing file %s', writer.path)
+            writer.close()
+        self._writers.clear()
@@ -0,0 +1,57 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+import hashlib
+import logging
+from typing import (
+    Any, Dict, Set,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _get_digest(record_dict: Dict[str, Any]) -> int:
+    """
+    :param record_dict: Serialized node or relation
+    :return: 64 bits digest of the record, regardless of the order of its keys
+    """
+    content = repr(sorted(record_dict.items())).encode('utf8')
+    return int.from_bytes(hashlib.blake2b(content, digest_size=8).digest(), 'little')
+
+
+class RecordDeduplicator(object):
+    """
+    Tells whether a serialized record is identical, keys and values, to one seen before, keeping a 64 bits digest of
+    every record seen instead of the record itself.
+
+    Memory is capped by max_records digests: once the current set of digests is full, it becomes the previous one,
+    and the digests of the set before are dropped. Records seen long ago may then be reported as new again, which
+    only costs writing them again, as publishers merge records.
+    """
+
+    def __init__(self, max_records: int = 0) -> None:
+        """
+        :param max_records: Maximum number of digests kept. No limit if 0
+        """
+        self._max_generation_size = (max_records + 1) // 2
+        self._digests: Set[int] = set()
+        self._previous_digests: Set[int] = set()
+        self.duplicate_count = 0
+
+    def is_duplicate(self, record_dict: Dict[str, Any]) -> bool:
+        """
+        :param record_dict: Serialized node or relation
+        :return: True if the record was seen before, otherwise remembers it and returns False
+        """
+        digest = _get_digest(record_dict)
+        if digest in self._digests or digest in self._previous_digests:
+            self.duplicate_count += 1
+            return True
+
+        if 0 < self._max_generation_size <= len(self._digests):
+            LOGGER.info('Deduplication reached %i records. Dropping the oldest %i', 2 * self._max_generation_size,
+                        len(self._previous_digests))
+            self._previous_digests = self._digests
+            self._digests = set()
+        self._digests.add(digest)
+        return False
@@ -85,8 +85,14 @@ rds = [
     'mysqlclient>=1.3.6,<3'
 ]
 
+# To compress files written by the loaders with zstd
+zstd = ['zstandard>=0.15.0']
+
+# To write and read Parquet files instead of CSV files
+parquet = ['pyarrow>=8.0.0']
+
 all_deps = requirements + kafka + cassandra + glue + snowflake + athena + \
-    bigquery + jsonpath + db2 + dremio + druid + spark + feast + neptune + rds
+    bigquery + jsonpath + db2 + dremio + druid + spark + feast + neptune + rds + zstd + parquet
 
 setup(
     name='amundsen-databuilder',
@@ -115,7 +121,9 @@ setup(
         'delta': spark,
         'feast': feast,
         'atlas': atlas,
-        'rds': rds
+        'rds': rds,
+        'zstd': zstd,
+        'parquet': parquet
     },
     classifiers=[
         'Programming Language :: Python :: 3.6',
@@ -126,6 +126,19 @@ class TestRedshiftMetadataExtractorWithWhereClause(unittest.TestCase):
             extractor.init(self.conf)
             self.assertTrue(self.where_clause_suffix in extractor.sql_stmt)
 
+    def test_schema_sql_statement(self) -> None:
+        with patch.object(SQLAlchemyExtractor, '_get_connection'):
+            extractor = RedshiftMetadataExtractor()
+            extractor.init(self.conf)
+            sql = extractor.get_schema_sql_statement(use_catalog_as_cluster_name=True,
+                                                     where_clause_suffix=self.where_clause_suffix, schema='public')
+
+            # Each query of the union only scans the schema
+            for schema_filter in ["WHERE c.table_schema = 'public'", "WHERE view_schema = 'public'",
+                                  "WHERE schemaname = 'public'"]:
+                self.assertIn(schema_filter, sql)
+            self.assertIn(self.where_clause_suffix, sql)
+
 
 if __name__ == '__main__':
     unittest.main()
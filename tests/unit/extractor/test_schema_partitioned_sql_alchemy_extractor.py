@@ -0,0 +1,156 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+import threading
+import unittest
+from concurrent.futures import TimeoutError
+from typing import Any, List
+
+from mock import MagicMock, patch
+from pyhocon import ConfigFactory
+
+from databuilder.extractor.postgres_metadata_extractor import PostgresMetadataExtractor
+from databuilder.extractor.schema_partitioned_sql_alchemy_extractor import (
+    SchemaPartitionedSQLAlchemyExtractor, add_schema_filter,
+)
+
+
+class TestAddSchemaFilter(unittest.TestCase):
+
+    def test_empty_where_clause_suffix(self) -> None:
+        self.assertEqual(add_schema_filter(' ', 'c.table_schema', 'foo'),
+                         "WHERE c.table_schema = 'foo'")
+
+    def test_where_clause_suffix(self) -> None:
+        self.assertEqual(add_schema_filter("where c.table_name = 'a' OR c.table_name = 'b'", 'schema', "f'oo"),
+                         "WHERE (c.table_name = 'a' OR c.table_name = 'b') AND schema = 'f''oo'")
+
+    def test_where_clause_suffix_without_where(self) -> None:
+        with self.assertRaises(ValueError):
+            add_schema_filter("LIMIT 10", 'schema', 'foo')
+
+
+class TestSchemaPartitionedSQLAlchemyExtractor(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.conf = ConfigFactory.from_dict({
+            SchemaPartitionedSQLAlchemyExtractor.CONN_STRING: 'TEST_CONNECTION',
+            SchemaPartitionedSQLAlchemyExtractor.LIST_SCHEMAS_SQL: 'SELECT schema_name',
+            SchemaPartitionedSQLAlchemyExtractor.CONCURRENCY: 2,
+        })
+
+    def _extract_all(self, extractor: SchemaPartitionedSQLAlchemyExtractor) -> List[Any]:
+        results = []
+        record = extractor.extract()
+        while record:
+            results.append(record)
+            record = extractor.extract()
+        return results
+
+    @patch('databuilder.extractor.schema_partitioned_sql_alchemy_extractor.create_engine')
+    def test_extraction_in_schema_order(self, mock_create_engine: Any) -> None:
+        def execute(sql: str) -> List[Any]:
+            if sql == 'SELECT schema_name':
+                return [('a',), ('b',), ('c',), ('d',), ('e',)]
+            return [{'schema': sql, 'id': 1}, {'schema': sql, 'id': 2}]
+
+        connection = MagicMock()
+        connection.execute.side_effect = execute
+        mock_create_engine.return_value.connect.return_value = connection
+
+        extractor = SchemaPartitionedSQLAlchemyExtractor(lambda schema: schema)
+        extractor.init(self.conf)
+        results = self._extract_all(extractor)
+        extractor.close()
+
+        self.assertEqual([(r['schema'], r['id']) for r in results],
+                         [(s, i) for s in ['a', 'b', 'c', 'd', 'e'] for i in [1, 2]])
+        connection.close.assert_called()
+
+    @patch('databuilder.extractor.schema_partitioned_sql_alchemy_extractor.create_engine')
+    def test_extraction_with_schemas(self, mock_create_engine: Any) -> None:
+        connection = MagicMock()
+        connection.execute.side_effect = lambda sql: [{'sql': sql}]
+        mock_create_engine.return_value.connect.return_value = connection
+
+        conf = ConfigFactory.from_dict({SchemaPartitionedSQLAlchemyExtractor.SCHEMAS: ['x', 'y']})\
+            .with_fallback(self.conf)
+        extractor = SchemaPartitionedSQLAlchemyExtractor(lambda schema: f'SELECT {schema}')
+        extractor.init(conf)
+        results = self._extract_all(extractor)
+        extractor.close()
+
+        self.assertEqual(results, [{'sql': 'SELECT x'}, {'sql': 'SELECT y'}])
+
+    @patch('databuilder.extractor.schema_partitioned_sql_alchemy_extractor.create_engine')
+    def test_extraction_with_schema_timeout(self, mock_create_engine: Any) -> None:
+        released = threading.Event()
+
+        def execute(sql: str) -> List[Any]:
+            if sql == 'slow':
+                released.wait(5)
+            return [{'sql': sql}]
+
+        connection = MagicMock()
+        connection.execute.side_effect = execute
+        mock_create_engine.return_value.connect.return_value = connection
+
+        conf = ConfigFactory.from_dict({SchemaPartitionedSQLAlchemyExtractor.SCHEMAS: ['slow', 'other'],
+                                        SchemaPartitionedSQLAlchemyExtractor.SCHEMA_TIMEOUT_SEC: 0.1,
+                                        SchemaPartitionedSQLAlchemyExtractor.CONCURRENCY: 1,
+                                        SchemaPartitionedSQLAlchemyExtractor.STATEMENT_TIMEOUT_SQL:
+                                            'SET statement_timeout = {timeout_ms}'})\
+            .with_fallback(self.conf)
+        extractor = SchemaPartitionedSQLAlchemyExtractor(lambda schema: schema)
+        extractor.init(conf)
+        try:
+            with self.assertRaises(TimeoutError):
+                extractor.extract()
+            connection.invalidate.assert_called()
+
+            # Closing doesn't wait for the hung query
+            extractor.close()
+            self.assertFalse(released.is_set())
+        finally:
+            released.set()
+
+        executed = [c[0][0] for c in connection.execute.call_args_list]
+        self.assertEqual(executed, ['SET statement_timeout = 100', 'slow'])
+
+    @patch('databuilder.extractor.schema_partitioned_sql_alchemy_extractor.create_engine')
+    def test_postgres_metadata_extraction_by_schema(self, mock_create_engine: Any) -> None:
+        def execute(sql: str) -> List[Any]:
+            if 'pg_namespace' in sql:
+                return [('schema_a',), ('schema_b',)]
+            schema = 'schema_a' if "'schema_a'" in sql else 'schema_b'
+            return [{'schema': schema, 'name': 'test_table', 'description': None, 'cluster': 'MY_CLUSTER',
+                     'col_name': 'id', 'col_type': 'bigint', 'col_description': None, 'col_sort_order': 0}]
+
+        connection = MagicMock()
+        connection.execute.side_effect = execute
+        mock_create_engine.return_value.connect.return_value = connection
+
+        conf = ConfigFactory.from_dict({
+            f'extractor.sqlalchemy.{SchemaPartitionedSQLAlchemyExtractor.CONN_STRING}': 'TEST_CONNECTION',
+            PostgresMetadataExtractor.CLUSTER_KEY: 'MY_CLUSTER',
+            PostgresMetadataExtractor.USE_CATALOG_AS_CLUSTER_NAME: False,
+            PostgresMetadataExtractor.WHERE_CLAUSE_SUFFIX_KEY: "WHERE c.table_name = 'test_table'",
+            PostgresMetadataExtractor.SCHEMA_CONCURRENCY: 2,
+        })
+        extractor = PostgresMetadataExtractor()
+        extractor.init(conf)
+        first = extractor.extract()
+        second = extractor.extract()
+        self.assertIsNone(extractor.extract())
+        extractor.close()
+
+        self.assertEqual((first.schema, second.schema), ('schema_a', 'schema_b'))  # type: ignore
+        executed = [c[0][0] for c in connection.execute.call_args_list]
+        self.assertTrue(any("WHERE (c.table_name = 'test_table') AND c.table_schema = 'schema_a'" in sql
+                            for sql in executed))
+        # System schemas are not listed, so they don't get a query of their own
+        self.assertIn("substring(nspname, 1, 3) <> 'pg_' AND nspname <> 'information_schema'", executed[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,8 +2,12 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import logging
+import os
+import tempfile
 import unittest
-from typing import Any, Dict
+from typing import (
+    Any, Dict, List,
+)
 
 from mock import MagicMock, patch
 from pyhocon import ConfigFactory
@@ -11,6 +15,8 @@ from pyhocon import ConfigFactory
 from databuilder.extractor.snowflake_metadata_extractor import SnowflakeMetadataExtractor
 from databuilder.extractor.sql_alchemy_extractor import SQLAlchemyExtractor
 from databuilder.models.table_metadata import ColumnMetadata, TableMetadata
+from databuilder.state.fs_state_store import FsStateStore
+from databuilder.state.incremental_extraction import IncrementalExtraction
 
 
 class TestSnowflakeMetadataExtractor(unittest.TestCase):
@@ -395,5 +401,59 @@ class TestSnowflakeMetadataExtractorTableCatalogEnabled(unittest.TestCase):
             self.assertFalse(self.cluster_key in extractor.sql_stmt)
 
 
+class TestSnowflakeMetadataExtractorIncremental(unittest.TestCase):
+    def setUp(self) -> None:
+        logging.basicConfig(level=logging.INFO)
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+        config_dict = {
+            f'extractor.sqlalchemy.{SQLAlchemyExtractor.CONN_STRING}': 'TEST_CONNECTION',
+            SnowflakeMetadataExtractor.USE_CATALOG_AS_CLUSTER_NAME: False,
+            f'state_store.fs.{FsStateStore.STATE_FILE_PATH}': os.path.join(self.temp_dir.name, 'state.json'),
+        }
+        self.conf = ConfigFactory.from_dict(config_dict)
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def _run(self, rows: List[Dict[str, Any]], table_rows: List[Dict[str, Any]]) -> List[str]:
+        """
+        Runs an extraction and commits the state
+        :return: SQL statements executed
+        """
+        with patch.object(SQLAlchemyExtractor, '_get_connection') as mock_connection:
+            connection = MagicMock()
+            mock_connection.return_value = connection
+            connection.execute.side_effect = lambda sql: table_rows if 'SELECT DISTINCT' in sql else rows
+
+            state_store = FsStateStore()
+            extractor = SnowflakeMetadataExtractor(state_store=state_store)
+            extractor.init(self.conf)
+            while extractor.extract():
+                pass
+            state_store.on_success()
+            return [c[0][0] for c in connection.execute.call_args_list]
+
+    def test_incremental_extraction(self) -> None:
+        def row(name: str, last_altered: int) -> Dict[str, Any]:
+            return {'col_name': 'id', 'col_type': 'number', 'col_description': None, 'col_sort_order': 0,
+                    'cluster': 'master', 'schema': 'test_schema', 'name': name, 'description': None,
+                    'is_view': 'false', 'last_altered': last_altered}
+
+        executed = self._run([row('foo', 100), row('bar', 200)], [])
+        self.assertEqual(len(executed), 1)
+        self.assertNotIn('to_timestamp_ltz', executed[0])
+
+        table_rows = [{'cluster': 'master', 'schema': 'test_schema', 'name': name} for name in ['foo', 'bar', 'baz']]
+        executed = self._run([row('bar', 300)], table_rows)
+        self.assertIn('WHERE t.last_altered >= to_timestamp_ltz(200)', executed[0])
+
+        state_store = FsStateStore()
+        state_store.init(self.conf.get('state_store.fs'))
+        self.assertEqual(IncrementalExtraction(state_store, 'snowflake.prod').watermark, 300)
+        self.assertEqual(IncrementalExtraction.get_untouched_table_keys(state_store, 'snowflake.prod'),
+                         ['snowflake://master.test_schema/baz', 'snowflake://master.test_schema/foo'])
+
+
 if __name__ == '__main__':
     unittest.main()
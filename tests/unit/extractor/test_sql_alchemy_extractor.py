@@ -4,7 +4,7 @@
 import unittest
 from typing import Any, Dict
 
-from mock import patch
+from mock import MagicMock, patch
 from pyhocon import ConfigFactory
 
 from databuilder import Scoped
@@ -63,6 +63,34 @@ class TestSqlAlchemyExtractor(unittest.TestCase):
         self.assertEqual(result,
                          ['test_result', 'test_result2', 'test_result3'])
 
+    @patch.object(SQLAlchemyExtractor, '_get_connection')
+    def test_extraction_with_stream_results(self: Any, mock_method: Any) -> None:
+        """
+        Test Extraction streaming results in batches of fetch size
+        """
+        config_dict = {
+            'extractor.sqlalchemy.conn_string': 'TEST_CONNECTION',
+            'extractor.sqlalchemy.extract_sql': 'SELECT 1 FROM TEST_TABLE;',
+            f'extractor.sqlalchemy.{SQLAlchemyExtractor.STREAM_RESULTS}': True,
+            f'extractor.sqlalchemy.{SQLAlchemyExtractor.FETCH_SIZE}': 2
+        }
+        self.conf = ConfigFactory.from_dict(config_dict)
+
+        mock_results = MagicMock()
+        mock_results.fetchmany.side_effect = [['test_result', 'test_result2'], ['test_result3'], []]
+        mock_connection = mock_method.return_value
+        mock_connection.execution_options.return_value.execute.return_value = mock_results
+
+        extractor = SQLAlchemyExtractor()
+        extractor.init(Scoped.get_scoped_conf(conf=self.conf,
+                                              scope=extractor.get_scope()))
+        result = [extractor.extract() for _ in range(4)]
+
+        mock_connection.execution_options.assert_called_once_with(stream_results=True)
+        mock_results.fetchmany.assert_called_with(2)
+        self.assertEqual(result,
+                         ['test_result', 'test_result2', 'test_result3', None])
+
     @patch.object(SQLAlchemyExtractor, '_get_connection')
     def test_extraction_with_model_class(self: Any, mock_method: Any) -> None:
         """
@@ -51,6 +51,25 @@ class TestFileSystemMySQLCSVLoader(unittest.TestCase):
         self.maxDiff = None
         self.assertDictEqual(expected_records, actual_records)
 
+    def test_load_max_open_files(self) -> None:
+        actors = [Actor('Tom Cruise'), Actor('Meg Ryan')]
+        movie = Movie('Top Gun', actors)
+
+        loader = FSMySQLCSVLoader()
+        loader.init(self._conf.with_fallback(ConfigFactory.from_dict({FSMySQLCSVLoader.MAX_OPEN_FILES: 1})))
+        loader.load(movie)
+
+        loader.close()
+
+        expected_record_path = '{}/../resources/fs_mysql_csv_loader/records'.format(
+            os.path.join(os.path.dirname(__file__))
+        )
+        expected_records = self._get_csv_rows(expected_record_path)
+        actual_records = self._get_csv_rows(self._conf.get_string(FSMySQLCSVLoader.RECORD_DIR_PATH))
+
+        self.maxDiff = None
+        self.assertDictEqual(expected_records, actual_records)
+
     def _get_csv_rows(self, path: str) -> Dict[str, Any]:
         files = [join(path, f) for f in listdir(path) if isfile(join(path, f))]
 
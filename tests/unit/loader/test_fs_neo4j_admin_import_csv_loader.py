@@ -0,0 +1,153 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+import csv
+import os
+import tempfile
+import unittest
+from os import listdir
+from typing import Any, List
+
+from pyhocon import ConfigFactory
+
+from databuilder.job.base_job import Job
+from databuilder.loader.file_system_neo4j_admin_import_csv_loader import FsNeo4jAdminImportCSVLoader
+from databuilder.models.graph_node import GraphNode
+from databuilder.models.graph_relationship import GraphRelationship
+from databuilder.models.graph_serializable import GraphSerializable
+from tests.unit.models.test_graph_serializable import (
+    Actor, City, Movie,
+)
+
+
+class Review(GraphSerializable):
+    def __init__(self, movie: str, score: int, rating: float, recommended: bool) -> None:
+        self._nodes = iter([GraphNode(key=f'review://{movie}', label='Review',
+                                      attributes={'score': score, 'rating': rating, 'recommended': recommended})])
+        self._relations = iter([GraphRelationship(start_label='Movie', start_key=f'movie://{movie}',
+                                                  end_label='Review', end_key=f'review://{movie}',
+                                                  type='REVIEW', reverse_type='REVIEW_OF', attributes={})])
+
+    def create_next_node(self) -> Any:
+        return next(self._nodes, None)
+
+    def create_next_relation(self) -> Any:
+        return next(self._relations, None)
+
+
+class Relation(GraphSerializable):
+    def __init__(self, relation: GraphRelationship) -> None:
+        self._relations = iter([relation])
+
+    def create_next_node(self) -> Any:
+        return None
+
+    def create_next_relation(self) -> Any:
+        return next(self._relations, None)
+
+
+class TestFsNeo4jAdminImportCSVLoader(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.node_dir = os.path.join(self.temp_dir.name, 'nodes')
+        self.relation_dir = os.path.join(self.temp_dir.name, 'relationships')
+        self.loader = FsNeo4jAdminImportCSVLoader()
+        self.loader.init(ConfigFactory.from_dict({
+            FsNeo4jAdminImportCSVLoader.NODE_DIR_PATH: self.node_dir,
+            FsNeo4jAdminImportCSVLoader.RELATION_DIR_PATH: self.relation_dir,
+            FsNeo4jAdminImportCSVLoader.JOB_PUBLISH_TAG: 'unique_tag',
+        }))
+
+    def tearDown(self) -> None:
+        Job.closer.close()
+        self.temp_dir.cleanup()
+
+    def _read_file(self, path: str, prefix: str) -> List[List[str]]:
+        """
+        Reads the rows of the only file of the directory whose name starts with the prefix
+        """
+        file_names = [file_name for file_name in listdir(path) if file_name.startswith(prefix)]
+        self.assertEqual(len(file_names), 1, file_names)
+        with open(os.path.join(path, file_names[0]), 'r') as f:
+            return list(csv.reader(f))
+
+    def test_load(self) -> None:
+        movie = Movie('Top Gun', [Actor('Tom Cruise'), Actor('Meg Ryan')], [City('San Diego')])
+        self.loader.load(movie)
+        self.loader.load(Movie('Top Gun', [Actor('Tom Cruise')], []))
+        self.loader.close()
+
+        actor_rows = self._read_file(self.node_dir, 'Actor_')
+        self.assertEqual(actor_rows[0], ['key:ID(Actor)', ':LABEL', 'name', 'published_tag',
+                                         'publisher_last_updated_epoch_ms:long'])
+        self.assertEqual([row[:4] for row in actor_rows[1:3]],
+                         [['actor://Tom Cruise', 'Actor', 'Top Gun', 'unique_tag'],
+                          ['actor://Meg Ryan', 'Actor', 'Top Gun', 'unique_tag']])
+
+        actor_relation_rows = self._read_file(self.relation_dir, 'Movie_Actor_ACTOR_')
+        self.assertEqual(actor_relation_rows[0],
+                         [':START_ID(Movie)', ':END_ID(Actor)', ':TYPE', 'published_tag',
+                          'publisher_last_updated_epoch_ms:long'])
+        # Relations of the second movie are duplicates, written only once
+        self.assertEqual([row[:3] for row in actor_relation_rows[1:]],
+                         [['movie://Top Gun', 'actor://Tom Cruise', 'ACTOR'],
+                          ['movie://Top Gun', 'actor://Meg Ryan', 'ACTOR']])
+        self.assertEqual([row[:3] for row in self._read_file(self.relation_dir, 'Actor_Movie_ACTED_IN_')[1:]],
+                         [['actor://Tom Cruise', 'movie://Top Gun', 'ACTED_IN'],
+                          ['actor://Meg Ryan', 'movie://Top Gun', 'ACTED_IN']])
+        self.assertEqual([row[:3] for row in self._read_file(self.relation_dir, 'City_Movie_APPEARS_IN_')[1:]],
+                         [['city://San Diego', 'movie://Top Gun', 'APPEARS_IN']])
+
+    def test_reversed_relation(self) -> None:
+        self.loader.load(Review('Top Gun', score=5, rating=4.5, recommended=True))
+        # The same relationships, given from the review
+        self.loader.load(Relation(GraphRelationship(start_label='Review', start_key='review://Top Gun',
+                                                    end_label='Movie', end_key='movie://Top Gun',
+                                                    type='REVIEW_OF', reverse_type='REVIEW', attributes={})))
+        self.loader.close()
+
+        self.assertEqual([row[:3] for row in self._read_file(self.relation_dir, 'Movie_Review_REVIEW_')[1:]],
+                         [['movie://Top Gun', 'review://Top Gun', 'REVIEW']])
+        self.assertEqual([row[:3] for row in self._read_file(self.relation_dir, 'Review_Movie_REVIEW_OF_')[1:]],
+                         [['review://Top Gun', 'movie://Top Gun', 'REVIEW_OF']])
+
+    def test_deduplicate_records(self) -> None:
+        loader = FsNeo4jAdminImportCSVLoader()
+        node_dir = os.path.join(self.temp_dir.name, 'deduplicated_nodes')
+        loader.init(ConfigFactory.from_dict({
+            FsNeo4jAdminImportCSVLoader.NODE_DIR_PATH: node_dir,
+            FsNeo4jAdminImportCSVLoader.RELATION_DIR_PATH: os.path.join(self.temp_dir.name, 'deduplicated_rels'),
+            FsNeo4jAdminImportCSVLoader.DEDUPLICATE_RECORDS: True,
+        }))
+        loader.load(Movie('Top Gun', [Actor('Tom Cruise')], []))
+        loader.load(Movie('Top Gun', [Actor('Tom Cruise')], []))
+        loader.close()
+
+        self.assertEqual(len(self._read_file(node_dir, 'Actor_')), 2)
+        self.assertEqual(len(self._read_file(node_dir, 'Movie_')), 2)
+
+    def test_typed_columns(self) -> None:
+        self.loader.load(Review('Top Gun', score=5, rating=4.5, recommended=True))
+        self.loader.close()
+
+        rows = self._read_file(self.node_dir, 'Review_')
+        self.assertEqual(rows[0][:5], ['key:ID(Review)', ':LABEL', 'score:long', 'rating:double',
+                                       'recommended:boolean'])
+        self.assertEqual(rows[1][:5], ['review://Top Gun', 'Review', '5', '4.5', 'true'])
+
+    def test_unsupported_files(self) -> None:
+        for option, value in [(FsNeo4jAdminImportCSVLoader.COMPRESSION, 'zstd'),
+                              (FsNeo4jAdminImportCSVLoader.FILE_FORMAT, 'parquet')]:
+            loader = FsNeo4jAdminImportCSVLoader()
+            with self.assertRaises(ValueError):
+                loader.init(ConfigFactory.from_dict({
+                    FsNeo4jAdminImportCSVLoader.NODE_DIR_PATH: os.path.join(self.temp_dir.name, option, 'nodes'),
+                    FsNeo4jAdminImportCSVLoader.RELATION_DIR_PATH: os.path.join(self.temp_dir.name, option,
+                                                                                'relationships'),
+                    option: value,
+                }))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,7 @@
 
 import collections
 import csv
+import gzip
 import logging
 import os
 import unittest
@@ -20,6 +21,8 @@ from databuilder.loader.file_system_neo4j_csv_loader import FsNeo4jCSVLoader
 from databuilder.models.graph_serializable import (
     GraphNode, GraphRelationship, GraphSerializable,
 )
+from databuilder.publisher.csv_record_reader import CsvRecordReader
+from databuilder.publisher.record_reader import RecordReader
 from tests.unit.models.test_graph_serializable import (
     Actor, City, Movie,
 )
@@ -82,6 +85,133 @@ class TestFsNeo4jCSVLoader(unittest.TestCase):
                                           itemgetter('KEY'))
         self.assertEqual(expected_nodes, actual_nodes)
 
+    def test_load_compressed(self) -> None:
+        actors = [Actor('Tom Cruise'), Actor('Meg Ryan')]
+        cities = [City('San Diego'), City('Oakland')]
+        movie = Movie('Top Gun', actors, cities)
+
+        loader = FsNeo4jCSVLoader()
+
+        folder = 'movies'
+        conf = self._make_conf(folder).with_fallback(ConfigFactory.from_dict({
+            FsNeo4jCSVLoader.COMPRESSION: 'gzip'
+        }))
+
+        loader.init(conf)
+        loader.load(movie)
+        loader.close()
+
+        node_dir = conf.get_string(FsNeo4jCSVLoader.NODE_DIR_PATH)
+        self.assertEqual(sorted(listdir(node_dir)), ['Actor_0.csv.gz', 'City_0.csv.gz', 'Movie_0.csv.gz'])
+        with gzip.open(join(node_dir, 'Movie_0.csv.gz'), 'rt') as f:
+            self.assertEqual(f.read().splitlines(), ['"LABEL","KEY","name"', '"Movie","movie://Top Gun","Top Gun"'])
+
+        expected_node_path = os.path.join(here, f'../resources/fs_neo4j_csv_loader/{folder}/nodes')
+        expected_nodes = self._get_csv_rows(expected_node_path, itemgetter('KEY'))
+        actual_nodes = sorted((collections.OrderedDict(sorted(record.items()))
+                               for f in listdir(node_dir)
+                               for record in CsvRecordReader().read(join(node_dir, f))),
+                              key=itemgetter('KEY'))
+        self.assertEqual(expected_nodes, actual_nodes)
+
+    def test_load_max_open_files(self) -> None:
+        movies = [Movie('Top Gun', [Actor('Tom Cruise')], [City('San Diego')]),
+                  Movie('Rain Man', [Actor('Dustin Hoffman')], [City('Cincinnati')])]
+
+        loader = FsNeo4jCSVLoader()
+
+        folder = 'max_open_files'
+        conf = self._make_conf(folder).with_fallback(ConfigFactory.from_dict({
+            FsNeo4jCSVLoader.COMPRESSION: 'gzip',
+            FsNeo4jCSVLoader.MAX_OPEN_FILES: 1,
+        }))
+
+        loader.init(conf)
+        for movie in movies:
+            loader.load(movie)
+        loader.close()
+
+        node_dir = conf.get_string(FsNeo4jCSVLoader.NODE_DIR_PATH)
+        self.assertEqual(sorted(listdir(node_dir)), ['Actor_0.csv.gz', 'City_0.csv.gz', 'Movie_0.csv.gz'])
+        with gzip.open(join(node_dir, 'Movie_0.csv.gz'), 'rt') as f:
+            self.assertEqual(f.read().splitlines(), ['"LABEL","KEY","name"',
+                                                     '"Movie","movie://Top Gun","Top Gun"',
+                                                     '"Movie","movie://Rain Man","Rain Man"'])
+
+        relation_dir = conf.get_string(FsNeo4jCSVLoader.RELATION_DIR_PATH)
+        relations = [record for f in listdir(relation_dir)
+                     for record in CsvRecordReader().read(join(relation_dir, f))]
+        self.assertEqual(len(relations), 4)
+
+    def test_load_deduplicate_records(self) -> None:
+        cities = [City('San Diego')]
+        movies = [Movie('Top Gun', [Actor('Tom Cruise')], cities),
+                  Movie('Jerry Maguire', [Actor('Tom Cruise')], cities),
+                  Movie('Top Gun', [Actor('Tom Cruise')], cities)]
+
+        loader = FsNeo4jCSVLoader()
+
+        folder = 'deduplicate_records'
+        conf = self._make_conf(folder).with_fallback(ConfigFactory.from_dict({
+            FsNeo4jCSVLoader.DEDUPLICATE_RECORDS: True,
+        }))
+
+        loader.init(conf)
+        for movie in movies:
+            loader.load(movie)
+        loader.close()
+
+        # Actor and City nodes are named after the movie, so only the ones loaded with the same movie are identical
+        actual_nodes = self._get_csv_rows(conf.get_string(FsNeo4jCSVLoader.NODE_DIR_PATH), itemgetter('KEY', 'name'))
+        self.assertEqual([(node['KEY'], node['name']) for node in actual_nodes],
+                         [('actor://Tom Cruise', 'Jerry Maguire'), ('actor://Tom Cruise', 'Top Gun'),
+                          ('city://San Diego', 'Jerry Maguire'), ('city://San Diego', 'Top Gun'),
+                          ('movie://Jerry Maguire', 'Jerry Maguire'), ('movie://Top Gun', 'Top Gun')])
+        actual_relations = self._get_csv_rows(conf.get_string(FsNeo4jCSVLoader.RELATION_DIR_PATH),
+                                              itemgetter('START_KEY', 'END_KEY'))
+        self.assertEqual([(relation['START_KEY'], relation['END_KEY']) for relation in actual_relations],
+                         [('movie://Jerry Maguire', 'actor://Tom Cruise'),
+                          ('movie://Jerry Maguire', 'city://San Diego'),
+                          ('movie://Top Gun', 'actor://Tom Cruise'),
+                          ('movie://Top Gun', 'city://San Diego')])
+
+    def test_load_parquet(self) -> None:
+        actors = [Actor('Tom Cruise'), Actor('Meg Ryan')]
+        cities = [City('San Diego'), City('Oakland')]
+        movie = Movie('Top Gun', actors, cities)
+
+        loader = FsNeo4jCSVLoader()
+
+        folder = 'movies'
+        conf = self._make_conf(folder).with_fallback(ConfigFactory.from_dict({
+            FsNeo4jCSVLoader.FILE_FORMAT: 'parquet',
+            FsNeo4jCSVLoader.COMPRESSION: 'zstd',
+            FsNeo4jCSVLoader.PARQUET_ROW_GROUP_SIZE: 1,
+        }))
+
+        loader.init(conf)
+        loader.load(movie)
+        loader.load(Person('Taylor', job='Engineer'))
+        loader.close()
+
+        node_dir = conf.get_string(FsNeo4jCSVLoader.NODE_DIR_PATH)
+        self.assertEqual(sorted(listdir(node_dir)),
+                         ['Actor_0.parquet', 'City_0.parquet', 'Movie_0.parquet', 'Person_2.parquet'])
+
+        reader = RecordReader()
+        self.assertEqual(list(reader.read(join(node_dir, 'Actor_0.parquet'))),
+                         [{'LABEL': 'Actor', 'KEY': 'actor://Tom Cruise', 'name': 'Top Gun'},
+                          {'LABEL': 'Actor', 'KEY': 'actor://Meg Ryan', 'name': 'Top Gun'}])
+
+        expected_rel_path = os.path.join(here, f'../resources/fs_neo4j_csv_loader/{folder}/relationships')
+        expected_relations = self._get_csv_rows(expected_rel_path, itemgetter('START_KEY', 'END_KEY'))
+        relation_dir = conf.get_string(FsNeo4jCSVLoader.RELATION_DIR_PATH)
+        actual_relations = sorted((collections.OrderedDict(sorted(record.items()))
+                                   for f in listdir(relation_dir)
+                                   for record in reader.read(join(relation_dir, f))),
+                                  key=itemgetter('START_KEY', 'END_KEY'))
+        self.assertEqual(expected_relations, actual_relations)
+
     def _make_conf(self, test_name: str) -> ConfigTree:
         prefix = '/var/tmp/TestFsNeo4jCSVLoader'
 
@@ -0,0 +1,83 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import tempfile
+import unittest
+from os import listdir
+
+from pyhocon import ConfigFactory
+
+from databuilder.job.base_job import Job
+from databuilder.loader.file_system_neo4j_csv_loader import FsNeo4jCSVLoader
+from databuilder.loader.graph_streaming_loader import GraphStreamingLoader
+from tests.unit.models.test_graph_serializable import (
+    Actor, City, Movie,
+)
+
+
+class TestGraphStreamingLoader(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def tearDown(self) -> None:
+        Job.closer.close()
+
+    def test_load(self) -> None:
+        loader = GraphStreamingLoader()
+        loader.init(ConfigFactory.from_dict({GraphStreamingLoader.BATCH_SIZE: 5}))
+
+        loader.load(Movie('Top Gun', [Actor('Tom Cruise'), Actor('Meg Ryan')], [City('San Diego')]))
+        loader.load(Movie('Rain Man', [Actor('Dustin Hoffman')], [City('Cincinnati')]))
+        loader.close()
+
+        batches = list(loader.iter_batches())
+        self.assertEqual([(len(nodes), len(relations)) for nodes, relations in batches], [(4, 3), (3, 2)])
+        self.assertEqual(batches[1][0][0].key, 'movie://Rain Man')
+
+    def test_load_with_csv_files(self) -> None:
+        node_dir = os.path.join(self.temp_dir.name, 'nodes')
+        relation_dir = os.path.join(self.temp_dir.name, 'relations')
+        loader = GraphStreamingLoader()
+        loader.init(ConfigFactory.from_dict({FsNeo4jCSVLoader.NODE_DIR_PATH: node_dir,
+                                             FsNeo4jCSVLoader.RELATION_DIR_PATH: relation_dir,
+                                             FsNeo4jCSVLoader.SHOULD_DELETE_CREATED_DIR: False}))
+
+        loader.load(Movie('Top Gun', [Actor('Tom Cruise')], [City('San Diego')]))
+        loader.close()
+
+        self.assertEqual([(len(nodes), len(relations)) for nodes, relations in loader.iter_batches()], [(3, 2)])
+        self.assertEqual(sorted(listdir(node_dir)), ['Actor_0.csv', 'City_0.csv', 'Movie_0.csv'])
+        with open(os.path.join(node_dir, 'Movie_0.csv')) as f:
+            self.assertEqual(f.read().splitlines(), ['"LABEL","KEY","name"', '"Movie","movie://Top Gun","Top Gun"'])
+        self.assertEqual(len(listdir(relation_dir)), 2)
+
+    def test_load_after_abort(self) -> None:
+        loader = GraphStreamingLoader()
+        loader.init(ConfigFactory.from_dict({GraphStreamingLoader.BATCH_SIZE: 1}))
+
+        loader.abort()
+        with self.assertRaises(RuntimeError):
+            loader.load(Movie('Top Gun', [Actor('Tom Cruise')], [City('San Diego')]))
+        loader.close()
+
+    def test_close_after_fail(self) -> None:
+        loader = GraphStreamingLoader()
+        loader.init(ConfigFactory.from_dict({GraphStreamingLoader.BATCH_SIZE: 6}))
+
+        loader.load(Movie('Top Gun', [Actor('Tom Cruise'), Actor('Meg Ryan')], [City('San Diego')]))
+        loader.load(Movie('Rain Man', [Actor('Dustin Hoffman')], [City('Cincinnati')]))
+        loader.fail()
+        loader.close()
+
+        batches = loader.iter_batches()
+        self.assertEqual(len(next(batches)[0]), 4)
+        # The last batch is not handed to the publisher, which is told that the task failed
+        with self.assertRaises(RuntimeError):
+            next(batches)
+
+
+if __name__ == '__main__':
+    unittest.main()
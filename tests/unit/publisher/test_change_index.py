@@ -0,0 +1,81 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import tempfile
+import unittest
+from typing import Dict
+
+from databuilder.publisher.change_index import ChangeIndex
+
+
+class TestChangeIndex(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'index', 'index.db')
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_is_changed(self) -> None:
+        index = ChangeIndex(self.path)
+        self.assertTrue(index.is_changed('Table:foo', {'KEY': 'foo', 'name': 'foo'}))
+        self.assertFalse(index.is_changed('Table:foo', {'name': 'foo', 'KEY': 'foo'}))
+        index.on_success()
+        index.close()
+
+        index = ChangeIndex(self.path)
+        self.assertFalse(index.is_changed('Table:foo', {'KEY': 'foo', 'name': 'foo'}))
+        self.assertTrue(index.is_changed('Table:foo', {'KEY': 'foo', 'name': 'bar'}))
+        index.close()
+
+    def test_discard_on_failure(self) -> None:
+        index = ChangeIndex(self.path)
+        self.assertTrue(index.is_changed('Table:foo', {'KEY': 'foo'}))
+        index.on_failure()
+        index.close()
+
+        index = ChangeIndex(self.path)
+        self.assertTrue(index.is_changed('Table:foo', {'KEY': 'foo'}))
+        index.close()
+
+    def test_pending(self) -> None:
+        index = ChangeIndex(self.path)
+        pending: Dict[str, str] = {}
+        self.assertTrue(index.is_changed('Table:foo', {'KEY': 'foo'}, pending=pending))
+        self.assertEqual(list(pending.keys()), ['Table:foo'])
+        # Not staged until stage is called
+        self.assertTrue(index.is_changed('Table:foo', {'KEY': 'foo'}, pending={}))
+
+        index.stage(pending)
+        self.assertFalse(index.is_changed('Table:foo', {'KEY': 'foo'}, pending={}))
+        index.on_success()
+        index.close()
+
+        index = ChangeIndex(self.path)
+        self.assertFalse(index.is_changed('Table:foo', {'KEY': 'foo'}))
+        index.close()
+
+    def test_remove_unseen(self) -> None:
+        index = ChangeIndex(self.path, track_unseen=True)
+        index.is_changed('a', {'KEY': 'a'})
+        index.is_changed('b', {'KEY': 'b'})
+        index.on_success()
+        index.close()
+
+        index = ChangeIndex(self.path, track_unseen=True)
+        self.assertFalse(index.is_changed('a', {'KEY': 'a'}))
+        self.assertEqual(index.remove_unseen(), ['b'])
+        index.on_success()
+        index.close()
+
+        index = ChangeIndex(self.path)
+        self.assertTrue(index.is_changed('b', {'KEY': 'b'}))
+        with self.assertRaises(ValueError):
+            index.remove_unseen()
+        index.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+import gzip
+import os
+import tempfile
+import unittest
+
+import pandas
+
+from databuilder.publisher.csv_record_reader import CsvRecordReader
+
+here = os.path.dirname(__file__)
+
+
+class TestCsvRecordReader(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'records.csv')
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def _write(self, content: str) -> None:
+        with open(self.path, 'w', encoding='utf8') as f:
+            f.write(content)
+
+    def test_column_types(self) -> None:
+        self._write('"KEY","order_pos:UNQUOTED","score","is_view","description","mixed"\n'
+                    '"a",1,"1.5","True","","1"\n'
+                    '"b",2,"2","false","foo","x"\n')
+
+        records = list(CsvRecordReader().read(self.path))
+
+        self.assertEqual(records, [
+            {'KEY': 'a', 'order_pos:UNQUOTED': 1, 'score': 1.5, 'is_view': True, 'description': '', 'mixed': '1'},
+            {'KEY': 'b', 'order_pos:UNQUOTED': 2, 'score': 2.0, 'is_view': False, 'description': 'foo', 'mixed': 'x'},
+        ])
+        self.assertIsInstance(records[0]['order_pos:UNQUOTED'], int)
+
+    def test_same_records_as_pandas(self) -> None:
+        for directory in ['nodes', 'relations']:
+            resource_dir = os.path.join(here, '../resources/csv_publisher', directory)
+            for file_name in os.listdir(resource_dir):
+                path = os.path.join(resource_dir, file_name)
+                expected = pandas.read_csv(path, na_filter=False).to_dict(orient='records')
+                self.assertEqual(list(CsvRecordReader().read(path)), expected, path)
+
+    def test_kinds_inferred_from_all_rows(self) -> None:
+        self._write('KEY,pos,score\na,1,1\nb,2,2\nc,x,2.5\n')
+
+        # Later rows widen the kind of the column for the whole file, including the rows buffered first
+        records = list(CsvRecordReader(type_inference_rows=2).read(self.path))
+
+        self.assertEqual([r['pos'] for r in records], ['1', '2', 'x'])
+        self.assertEqual([r['score'] for r in records], [1.0, 2.0, 2.5])
+        self.assertIsInstance(records[0]['score'], float)
+
+    def test_kinds_across_batches(self) -> None:
+        self._write('KEY,pos\n' + ''.join(f'k{i},{i}\n' for i in range(4)) + 'k4,x\n')
+
+        batches = list(CsvRecordReader(type_inference_rows=2).read_batches(self.path, batch_size=2))
+
+        self.assertEqual([[r['pos'] for r in batch] for batch in batches], [['0', '1'], ['2', '3'], ['x']])
+
+    def test_read_batches(self) -> None:
+        self._write('KEY\n' + ''.join(f'k{i}\n' for i in range(5)))
+
+        batches = list(CsvRecordReader(type_inference_rows=2).read_batches(self.path, batch_size=2))
+
+        self.assertEqual([[r['KEY'] for r in batch] for batch in batches], [['k0', 'k1'], ['k2', 'k3'], ['k4']])
+
+    def test_read_gzip(self) -> None:
+        path = os.path.join(self.temp_dir.name, 'records.csv.gz')
+        with gzip.open(path, 'wt', encoding='utf8') as f:
+            f.write('"KEY","pos"\r\n"a",1\r\n"b",2\r\n')
+
+        self.assertEqual(list(CsvRecordReader().read(path)), [{'KEY': 'a', 'pos': 1}, {'KEY': 'b', 'pos': 2}])
+
+    def test_empty_file(self) -> None:
+        self._write('KEY,name\n')
+
+        self.assertEqual(list(CsvRecordReader().read(self.path)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
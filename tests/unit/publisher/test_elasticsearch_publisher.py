@@ -2,10 +2,16 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import json
+import os
+import tempfile
 import unittest
+from typing import (
+    Any, Dict, List,
+)
 
+from elasticsearch.exceptions import TransportError
 from mock import (
-    MagicMock, mock_open, patch,
+    MagicMock, call, mock_open, patch,
 )
 from pyhocon import ConfigFactory
 
@@ -20,6 +26,7 @@ class TestElasticsearchPublisher(unittest.TestCase):
         self.test_file_mode = 'r'
 
         self.mock_es_client = MagicMock()
+        self.mock_es_client.bulk.return_value = {'errors': False, 'items': []}
         self.test_es_new_index = 'test_new_index'
         self.test_es_alias = 'test_index_alias'
         self.test_doc_type = 'test_doc_type'
@@ -31,6 +38,7 @@ class TestElasticsearchPublisher(unittest.TestCase):
                        'publisher.elasticsearch.alias': self.test_es_alias,
                        'publisher.elasticsearch.doc_type': self.test_doc_type}
 
+        self.config_dict = config_dict
         self.conf = ConfigFactory.from_dict(config_dict)
 
     def test_publish_with_no_data(self) -> None:
@@ -115,3 +123,226 @@ class TestElasticsearchPublisher(unittest.TestCase):
                 {'actions': [{"add": {"index": self.test_es_new_index, "alias": self.test_es_alias}},
                              {"remove_index": {"index": 'test_old_index'}}]}
             )
+
+    def _parallel_publisher(self, mock_data: str, **conf: Any) -> ElasticsearchPublisher:
+        conf_dict = dict(self.config_dict)
+        conf_dict.update({f'publisher.elasticsearch.{k}': v for k, v in conf.items()})
+        conf_dict[f'publisher.elasticsearch.{ElasticsearchPublisher.ELASTICSEARCH_PUBLISHER_THREAD_COUNT}'] = 2
+        conf_dict[f'publisher.elasticsearch.{ElasticsearchPublisher.ELASTICSEARCH_PUBLISHER_INITIAL_BACKOFF_SEC}'] = 0
+        with patch('builtins.open', mock_open(read_data=mock_data)):
+            publisher = ElasticsearchPublisher()
+            publisher.init(conf=Scoped.get_scoped_conf(conf=ConfigFactory.from_dict(conf_dict),
+                                                       scope=publisher.get_scope()))
+        return publisher
+
+    def _bulk_docs(self) -> List[List[Dict]]:
+        bulks = []
+        for bulk_call in self.mock_es_client.bulk.call_args_list:
+            lines = [json.loads(line) for line in bulk_call[0][0].splitlines()]
+            self.assertTrue(all(line == {'index': {'_type': self.test_doc_type, '_index': self.test_es_new_index}}
+                                for line in lines[0::2]))
+            bulks.append(lines[1::2])
+        return bulks
+
+    def test_parallel_publish_chunks(self) -> None:
+        docs = [{'id': i, 'name': 'x' * (i * 10)} for i in range(5)]
+        mock_data = '\n'.join(json.dumps(doc) for doc in docs)
+        self.mock_es_client.bulk.return_value = {'errors': False, 'items': []}
+        self.mock_es_client.indices.get_alias.return_value = {}
+
+        publisher = self._parallel_publisher(mock_data, batch_size=2)
+        publisher.publish()
+
+        bulks = self._bulk_docs()
+        self.assertEqual(sorted([doc['id'] for doc in bulk] for bulk in bulks), [[0, 1], [2, 3], [4]])
+        self.mock_es_client.indices.update_aliases.assert_called_once()
+
+        self.mock_es_client.bulk.reset_mock()
+        publisher = self._parallel_publisher(mock_data, max_chunk_bytes=200)
+        publisher.publish()
+
+        bulks = self._bulk_docs()
+        self.assertEqual(sorted(doc['id'] for bulk in bulks for doc in bulk), [0, 1, 2, 3, 4])
+        self.assertTrue(all(len(bulk) < 5 for bulk in bulks))
+
+    def test_parallel_publish_retries_rejected_documents(self) -> None:
+        mock_data = '\n'.join(json.dumps({'id': i}) for i in range(2))
+        self.mock_es_client.bulk.side_effect = [
+            TransportError(429, 'es_rejected_execution_exception'),
+            {'errors': True, 'items': [{'index': {'status': 201}}, {'index': {'status': 429}}]},
+            {'errors': False, 'items': [{'index': {'status': 201}}]},
+        ]
+        self.mock_es_client.indices.get_alias.return_value = {}
+
+        publisher = self._parallel_publisher(mock_data)
+        publisher.publish()
+
+        self.assertEqual([[doc['id'] for doc in bulk] for bulk in self._bulk_docs()], [[0, 1], [0, 1], [1]])
+        self.mock_es_client.indices.update_aliases.assert_called_once()
+
+    def test_parallel_publish_fails_after_retries(self) -> None:
+        self.mock_es_client.bulk.return_value = {'errors': True, 'items': [{'index': {'status': 429}}]}
+
+        publisher = self._parallel_publisher(json.dumps({'id': 0}), max_retries=2)
+        with self.assertRaises(RuntimeError):
+            publisher.publish()
+
+        self.assertEqual(self.mock_es_client.bulk.call_count, 3)
+        self.mock_es_client.indices.update_aliases.assert_not_called()
+
+    def test_publish_with_index_build_tuning(self) -> None:
+        mock_data = json.dumps({'KEY_DOESNOT_MATTER': 'NO_VALUE'})
+        self.mock_es_client.indices.get_alias.return_value = {}
+        self.mock_es_client.cluster.health.return_value = {'status': 'green', 'timed_out': False}
+        mapping = json.dumps({'settings': {'number_of_replicas': 2}, 'mappings': {}})
+        conf = ConfigFactory.from_dict({
+            **self.config_dict,
+            f'publisher.elasticsearch.{ElasticsearchPublisher.ELASTICSEARCH_MAPPING_CONFIG_KEY}': mapping,
+            f'publisher.elasticsearch.{ElasticsearchPublisher.ELASTICSEARCH_PUBLISHER_INDEX_BUILD_TUNING}': True,
+        })
+
+        with patch('builtins.open', mock_open(read_data=mock_data)):
+            publisher = ElasticsearchPublisher()
+            publisher.init(conf=Scoped.get_scoped_conf(conf=conf, scope=publisher.get_scope()))
+            publisher.publish()
+
+        self.mock_es_client.indices.create.assert_called_once_with(
+            index=self.test_es_new_index,
+            body={'settings': {'index': {'refresh_interval': '-1', 'number_of_replicas': 0}}, 'mappings': {}})
+        self.mock_es_client.indices.put_settings.assert_has_calls([
+            call(index=self.test_es_new_index, body={'index': {'refresh_interval': None}}),
+            call(index=self.test_es_new_index, body={'index': {'number_of_replicas': 2}}),
+        ])
+        self.mock_es_client.indices.forcemerge.assert_called_once()
+        # Replicas may not be allocated, e.g. on a single node cluster, so yellow is enough by default
+        self.assertEqual(self.mock_es_client.cluster.health.call_args[1]['wait_for_status'], 'yellow')
+        self.mock_es_client.indices.update_aliases.assert_called_once()
+
+    def test_publish_with_index_build_tuning_not_green(self) -> None:
+        self.mock_es_client.cluster.health.return_value = {'status': 'yellow', 'timed_out': True}
+        conf = ConfigFactory.from_dict({
+            **self.config_dict,
+            f'publisher.elasticsearch.{ElasticsearchPublisher.ELASTICSEARCH_PUBLISHER_INDEX_BUILD_TUNING}': True,
+            f'publisher.elasticsearch.{ElasticsearchPublisher.ELASTICSEARCH_PUBLISHER_INDEX_BUILD_WAIT_FOR_STATUS}':
+                'green',
+        })
+
+        with patch('builtins.open', mock_open(read_data=json.dumps({'KEY_DOESNOT_MATTER': 'NO_VALUE'}))):
+            publisher = ElasticsearchPublisher()
+            publisher.init(conf=Scoped.get_scoped_conf(conf=conf, scope=publisher.get_scope()))
+            with self.assertRaises(RuntimeError):
+                publisher.publish()
+
+        self.assertEqual(self.mock_es_client.cluster.health.call_args[1]['wait_for_status'], 'green')
+        self.mock_es_client.indices.update_aliases.assert_not_called()
+
+    def _publish_incrementally(self, docs: List[Dict], change_index_path: str, **conf: Any) -> None:
+        conf_dict = dict(self.config_dict)
+        conf_dict[f'publisher.elasticsearch.{ElasticsearchPublisher.ELASTICSEARCH_PUBLISHER_CHANGE_INDEX_PATH}'] = \
+            change_index_path
+        conf_dict[f'publisher.elasticsearch.{ElasticsearchPublisher.ELASTICSEARCH_DOCUMENT_ID_FIELD}'] = 'key'
+        conf_dict.update({f'publisher.elasticsearch.{k}': v for k, v in conf.items()})
+        with patch('builtins.open', mock_open(read_data='\n'.join(json.dumps(doc) for doc in docs))):
+            publisher = ElasticsearchPublisher()
+            publisher.init(conf=Scoped.get_scoped_conf(conf=ConfigFactory.from_dict(conf_dict),
+                                                       scope=publisher.get_scope()))
+            publisher.publish()
+            publisher.close()
+
+    def test_publish_incrementally(self) -> None:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            change_index_path = os.path.join(temp_dir, 'change_index.db')
+            self.mock_es_client.indices.get_alias.return_value = {}
+            self._publish_incrementally([{'key': 'a', 'v': 1}, {'key': 'b', 'v': 1}], change_index_path)
+
+            # The first publish builds a new index, with document ids
+            self.mock_es_client.indices.create.assert_called_once()
+            self.mock_es_client.bulk.assert_called_once_with([
+                {'index': {'_type': self.test_doc_type, '_index': self.test_es_new_index, '_id': 'a'}},
+                {'key': 'a', 'v': 1},
+                {'index': {'_type': self.test_doc_type, '_index': self.test_es_new_index, '_id': 'b'}},
+                {'key': 'b', 'v': 1},
+            ])
+            self.mock_es_client.indices.update_aliases.assert_called_once()
+
+            self.mock_es_client.reset_mock()
+            self.mock_es_client.indices.get_alias.return_value = {'live_index': {}}
+            self._publish_incrementally([{'key': 'a', 'v': 1}, {'key': 'c', 'v': 1}], change_index_path)
+
+            # Then only changed documents are indexed, and removed ones deleted, in the live index
+            self.mock_es_client.indices.create.assert_not_called()
+            self.mock_es_client.indices.update_aliases.assert_not_called()
+            self.mock_es_client.bulk.assert_has_calls([
+                call([{'index': {'_type': self.test_doc_type, '_index': 'live_index', '_id': 'c'}},
+                      {'key': 'c', 'v': 1}]),
+                call([{'delete': {'_type': self.test_doc_type, '_index': 'live_index', '_id': 'b'}}]),
+            ])
+
+            # A new mapping builds a new index again
+            self.mock_es_client.reset_mock()
+            self._publish_incrementally([{'key': 'a', 'v': 1}, {'key': 'c', 'v': 1}], change_index_path,
+                                        mapping='{"mappings": {}}')
+
+            self.mock_es_client.indices.create.assert_called_once_with(index=self.test_es_new_index,
+                                                                       body='{"mappings": {}}')
+            self.mock_es_client.indices.update_aliases.assert_called_once()
+
+    def test_publish_incrementally_in_parallel(self) -> None:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            change_index_path = os.path.join(temp_dir, 'change_index.db')
+            self.mock_es_client.indices.get_alias.return_value = {}
+            self._publish_incrementally([{'key': 'a', 'v': 1}, {'key': 'b', 'v': 1}], change_index_path)
+
+            self.mock_es_client.reset_mock()
+            self.mock_es_client.indices.get_alias.return_value = {'live_index': {}}
+            self._publish_incrementally([{'key': 'a', 'v': 2}], change_index_path, thread_count=2)
+
+            bodies = [bulk_call[0][0] for bulk_call in self.mock_es_client.bulk.call_args_list]
+            self.assertEqual([[json.loads(line) for line in body.splitlines()] for body in bodies], [
+                [{'index': {'_type': self.test_doc_type, '_index': 'live_index', '_id': 'a'}}, {'key': 'a', 'v': 2}],
+                [{'delete': {'_type': self.test_doc_type, '_index': 'live_index', '_id': 'b'}}],
+            ])
+
+    def test_publish_incrementally_after_failed_documents(self) -> None:
+        docs = [{'key': 'a', 'v': 1}, {'key': 'b', 'v': 1}]
+        for thread_count in [1, 2]:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                change_index_path = os.path.join(temp_dir, 'change_index.db')
+                self.mock_es_client.reset_mock()
+                self.mock_es_client.indices.get_alias.return_value = {}
+                self.mock_es_client.bulk.return_value = {'errors': True, 'items': [
+                    {'index': {'_id': 'a', 'status': 201}},
+                    {'index': {'_id': 'b', 'status': 400, 'error': {'type': 'mapper_parsing_exception'}}},
+                ]}
+                self._publish_incrementally(docs, change_index_path, thread_count=thread_count)
+
+                # The document that failed to be indexed is sent again
+                self.mock_es_client.reset_mock()
+                self.mock_es_client.bulk.return_value = {'errors': False, 'items': []}
+                self.mock_es_client.indices.get_alias.return_value = {'live_index': {}}
+                self._publish_incrementally(docs, change_index_path, thread_count=thread_count)
+
+                self.mock_es_client.bulk.assert_called_once()
+                body = self.mock_es_client.bulk.call_args[0][0]
+                if isinstance(body, str):
+                    body = [json.loads(line) for line in body.splitlines()]
+                self.assertEqual(body, [{'index': {'_type': self.test_doc_type, '_index': 'live_index', '_id': 'b'}},
+                                        {'key': 'b', 'v': 1}])
+
+    def test_publish_incrementally_without_document_id_field(self) -> None:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            conf = ConfigFactory.from_dict({
+                **self.config_dict,
+                f'publisher.elasticsearch.{ElasticsearchPublisher.ELASTICSEARCH_PUBLISHER_CHANGE_INDEX_PATH}':
+                    os.path.join(temp_dir, 'change_index.db'),
+            })
+            with patch('builtins.open', mock_open(read_data=json.dumps({'email': 'a@example.com'}))):
+                publisher = ElasticsearchPublisher()
+                with self.assertRaises(ValueError):
+                    publisher.init(conf=Scoped.get_scoped_conf(conf=conf, scope=publisher.get_scope()))
+
+    def test_publish_incrementally_document_without_id(self) -> None:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            self.mock_es_client.indices.get_alias.return_value = {}
+            with self.assertRaises(ValueError):
+                self._publish_incrementally([{'email': 'a@example.com'}], os.path.join(temp_dir, 'change_index.db'))
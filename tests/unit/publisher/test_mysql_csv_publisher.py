@@ -2,16 +2,21 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import os
+import tempfile
 import unittest
 from typing import Any
 from unittest.mock import MagicMock, patch
 
 from freezegun import freeze_time
 from pyhocon import ConfigFactory
+from sqlalchemy.dialects import mysql
 
+from databuilder.loader.file_system_mysql_csv_loader import FSMySQLCSVLoader
 from databuilder.publisher import mysql_csv_publisher
 from databuilder.publisher.mysql_csv_publisher import MySQLCSVPublisher
-from tests.unit.models.test_table_serializable import Base
+from tests.unit.models.test_table_serializable import (
+    Actor, Base, Movie,
+)
 
 here = os.path.dirname(__file__)
 
@@ -58,6 +63,129 @@ class TestMySQLPublish(unittest.TestCase):
         # 3 record files
         self.assertEqual(3, mock_commit.call_count)
 
+    @freeze_time("2021-01-01 01:01:00")
+    @patch.object(mysql_csv_publisher, 'sessionmaker')
+    @patch.object(mysql_csv_publisher, 'create_engine')
+    def test_publisher_bulk_upsert(self, mock_create_engine: Any, mock_session_maker: Any) -> None:
+        mock_engine = MagicMock()
+        mock_engine.dialect.name = 'mysql'
+        mock_create_engine.return_value = mock_engine
+
+        mock_session = MagicMock()
+        mock_session_maker.return_value.return_value = mock_session
+
+        mysql_csv_publisher.Base = Base
+
+        publisher = MySQLCSVPublisher()
+        publisher.init(self.conf.with_fallback(ConfigFactory.from_dict({MySQLCSVPublisher.BULK_UPSERT: True,
+                                                                        MySQLCSVPublisher.BULK_BATCH_SIZE: 1})))
+        publisher.publish()
+
+        mock_session.merge.assert_not_called()
+        # 5 records, 1 per batch
+        self.assertEqual(5, mock_session.execute.call_count)
+        stmt, rows = mock_session.execute.call_args_list[-1][0]
+        self.assertEqual(rows, [{'movie_rk': 'movie://Top Gun', 'actor_rk': 'actor://Meg Ryan',
+                                 'published_tag': 'test', 'publisher_last_updated_epoch_ms': 1609462860000}])
+        sql = str(stmt.compile(dialect=mysql.dialect()))
+        self.assertIn('INSERT INTO movie_actor', sql)
+        self.assertIn('ON DUPLICATE KEY UPDATE published_tag = VALUES(published_tag), '
+                      'publisher_last_updated_epoch_ms = VALUES(publisher_last_updated_epoch_ms)', sql)
+        # 3 record files
+        self.assertEqual(3, mock_session.commit.call_count)
+
+    @patch.object(mysql_csv_publisher, 'sessionmaker')
+    @patch.object(mysql_csv_publisher, 'create_engine')
+    def test_publisher_bulk_upsert_requires_mysql(self, mock_create_engine: Any, mock_session_maker: Any) -> None:
+        mock_create_engine.return_value.dialect.name = 'postgresql'
+
+        with self.assertRaises(Exception):
+            MySQLCSVPublisher().init(self.conf.with_fallback(
+                ConfigFactory.from_dict({MySQLCSVPublisher.BULK_UPSERT: True})))
+
+    @patch.object(mysql_csv_publisher, 'sessionmaker')
+    @patch.object(mysql_csv_publisher, 'create_engine')
+    def test_publisher_concurrently(self, mock_create_engine: Any, mock_session_maker: Any) -> None:
+        sessions = []
+
+        def create_session() -> MagicMock:
+            session = MagicMock()
+            sessions.append(session)
+            return session
+
+        mock_session_maker.return_value.side_effect = create_session
+
+        mysql_csv_publisher.Base = Base
+
+        publisher = MySQLCSVPublisher()
+        publisher.init(self.conf.with_fallback(ConfigFactory.from_dict({MySQLCSVPublisher.PUBLISH_WORKER_COUNT: 2})))
+        self.assertEqual(publisher._group_record_files_by_level(), [
+            (0, [f for f in publisher._sorted_record_files if 'movie_actor' not in f]),
+            (1, [f for f in publisher._sorted_record_files if 'movie_actor' in f]),
+        ])
+        publisher.publish()
+
+        # A session per record file, each committed
+        self.assertEqual(3, len(sessions))
+        self.assertEqual(5, sum(session.merge.call_count for session in sessions))
+        self.assertTrue(all(session.commit.call_count == 1 and session.close.call_count == 1 for session in sessions))
+        self.assertEqual(2, mock_create_engine.call_args[1]['pool_size'])
+
+    @patch.object(mysql_csv_publisher, 'sessionmaker')
+    @patch.object(mysql_csv_publisher, 'create_engine')
+    def test_publisher_concurrently_with_failure(self, mock_create_engine: Any, mock_session_maker: Any) -> None:
+        mock_session = MagicMock()
+        mock_session.merge.side_effect = Exception('failed')
+        mock_session_maker.return_value.return_value = mock_session
+
+        mysql_csv_publisher.Base = Base
+
+        publisher = MySQLCSVPublisher()
+        publisher.init(self.conf.with_fallback(ConfigFactory.from_dict({MySQLCSVPublisher.PUBLISH_WORKER_COUNT: 2})))
+        with self.assertRaises(Exception):
+            publisher.publish()
+
+        mock_session.rollback.assert_called()
+        # Files of the next level are not published. A file of the first level may be cancelled before it starts.
+        merged_tables = {merge_call[0][0].__tablename__ for merge_call in mock_session.merge.call_args_list}
+        self.assertLessEqual(mock_session.merge.call_count, 2)
+        self.assertTrue(merged_tables)
+        self.assertLessEqual(merged_tables, {'actor', 'movie'})
+
+    @patch.object(mysql_csv_publisher, 'sessionmaker')
+    @patch.object(mysql_csv_publisher, 'create_engine')
+    def test_publisher_parquet(self, mock_create_engine: Any, mock_session_maker: Any) -> None:
+        mock_create_engine.return_value.dialect.name = 'mysql'
+        mock_session = MagicMock()
+        mock_session_maker.return_value.return_value = mock_session
+
+        mysql_csv_publisher.Base = Base
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            record_dir = os.path.join(temp_dir, 'records')
+            loader = FSMySQLCSVLoader()
+            loader.init(ConfigFactory.from_dict({FSMySQLCSVLoader.RECORD_DIR_PATH: record_dir,
+                                                 FSMySQLCSVLoader.SHOULD_DELETE_CREATED_DIR: False,
+                                                 FSMySQLCSVLoader.FILE_FORMAT: 'parquet'}))
+            loader.load(Movie('Top Gun', [Actor('Tom Cruise'), Actor('Meg Ryan')]))
+            loader.close()
+            self.assertEqual(sorted(os.listdir(record_dir)),
+                             ['actor_0.parquet', 'movie_0.parquet', 'movie_actor_1.parquet'])
+
+            publisher = MySQLCSVPublisher()
+            publisher.init(ConfigFactory.from_dict({MySQLCSVPublisher.RECORD_FILES_DIR: record_dir,
+                                                    MySQLCSVPublisher.BULK_UPSERT: True}).with_fallback(self.conf))
+            with freeze_time("2021-01-01 01:01:00"):
+                publisher.publish()
+
+        # A batch per record file
+        self.assertEqual(3, mock_session.execute.call_count)
+        _, rows = mock_session.execute.call_args_list[-1][0]
+        self.assertEqual(rows, [{'movie_rk': 'movie://Top Gun', 'actor_rk': 'actor://Tom Cruise',
+                                 'published_tag': 'test', 'publisher_last_updated_epoch_ms': 1609462860000},
+                                {'movie_rk': 'movie://Top Gun', 'actor_rk': 'actor://Meg Ryan',
+                                 'published_tag': 'test', 'publisher_last_updated_epoch_ms': 1609462860000}])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,83 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from pyhocon import ConfigFactory
+
+from databuilder.publisher import neo4j_admin_import_publisher
+from databuilder.publisher.neo4j_admin_import_publisher import Neo4jAdminImportPublisher
+
+
+class TestNeo4jAdminImportPublisher(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.node_dir = os.path.join(self.temp_dir.name, 'nodes')
+        self.relation_dir = os.path.join(self.temp_dir.name, 'relationships')
+        os.makedirs(self.node_dir)
+        os.makedirs(self.relation_dir)
+        self.constraints_path = os.path.join(self.temp_dir.name, 'constraints.cypher')
+
+        self.publisher = Neo4jAdminImportPublisher()
+        self.publisher.init(ConfigFactory.from_dict({
+            Neo4jAdminImportPublisher.NODE_FILES_DIR: self.node_dir,
+            Neo4jAdminImportPublisher.RELATION_FILES_DIR: self.relation_dir,
+            Neo4jAdminImportPublisher.NEO4J_ADMIN_COMMAND: '/var/lib/neo4j/bin/neo4j-admin',
+            Neo4jAdminImportPublisher.DATABASE: 'amundsen',
+            Neo4jAdminImportPublisher.EXTRA_ARGS: ['--high-io=true'],
+            Neo4jAdminImportPublisher.CONSTRAINTS_FILE_PATH: self.constraints_path,
+        }))
+
+    def _write(self, path: str, content: str) -> None:
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def test_publish(self) -> None:
+        self._write(os.path.join(self.node_dir, 'Table_0.csv'), '"key:ID(Table)",":LABEL"\n"t","Table"\n')
+        self._write(os.path.join(self.node_dir, 'Column_1.csv'), '"key:ID(Column)",":LABEL"\n"c","Column"\n')
+        self._write(os.path.join(self.relation_dir, 'Table_Column_COLUMN_2.csv'),
+                    '":START_ID(Table)",":END_ID(Column)",":TYPE"\n"t","c","COLUMN"\n')
+
+        with patch.object(neo4j_admin_import_publisher.subprocess, 'run') as mock_run:
+            self.publisher.publish()
+
+        self.assertEqual(mock_run.call_args[0][0], [
+            '/var/lib/neo4j/bin/neo4j-admin', 'import',
+            '--database=amundsen',
+            '--id-type=STRING',
+            '--skip-duplicate-nodes=true',
+            '--skip-bad-relationships=true',
+            '--multiline-fields=true',
+            f'--nodes={self.node_dir}/Column_1.csv',
+            f'--nodes={self.node_dir}/Table_0.csv',
+            f'--relationships={self.relation_dir}/Table_Column_COLUMN_2.csv',
+            '--high-io=true',
+        ])
+        self.assertTrue(mock_run.call_args[1]['check'])
+        with open(self.constraints_path) as f:
+            self.assertEqual(f.read(), 'CREATE CONSTRAINT ON (node:Column) ASSERT node.key IS UNIQUE;\n'
+                                       'CREATE CONSTRAINT ON (node:Table) ASSERT node.key IS UNIQUE;\n')
+
+    def test_publish_zstd_files(self) -> None:
+        self._write(os.path.join(self.node_dir, 'Table_0.csv.zst'), '')
+
+        with patch.object(neo4j_admin_import_publisher.subprocess, 'run') as mock_run:
+            with self.assertRaises(ValueError):
+                self.publisher.publish()
+
+        mock_run.assert_not_called()
+
+    def test_publish_without_files(self) -> None:
+        with patch.object(neo4j_admin_import_publisher.subprocess, 'run') as mock_run:
+            self.publisher.publish()
+
+        mock_run.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,11 +3,13 @@
 
 import logging
 import os
+import tempfile
 import unittest
 import uuid
 
 from mock import MagicMock, patch
 from neo4j import GraphDatabase
+from neo4j.exceptions import TransientError
 from pyhocon import ConfigFactory
 
 from databuilder.publisher import neo4j_csv_publisher
@@ -53,6 +55,228 @@ class TestPublish(unittest.TestCase):
             # 2 node files, 1 relation file
             self.assertEqual(mock_commit.call_count, 1)
 
+    def test_publisher_unwind_batch(self) -> None:
+        with patch.object(GraphDatabase, 'driver') as mock_driver:
+            mock_session = MagicMock()
+            mock_driver.return_value.session.return_value = mock_session
+
+            mock_transaction = MagicMock()
+            mock_session.begin_transaction.return_value = mock_transaction
+
+            mock_run = MagicMock()
+            mock_transaction.run = mock_run
+            mock_commit = MagicMock()
+            mock_transaction.commit = mock_commit
+
+            publisher = Neo4jCsvPublisher()
+
+            conf = ConfigFactory.from_dict(
+                {neo4j_csv_publisher.NEO4J_END_POINT_KEY: 'dummy://999.999.999.999:7687/',
+                 neo4j_csv_publisher.NODE_FILES_DIR: f'{self._resource_path}/nodes',
+                 neo4j_csv_publisher.RELATION_FILES_DIR: f'{self._resource_path}/relations',
+                 neo4j_csv_publisher.NEO4J_USER: 'neo4j_user',
+                 neo4j_csv_publisher.NEO4J_PASSWORD: 'neo4j_password',
+                 neo4j_csv_publisher.NEO4J_UNWIND_BATCH_ENABLED: True,
+                 neo4j_csv_publisher.JOB_PUBLISH_TAG: str(uuid.uuid4())}
+            )
+            publisher.init(conf)
+            publisher.publish()
+
+            # One UNWIND statement per node file and one for the relation file
+            self.assertEqual(mock_run.call_count, 3)
+            for call in mock_run.call_args_list:
+                self.assertIn(b'UNWIND $batch AS row', call[0][0])
+                self.assertEqual(len(call[1]['parameters']['batch']), 2)
+
+            self.assertEqual(mock_commit.call_count, 1)
+
+    def test_publisher_unwind_batch_retries_deadlock(self) -> None:
+        with patch.object(GraphDatabase, 'driver') as mock_driver, \
+                patch.object(neo4j_csv_publisher, 'SLEEP_TIME', 0):
+            mock_session = MagicMock()
+            mock_driver.return_value.session.return_value = mock_session
+
+            transactions = [MagicMock() for _ in range(4)]
+            for tx in transactions:
+                tx.closed.return_value = False
+            mock_session.begin_transaction.side_effect = transactions
+            transactions[1].run.side_effect = TransientError('deadlock')
+
+            publisher = Neo4jCsvPublisher()
+
+            conf = ConfigFactory.from_dict(
+                {neo4j_csv_publisher.NEO4J_END_POINT_KEY: 'dummy://999.999.999.999:7687/',
+                 neo4j_csv_publisher.NODE_FILES_DIR: f'{self._resource_path}/nodes',
+                 neo4j_csv_publisher.RELATION_FILES_DIR: f'{self._resource_path}/relations',
+                 neo4j_csv_publisher.NEO4J_USER: 'neo4j_user',
+                 neo4j_csv_publisher.NEO4J_PASSWORD: 'neo4j_password',
+                 neo4j_csv_publisher.NEO4J_UNWIND_BATCH_ENABLED: True,
+                 neo4j_csv_publisher.NEO4J_DEADLOCK_NODE_LABELS: ['Column'],
+                 neo4j_csv_publisher.JOB_PUBLISH_TAG: str(uuid.uuid4())}
+            )
+            publisher.init(conf)
+            publisher.publish()
+
+            # Nodes are committed before the relation batch, which is retried in a new transaction
+            self.assertEqual(transactions[0].run.call_count, 2)
+            transactions[0].commit.assert_called_once()
+            transactions[1].rollback.assert_called_once()
+            transactions[1].commit.assert_not_called()
+            self.assertEqual(transactions[2].run.call_count, 1)
+            transactions[2].commit.assert_called_once()
+            transactions[3].commit.assert_called_once()
+
+    def test_publisher_retries_deadlock(self) -> None:
+        with patch.object(GraphDatabase, 'driver') as mock_driver, \
+                patch.object(neo4j_csv_publisher, 'SLEEP_TIME', 0):
+            mock_session = MagicMock()
+            mock_driver.return_value.session.return_value = mock_session
+
+            transactions = [MagicMock() for _ in range(6)]
+            for tx in transactions:
+                tx.closed.return_value = False
+            mock_session.begin_transaction.side_effect = transactions
+            transactions[1].run.side_effect = TransientError('deadlock')
+
+            publisher = Neo4jCsvPublisher()
+
+            conf = ConfigFactory.from_dict(
+                {neo4j_csv_publisher.NEO4J_END_POINT_KEY: 'dummy://999.999.999.999:7687/',
+                 neo4j_csv_publisher.NODE_FILES_DIR: f'{self._resource_path}/nodes',
+                 neo4j_csv_publisher.RELATION_FILES_DIR: f'{self._resource_path}/relations',
+                 neo4j_csv_publisher.NEO4J_USER: 'neo4j_user',
+                 neo4j_csv_publisher.NEO4J_PASSWORD: 'neo4j_password',
+                 neo4j_csv_publisher.NEO4J_DEADLOCK_NODE_LABELS: ['Column'],
+                 neo4j_csv_publisher.JOB_PUBLISH_TAG: str(uuid.uuid4())}
+            )
+            publisher.init(conf)
+            publisher.publish()
+
+            # Nodes are committed before the first relation, which is retried in a new transaction
+            self.assertEqual(transactions[0].run.call_count, 4)
+            transactions[0].commit.assert_called_once()
+            transactions[1].rollback.assert_called_once()
+            transactions[1].commit.assert_not_called()
+            self.assertEqual(transactions[2].run.call_count, 1)
+            transactions[2].commit.assert_called_once()
+
+            # The second relation runs in a transaction of its own as well
+            transactions[3].run.assert_not_called()
+            self.assertEqual(transactions[4].run.call_count, 1)
+            transactions[4].commit.assert_called_once()
+            transactions[5].commit.assert_called_once()
+
+    def test_publisher_concurrently(self) -> None:
+        with patch.object(GraphDatabase, 'driver') as mock_driver:
+            mock_session = MagicMock()
+            mock_driver.return_value.session.return_value = mock_session
+
+            mock_transaction = MagicMock()
+            mock_transaction.closed.return_value = True
+            mock_session.begin_transaction.return_value = mock_transaction
+
+            mock_run = MagicMock()
+            mock_transaction.run = mock_run
+            mock_commit = MagicMock()
+            mock_transaction.commit = mock_commit
+
+            publisher = Neo4jCsvPublisher()
+
+            conf = ConfigFactory.from_dict(
+                {neo4j_csv_publisher.NEO4J_END_POINT_KEY: 'dummy://999.999.999.999:7687/',
+                 neo4j_csv_publisher.NODE_FILES_DIR: f'{self._resource_path}/nodes',
+                 neo4j_csv_publisher.RELATION_FILES_DIR: f'{self._resource_path}/relations',
+                 neo4j_csv_publisher.NEO4J_USER: 'neo4j_user',
+                 neo4j_csv_publisher.NEO4J_PASSWORD: 'neo4j_password',
+                 neo4j_csv_publisher.NEO4J_PUBLISH_WORKER_COUNT: 2,
+                 neo4j_csv_publisher.JOB_PUBLISH_TAG: str(uuid.uuid4())}
+            )
+            publisher.init(conf)
+            publisher.publish()
+
+            self.assertEqual(mock_run.call_count, 6)
+
+            # Each file is committed in its own transaction
+            self.assertEqual(mock_commit.call_count, 3)
+
+    def test_publisher_concurrently_retries_transient_error(self) -> None:
+        with patch.object(GraphDatabase, 'driver') as mock_driver, \
+                patch.object(neo4j_csv_publisher, 'SLEEP_TIME', 0):
+            mock_session = MagicMock()
+            mock_driver.return_value.session.return_value = mock_session
+
+            mock_transaction = MagicMock()
+            mock_transaction.closed.return_value = True
+            mock_session.begin_transaction.return_value = mock_transaction
+
+            mock_run = MagicMock()
+            mock_run.side_effect = [TransientError('deadlock')] + [MagicMock()] * 10
+            mock_transaction.run = mock_run
+
+            publisher = Neo4jCsvPublisher()
+
+            conf = ConfigFactory.from_dict(
+                {neo4j_csv_publisher.NEO4J_END_POINT_KEY: 'dummy://999.999.999.999:7687/',
+                 neo4j_csv_publisher.RELATION_FILES_DIR: f'{self._resource_path}/relations',
+                 neo4j_csv_publisher.NEO4J_USER: 'neo4j_user',
+                 neo4j_csv_publisher.NEO4J_PASSWORD: 'neo4j_password',
+                 neo4j_csv_publisher.NEO4J_PUBLISH_WORKER_COUNT: 2,
+                 neo4j_csv_publisher.JOB_PUBLISH_TAG: str(uuid.uuid4())}
+            )
+            publisher.init(conf)
+            publisher.publish()
+
+            # The relation file is published again after the first statement failed
+            self.assertEqual(mock_run.call_count, 3)
+            self.assertEqual(mock_transaction.commit.call_count, 1)
+
+    def test_publisher_concurrently_retries_changed_records(self) -> None:
+        with patch.object(GraphDatabase, 'driver') as mock_driver, tempfile.TemporaryDirectory() as temp_dir, \
+                patch.object(neo4j_csv_publisher, 'SLEEP_TIME', 0):
+            mock_session = MagicMock()
+            mock_driver.return_value.session.return_value = mock_session
+
+            mock_transaction = MagicMock()
+            mock_transaction.closed.return_value = True
+            mock_session.begin_transaction.return_value = mock_transaction
+
+            # The first relation is merged, and the second one fails
+            mock_run = MagicMock()
+            mock_run.side_effect = [MagicMock(), TransientError('deadlock')] + [MagicMock()] * 10
+            mock_transaction.run = mock_run
+
+            conf = ConfigFactory.from_dict(
+                {neo4j_csv_publisher.NEO4J_END_POINT_KEY: 'dummy://999.999.999.999:7687/',
+                 neo4j_csv_publisher.RELATION_FILES_DIR: f'{self._resource_path}/relations',
+                 neo4j_csv_publisher.NEO4J_USER: 'neo4j_user',
+                 neo4j_csv_publisher.NEO4J_PASSWORD: 'neo4j_password',
+                 neo4j_csv_publisher.NEO4J_PUBLISH_WORKER_COUNT: 2,
+                 neo4j_csv_publisher.NEO4J_CHANGE_INDEX_PATH: os.path.join(temp_dir, 'index.db'),
+                 neo4j_csv_publisher.JOB_PUBLISH_TAG: str(uuid.uuid4())}
+            )
+            publisher = Neo4jCsvPublisher()
+            publisher.init(conf)
+            publisher.publish()
+            publisher.close()
+
+            # Both relations are merged again when the file is retried, as the failed attempt was rolled back
+            statements = [call[0][0] for call in mock_run.call_args_list]
+            self.assertEqual(len(statements), 4)
+            for stmt in statements:
+                self.assertIn(b'MERGE', stmt)
+
+            # Hashes of the retry are committed, so nothing has changed in the next publish
+            mock_run.reset_mock()
+            mock_run.side_effect = None
+            mock_run.return_value.single.return_value = {'ids': [0, 1]}
+            publisher = Neo4jCsvPublisher()
+            publisher.init(conf)
+            publisher.publish()
+            publisher.close()
+
+            self.assertEqual(mock_run.call_count, 1)
+            self.assertNotIn(b'MERGE', mock_run.call_args[0][0])
+
     def test_preprocessor(self) -> None:
         with patch.object(GraphDatabase, 'driver') as mock_driver:
             mock_session = MagicMock()
@@ -89,6 +313,53 @@ class TestPublish(unittest.TestCase):
             # 2 node files, 1 relation file
             self.assertEqual(mock_commit.call_count, 1)
 
+    def test_publisher_change_index(self) -> None:
+        with patch.object(GraphDatabase, 'driver') as mock_driver, tempfile.TemporaryDirectory() as temp_dir:
+            mock_session = MagicMock()
+            mock_driver.return_value.session.return_value = mock_session
+
+            mock_transaction = MagicMock()
+            mock_session.begin_transaction.return_value = mock_transaction
+
+            mock_run = MagicMock()
+            mock_transaction.run = mock_run
+
+            conf = ConfigFactory.from_dict(
+                {neo4j_csv_publisher.NEO4J_END_POINT_KEY: 'dummy://999.999.999.999:7687/',
+                 neo4j_csv_publisher.NODE_FILES_DIR: f'{self._resource_path}/nodes',
+                 neo4j_csv_publisher.RELATION_FILES_DIR: f'{self._resource_path}/relations',
+                 neo4j_csv_publisher.NEO4J_USER: 'neo4j_user',
+                 neo4j_csv_publisher.NEO4J_PASSWORD: 'neo4j_password',
+                 neo4j_csv_publisher.NEO4J_CHANGE_INDEX_PATH: os.path.join(temp_dir, 'index.db'),
+                 neo4j_csv_publisher.JOB_PUBLISH_TAG: str(uuid.uuid4())}
+            )
+            publisher = Neo4jCsvPublisher()
+            publisher.init(conf)
+            publisher.publish()
+            publisher.close()
+            self.assertEqual(mock_run.call_count, 6)
+
+            # Nothing has changed, so one statement per node file and relation file only updates the published tag.
+            # One of the relations is not found and gets merged.
+            mock_run.reset_mock()
+            all_found, relation_missing = MagicMock(), MagicMock()
+            all_found.single.return_value = {'ids': [0, 1]}
+            relation_missing.single.return_value = {'ids': [1]}
+            mock_run.side_effect = [all_found, all_found, relation_missing, MagicMock()]
+            publisher = Neo4jCsvPublisher()
+            publisher.init(conf)
+            publisher.publish()
+            publisher.close()
+
+            self.assertEqual(mock_run.call_count, 4)
+            statements = [call[0][0] for call in mock_run.call_args_list]
+            for stmt in statements[:3]:
+                self.assertIn(b'SET', stmt)
+                self.assertNotIn(b'MERGE', stmt)
+            self.assertIn(b'MERGE (n1)-[r1:COLUMN]->(n2)-[r2:BELONG_TO_TABLE]->(n1)', statements[3])
+            self.assertEqual(mock_run.call_args_list[3][1]['parameters']['END_KEY'],
+                             'presto://gold.test_schema1/test_table1/test_id1')
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,140 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+import unittest
+import uuid
+from typing import (
+    Any, List, Optional,
+)
+
+from mock import MagicMock, patch
+from neo4j import GraphDatabase
+from pyhocon import ConfigFactory, ConfigTree
+
+from databuilder.extractor.base_extractor import Extractor
+from databuilder.job.job import DefaultJob
+from databuilder.loader.graph_streaming_loader import GraphStreamingLoader
+from databuilder.publisher import neo4j_csv_publisher, neo4j_streaming_publisher
+from databuilder.publisher.neo4j_streaming_publisher import Neo4jStreamingPublisher
+from databuilder.task.task import DefaultTask
+from tests.unit.models.test_graph_serializable import (
+    Actor, City, Movie,
+)
+
+
+class MovieExtractor(Extractor):
+
+    def __init__(self, movies: List[Movie], error: Optional[Exception] = None) -> None:
+        self._iter = iter(movies)
+        self._error = error
+
+    def init(self, conf: ConfigTree) -> None:
+        pass
+
+    def extract(self) -> Any:
+        movie = next(self._iter, None)
+        if movie is None and self._error:
+            raise self._error
+        return movie
+
+    def get_scope(self) -> str:
+        return 'extractor.movie'
+
+
+class TestNeo4jStreamingPublisher(unittest.TestCase):
+
+    def setUp(self) -> None:
+        logging.basicConfig(level=logging.INFO)
+        self.movies = [Movie('Top Gun', [Actor('Tom Cruise')], [City('San Diego')]),
+                       Movie('Rain Man', [Actor('Dustin Hoffman')], [City('Cincinnati')])]
+        self.error: Optional[Exception] = None
+
+        patcher = patch.object(GraphDatabase, 'driver')
+        mock_driver = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_session = MagicMock()
+        mock_driver.return_value.session.return_value = self.mock_session
+        self.mock_transaction = MagicMock()
+        self.mock_transaction.closed.return_value = False
+        self.mock_session.begin_transaction.return_value = self.mock_transaction
+
+    def _launch_job(self, **publisher_conf: Any) -> None:
+        conf = ConfigFactory.from_dict({
+            'loader.graph_streaming.batch_size': 1,
+            'loader.graph_streaming.queue_size': 1,
+            'publisher.neo4j': {
+                neo4j_csv_publisher.NEO4J_END_POINT_KEY: 'dummy://999.999.999.999:7687/',
+                neo4j_csv_publisher.NEO4J_USER: 'neo4j_user',
+                neo4j_csv_publisher.NEO4J_PASSWORD: 'neo4j_password',
+                neo4j_csv_publisher.JOB_PUBLISH_TAG: str(uuid.uuid4()),
+                **publisher_conf,
+            },
+        })
+        loader = GraphStreamingLoader()
+        publisher = Neo4jStreamingPublisher(loader)
+        self.call_back = MagicMock()
+        publisher.register_call_back(self.call_back)
+        job = DefaultJob(conf=conf,
+                         task=DefaultTask(extractor=MovieExtractor(self.movies, self.error), loader=loader),
+                         publisher=publisher)
+        job.launch()
+
+    def test_publish(self) -> None:
+        self._launch_job()
+
+        statements = [c[0][0].decode('utf-8') for c in self.mock_transaction.run.call_args_list]
+        self.assertEqual(len(statements), 10)
+        # Relations are published once all nodes are
+        self.assertTrue(all('MERGE (node:' in stmt for stmt in statements[:6]))
+        self.assertTrue(all('MATCH (n1:' in stmt for stmt in statements[6:]))
+        # A unique index is created for each label, the first time it is seen
+        self.assertEqual(self.mock_session.__enter__.return_value.run.call_count, 3)
+
+    def test_publish_relations_with_nodes(self) -> None:
+        self._launch_job(**{neo4j_streaming_publisher.PUBLISH_RELATIONS_WITH_NODES: True,
+                            neo4j_csv_publisher.NEO4J_UNWIND_BATCH_ENABLED: True})
+
+        statements = [c[0][0].decode('utf-8') for c in self.mock_transaction.run.call_args_list]
+        self.assertEqual(len(statements), 10)
+        self.assertTrue(all('MATCH (n1:' in stmt for stmt in statements[3:5] + statements[8:]))
+
+    def test_publish_failure_fails_loading(self) -> None:
+        self.movies = [Movie(f'Movie {i}', [Actor('Tom Cruise')], [City('San Diego')]) for i in range(10)]
+        self.mock_transaction.run.side_effect = RuntimeError('Neo4j is down')
+
+        with self.assertRaises(RuntimeError):
+            self._launch_job()
+
+    def test_task_failure_rolls_back(self) -> None:
+        self.error = ValueError('Bad record')
+        with self.assertRaises(ValueError):
+            self._launch_job()
+
+        self.assertTrue(self.mock_transaction.run.called)
+        self.mock_transaction.rollback.assert_called_once()
+        self.call_back.on_failure.assert_called_once()
+        self.call_back.on_success.assert_not_called()
+
+    def test_task_failure_after_commit(self) -> None:
+        self.error = ValueError('Bad record')
+        with self.assertRaises(ValueError):
+            self._launch_job(**{neo4j_csv_publisher.NEO4J_TRANSACTION_SIZE: 2})
+
+        # Statements committed every NEO4J_TRANSACTION_SIZE statements stay committed, only the last transaction is
+        # rolled back
+        self.assertGreater(self.mock_transaction.commit.call_count, 1)
+        self.mock_transaction.rollback.assert_called_once()
+        self.call_back.on_failure.assert_called_once()
+
+    def test_begin_transaction_failure_fails_loading(self) -> None:
+        self.movies = [Movie(f'Movie {i}', [Actor('Tom Cruise')], [City('San Diego')]) for i in range(10)]
+        self.mock_session.begin_transaction.side_effect = RuntimeError('Neo4j is down')
+
+        with self.assertRaises(RuntimeError):
+            self._launch_job()
+        self.call_back.on_failure.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
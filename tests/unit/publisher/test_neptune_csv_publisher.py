@@ -0,0 +1,123 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+import gzip
+import hashlib
+import os
+import tempfile
+import unittest
+from typing import Any, Dict
+from unittest.mock import MagicMock, patch
+
+from botocore.exceptions import ClientError
+from pyhocon import ConfigFactory
+
+from databuilder.publisher import neptune_csv_publisher
+from databuilder.publisher.neptune_csv_publisher import NeptuneCSVPublisher
+
+
+class TestNeptuneCSVPublisher(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.node_dir = os.path.join(self.temp_dir.name, 'nodes')
+        self.relation_dir = os.path.join(self.temp_dir.name, 'relations')
+        os.makedirs(self.node_dir)
+        os.makedirs(self.relation_dir)
+        for directory, name in [(self.node_dir, 'Table.csv'), (self.relation_dir, 'TABLE_COLUMN.csv')]:
+            with open(os.path.join(directory, name), 'w') as f:
+                f.write(f'~id,~label\n{name},foo\n')
+
+        self.api_client = MagicMock()
+        self.s3_client = MagicMock()
+        self.uploaded: Dict[str, bytes] = {}
+        self.s3_client.upload_fileobj.side_effect = \
+            lambda f, bucket, key, **kwargs: self.uploaded.update({key: f.read()})
+        patch.object(neptune_csv_publisher, 'NeptuneBulkLoaderApi', return_value=self.api_client).start()
+        patch.object(neptune_csv_publisher, 'Session').start().return_value.client.return_value = self.s3_client
+        self.addCleanup(patch.stopall)
+
+    def _init_publisher(self, conf: Dict[str, Any]) -> NeptuneCSVPublisher:
+        publisher = NeptuneCSVPublisher()
+        publisher.init(ConfigFactory.from_dict({
+            NeptuneCSVPublisher.NODE_FILES_DIR: self.node_dir,
+            NeptuneCSVPublisher.RELATION_FILES_DIR: self.relation_dir,
+            NeptuneCSVPublisher.NEPTUNE_HOST: 'neptune:8182',
+            NeptuneCSVPublisher.AWS_S3_BUCKET_NAME: 'bucket',
+            NeptuneCSVPublisher.AWS_BASE_S3_DATA_PATH: 'amundsen',
+            **conf
+        }))
+        return publisher
+
+    def test_upload_files(self) -> None:
+        publisher = self._init_publisher({})
+
+        publisher.upload_files('amundsen/folder')
+
+        keys = [c[1]['s3_object_key'] for c in self.api_client.upload.call_args_list]
+        self.assertEqual(sorted(keys), ['amundsen/folder/TABLE_COLUMN.csv', 'amundsen/folder/Table.csv'])
+
+    def test_upload_files_concurrently_compressed(self) -> None:
+        publisher = self._init_publisher({NeptuneCSVPublisher.UPLOAD_WORKER_COUNT: 2,
+                                          NeptuneCSVPublisher.COMPRESS: True})
+
+        publisher.upload_files('amundsen/folder')
+
+        self.assertEqual(sorted(self.uploaded.keys()),
+                         ['amundsen/folder/TABLE_COLUMN.csv.gz', 'amundsen/folder/Table.csv.gz'])
+        self.assertEqual(gzip.decompress(self.uploaded['amundsen/folder/Table.csv.gz']), b'~id,~label\nTable.csv,foo\n')
+        self.api_client.upload.assert_not_called()
+
+    def test_skip_unchanged_files(self) -> None:
+        publisher = self._init_publisher({NeptuneCSVPublisher.SKIP_UNCHANGED_FILES: True})
+        table_hash = hashlib.sha256(b'~id,~label\nTable.csv,foo\n').hexdigest()
+
+        def head_object(Bucket: str, Key: str) -> Dict[str, Any]:
+            if Key == 'amundsen/folder/Table.csv':
+                return {'Metadata': {NeptuneCSVPublisher.CONTENT_HASH_METADATA: table_hash}}
+            raise ClientError({'Error': {'Code': '404'}}, 'HeadObject')
+
+        self.s3_client.head_object.side_effect = head_object
+
+        publisher.upload_files('amundsen/folder')
+
+        self.assertEqual(list(self.uploaded.keys()), ['amundsen/folder/TABLE_COLUMN.csv'])
+        self.assertEqual(self.s3_client.upload_fileobj.call_args[1]['ExtraArgs'],
+                         {'Metadata': {NeptuneCSVPublisher.CONTENT_HASH_METADATA: hashlib.sha256(
+                             b'~id,~label\nTABLE_COLUMN.csv,foo\n').hexdigest()}})
+
+    def test_publish_in_batches(self) -> None:
+        with open(os.path.join(self.node_dir, 'Column.csv'), 'w') as f:
+            f.write('~id,~label\ncolumn,Column\n')
+        publisher = self._init_publisher({NeptuneCSVPublisher.LOAD_BATCH_FILE_COUNT: 2,
+                                          NeptuneCSVPublisher.S3_FOLDER_NAME: 'folder'})
+        self.api_client.load.side_effect = [{'payload': {'loadId': f'load{i}'}} for i in range(2)]
+        self.api_client.load_status.return_value = {'payload': {'overallStatus': {'status': 'LOAD_COMPLETED'}}}
+
+        with patch.object(neptune_csv_publisher.time, 'sleep'):
+            publisher.publish_impl()
+
+        keys = [c[1]['s3_object_key'] for c in self.api_client.upload.call_args_list]
+        self.assertEqual(keys, ['amundsen/folder/0000/Column.csv', 'amundsen/folder/0000/Table.csv',
+                                'amundsen/folder/0001/TABLE_COLUMN.csv'])
+        self.assertEqual([(c[1]['s3_object_key'], c[1]['dependencies']) for c in self.api_client.load.call_args_list],
+                         [('amundsen/folder/0000', []), ('amundsen/folder/0001', ['load0'])])
+        self.assertEqual([c[1]['load_id'] for c in self.api_client.load_status.call_args_list], ['load0', 'load1'])
+
+    def test_polling_period(self) -> None:
+        publisher = self._init_publisher({NeptuneCSVPublisher.STATUS_POLLING_PERIOD: 1,
+                                          NeptuneCSVPublisher.MAX_STATUS_POLLING_PERIOD: 4})
+        statuses = ['LOAD_IN_QUEUE', 'LOAD_IN_PROGRESS', 'LOAD_IN_PROGRESS', 'LOAD_IN_PROGRESS', 'LOAD_IN_PROGRESS',
+                    'LOAD_COMPLETED']
+        self.api_client.load_status.side_effect = [{'payload': {'overallStatus': {'status': status}}}
+                                                   for status in statuses]
+
+        with patch.object(neptune_csv_publisher.time, 'sleep') as mock_sleep:
+            publisher._wait_for_load('load0')
+
+        self.assertEqual([c[0][0] for c in mock_sleep.call_args_list], [1, 1, 1, 2, 4, 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import tempfile
+import unittest
+
+from pyhocon import ConfigFactory
+
+from databuilder.state.fs_state_store import FsStateStore
+from databuilder.state.incremental_extraction import IncrementalExtraction
+
+
+class TestFsStateStore(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.conf = ConfigFactory.from_dict({
+            FsStateStore.STATE_FILE_PATH: os.path.join(self.temp_dir.name, 'state', 'state.json')
+        })
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def _new_state_store(self) -> FsStateStore:
+        state_store = FsStateStore()
+        state_store.init(self.conf)
+        return state_store
+
+    def test_commit(self) -> None:
+        state_store = self._new_state_store()
+        self.assertIsNone(state_store.get('foo'))
+        state_store.put('foo', 1)
+        self.assertEqual(state_store.get('foo'), 1)
+        self.assertIsNone(self._new_state_store().get('foo'))
+
+        state_store.on_success()
+        self.assertEqual(self._new_state_store().get('foo'), 1)
+
+    def test_rollback(self) -> None:
+        state_store = self._new_state_store()
+        state_store.put('foo', 1)
+        state_store.commit()
+        state_store.put('foo', 2)
+        state_store.on_failure()
+
+        self.assertEqual(state_store.get('foo'), 1)
+        self.assertEqual(self._new_state_store().get('foo'), 1)
+
+    def test_incremental_extraction(self) -> None:
+        state_store = self._new_state_store()
+        incremental = IncrementalExtraction(state_store, 'hive.gold')
+        self.assertIsNone(incremental.watermark)
+        incremental.record_table('hive://gold.a/foo', 100)
+        incremental.record_table('hive://gold.a/bar', 200)
+        incremental.finish([])
+        state_store.commit()
+
+        state_store = self._new_state_store()
+        incremental = IncrementalExtraction(state_store, 'hive.gold')
+        self.assertEqual(incremental.watermark, 200)
+        incremental.record_table('hive://gold.a/bar', 300)
+        incremental.finish(['hive://gold.a/foo', 'hive://gold.a/bar', 'hive://gold.a/baz'])
+        state_store.commit()
+
+        state_store = self._new_state_store()
+        self.assertEqual(IncrementalExtraction(state_store, 'hive.gold').watermark, 300)
+        self.assertEqual(IncrementalExtraction.get_untouched_table_keys(state_store, 'hive.gold'),
+                         ['hive://gold.a/baz', 'hive://gold.a/foo'])
+        self.assertEqual(IncrementalExtraction.get_untouched_table_keys(state_store, 'hive.silver'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
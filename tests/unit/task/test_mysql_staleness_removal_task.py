@@ -12,6 +12,9 @@ from pyhocon import ConfigFactory
 from databuilder.publisher.mysql_csv_publisher import MySQLCSVPublisher
 from databuilder.task import mysql_staleness_removal_task
 from databuilder.task.mysql_staleness_removal_task import MySQLStalenessRemovalTask
+from tests.unit.models.test_table_serializable import (
+    Base, RDSActor, RDSMovieActor,
+)
 
 
 class TestMySQLStalenessRemovalTask(unittest.TestCase):
@@ -146,6 +149,38 @@ class TestMySQLStalenessRemovalTask(unittest.TestCase):
         self.assertTrue(str(filter_statement) == 'table_metadata.publisher_last_updated_epoch_ms < '
                                                  ':publisher_last_updated_epoch_ms_1')
 
+    @patch.object(mysql_staleness_removal_task.time, 'sleep')
+    def test_delete_stale_records_in_batches(self, mock_sleep: Any) -> None:
+        with patch.object(mysql_staleness_removal_task, 'Base', Base):
+            task = MySQLStalenessRemovalTask()
+            job_config = ConfigFactory.from_dict({
+                'job.identifier': 'mysql_remove_stale_data_job',
+                f'{task.get_scope()}.{MySQLStalenessRemovalTask.CONN_STRING}': 'sqlite://',
+                f'{task.get_scope()}.{MySQLStalenessRemovalTask.STALENESS_MAX_PCT}': 90,
+                f'{task.get_scope()}.{MySQLStalenessRemovalTask.TARGET_TABLES}': ['actor', 'movie_actor'],
+                f'{task.get_scope()}.{MySQLStalenessRemovalTask.DELETE_BATCH_SIZE}': 2,
+                f'{task.get_scope()}.{MySQLStalenessRemovalTask.DELETE_BATCH_SLEEP_MS}': 10,
+                MySQLCSVPublisher.JOB_PUBLISH_TAG: 'foo'
+            })
+            task.init(job_config)
+            Base.metadata.create_all(task._engine)
+            session = task._session_factory()
+            for i in range(10):
+                tag = 'foo' if i % 2 else 'bar'
+                session.add(RDSActor(rk=f'actor{i}', name='', published_tag=tag, publisher_last_updated_epoch_ms=0))
+                session.add(RDSMovieActor(movie_rk='movie', actor_rk=f'actor{i}', published_tag=tag,
+                                          publisher_last_updated_epoch_ms=0))
+            session.commit()
+
+            task.run()
+
+            self.assertEqual(sorted(rk for rk, in session.query(RDSActor.rk)),
+                             ['actor1', 'actor3', 'actor5', 'actor7', 'actor9'])
+            self.assertEqual(session.query(RDSMovieActor).count(), 5)
+            # 3 batches per table, with a pause after each full batch
+            self.assertEqual(mock_sleep.call_count, 4)
+            session.close()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -7,12 +7,17 @@
 import logging
 import textwrap
 import unittest
+from typing import (
+    Any, Dict, List,
+)
 
-from mock import patch
+from mock import MagicMock, patch
 from neo4j import GraphDatabase
+from neo4j.exceptions import TransientError
 from pyhocon import ConfigFactory
 
 from databuilder.publisher import neo4j_csv_publisher
+from databuilder.state.base_state_store import StateStore
 from databuilder.task import neo4j_staleness_removal_task
 from databuilder.task.neo4j_staleness_removal_task import Neo4jStalenessRemovalTask
 
@@ -344,6 +349,156 @@ class TestRemoveStaleData(unittest.TestCase):
 
             session_mock.assert_not_called()
 
+    def test_keep_untouched_tables(self) -> None:
+        with patch.object(GraphDatabase, 'driver'), patch.object(Neo4jStalenessRemovalTask, '_execute_cypher_query') \
+                as mock_execute:
+            state_store = MagicMock(spec=StateStore)
+            state_store.get_scope.return_value = 'state_store.fs'
+            state_store.get.side_effect = lambda key, default=None: \
+                ['hive://gold.a/foo', 'hive://gold.a/bar', 'hive://gold.a/baz'] \
+                if key == 'hive.gold.untouched_table_keys' else default
+            task = Neo4jStalenessRemovalTask(state_store=state_store)
+            job_config = ConfigFactory.from_dict({
+                f'job.identifier': 'remove_stale_data_job',
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.NEO4J_END_POINT_KEY}': 'foobar',
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.NEO4J_USER}': 'foo',
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.NEO4J_PASSWORD}': 'bar',
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.BATCH_SIZE}': 2,
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.UNTOUCHED_TABLES_SOURCES}': ['hive.gold'],
+                neo4j_csv_publisher.JOB_PUBLISH_TAG: 'foo',
+            })
+
+            task.init(job_config)
+            task._keep_untouched_tables()
+
+            self.assertEqual(mock_execute.call_count, 2)
+            self.assertEqual([c[1]['param_dict']['keys'] for c in mock_execute.call_args_list],
+                             [['hive://gold.a/foo', 'hive://gold.a/bar'], ['hive://gold.a/baz']])
+            statement = mock_execute.call_args[1]['statement']
+            self.assertIn('MATCH (table:Table {key: key})', statement)
+            self.assertIn('FOREACH (x IN relations | SET x.published_tag = $marker)', statement)
+
+    def test_keep_untouched_tables_leaves_other_neighbors(self) -> None:
+        with patch.object(GraphDatabase, 'driver'), patch.object(Neo4jStalenessRemovalTask, '_execute_cypher_query') \
+                as mock_execute:
+            state_store = MagicMock(spec=StateStore)
+            state_store.get_scope.return_value = 'state_store.fs'
+            state_store.get.side_effect = lambda key, default=None: \
+                ['hive://gold.a/foo'] if key == 'hive.gold.untouched_table_keys' else default
+            task = Neo4jStalenessRemovalTask(state_store=state_store)
+            job_config = ConfigFactory.from_dict({
+                f'job.identifier': 'remove_stale_data_job',
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.NEO4J_END_POINT_KEY}': 'foobar',
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.NEO4J_USER}': 'foo',
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.NEO4J_PASSWORD}': 'bar',
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.UNTOUCHED_TABLES_SOURCES}': ['hive.gold'],
+                neo4j_csv_publisher.JOB_PUBLISH_TAG: 'foo',
+            })
+
+            task.init(job_config)
+            task._keep_untouched_tables()
+
+            statement = ' '.join(mock_execute.call_args[1]['statement'].split())
+            # Only the table and the nodes derived from its key are marked, not neighbors such as a dashboard or an
+            # owner, whatever their label or tag
+            self.assertIn("OPTIONAL MATCH (table)-[:COLUMN|DESCRIPTION*1..2]->(n) WHERE n.key STARTS WITH key + '/' "
+                          "WITH table, table.published_tag AS tag, [table] + collect(DISTINCT n) AS nodes", statement)
+            self.assertIn('FOREACH (x IN nodes | SET x.published_tag = $marker)', statement)
+            # Relations to other nodes are only marked if they were published along with the table
+            self.assertIn('OPTIONAL MATCH (node)-[r]-(m) WHERE m IN nodes OR r.published_tag = tag', statement)
+
+    def test_untouched_tables_without_state_store(self) -> None:
+        with patch.object(GraphDatabase, 'driver'):
+            task = Neo4jStalenessRemovalTask()
+            job_config = ConfigFactory.from_dict({
+                f'job.identifier': 'remove_stale_data_job',
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.NEO4J_END_POINT_KEY}': 'foobar',
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.NEO4J_USER}': 'foo',
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.NEO4J_PASSWORD}': 'bar',
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.UNTOUCHED_TABLES_SOURCES}': ['hive.gold'],
+                neo4j_csv_publisher.JOB_PUBLISH_TAG: 'foo',
+            })
+
+            self.assertRaises(Exception, task.init, job_config)
+
+    def test_delete_by_id(self) -> None:
+        with patch.object(GraphDatabase, 'driver'), patch.object(
+                Neo4jStalenessRemovalTask, '_execute_cypher_query') as mock_execute:
+            task = Neo4jStalenessRemovalTask()
+            job_config = ConfigFactory.from_dict({
+                f'job.identifier': 'remove_stale_data_job',
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.NEO4J_END_POINT_KEY}': 'foobar',
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.NEO4J_USER}': 'foo',
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.NEO4J_PASSWORD}': 'bar',
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.TARGET_NODES}': ['Foo'],
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.TARGET_RELATIONS}': ['BAR'],
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.DELETE_BY_ID}': True,
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.BATCH_SIZE}': 2,
+                neo4j_csv_publisher.JOB_PUBLISH_TAG: 'foo',
+            })
+
+            def execute(statement: str, param_dict: Dict[str, Any], dry_run: bool = False) -> List[Dict[str, Any]]:
+                if 'UNWIND' in statement:
+                    return [{'count': len(param_dict['ids'])}]
+                return [{'id': 3}, {'id': 1}, {'id': 2}]
+
+            mock_execute.side_effect = execute
+            task.init(job_config)
+            task._delete_stale_nodes()
+            task._delete_stale_relations()
+
+            calls = [c[1] for c in mock_execute.call_args_list]
+            self.assertEqual(len(calls), 6)
+            self.assertIn('MATCH (n:Foo)', calls[0]['statement'])
+            self.assertIn('RETURN id(n) as id', calls[0]['statement'])
+            self.assertEqual([c['param_dict']['ids'] for c in calls[1:3]], [[1, 2], [3]])
+            self.assertIn('WHERE id(n) = stale_id AND (', calls[1]['statement'])
+            self.assertIn('DETACH DELETE (n)', calls[1]['statement'])
+            self.assertIn('MATCH ()-[n:BAR]->()', calls[3]['statement'])
+            self.assertEqual([c['param_dict']['ids'] for c in calls[4:]], [[1, 2], [3]])
+            self.assertIn('DELETE n', calls[4]['statement'])
+            self.assertTrue(all(c['param_dict']['marker'] == 'foo' for c in calls))
+
+    def test_delete_by_id_retries_transient_error(self) -> None:
+        with patch.object(GraphDatabase, 'driver'), patch.object(
+                Neo4jStalenessRemovalTask, '_execute_cypher_query') as mock_execute, patch.object(
+                neo4j_staleness_removal_task, 'SLEEP_TIME', 0):
+            task = Neo4jStalenessRemovalTask()
+            job_config = ConfigFactory.from_dict({
+                f'job.identifier': 'remove_stale_data_job',
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.NEO4J_END_POINT_KEY}': 'foobar',
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.NEO4J_USER}': 'foo',
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.NEO4J_PASSWORD}': 'bar',
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.TARGET_NODES}': ['Foo'],
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.DELETE_BY_ID}': True,
+                neo4j_csv_publisher.JOB_PUBLISH_TAG: 'foo',
+            })
+
+            mock_execute.side_effect = [[{'id': 1}], TransientError('deadlock'), [{'count': 1}]]
+            task.init(job_config)
+            task._delete_stale_nodes()
+
+            self.assertEqual(mock_execute.call_count, 3)
+
+    def test_delete_by_id_failure(self) -> None:
+        with patch.object(GraphDatabase, 'driver'), patch.object(
+                Neo4jStalenessRemovalTask, '_execute_cypher_query') as mock_execute:
+            task = Neo4jStalenessRemovalTask()
+            job_config = ConfigFactory.from_dict({
+                f'job.identifier': 'remove_stale_data_job',
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.NEO4J_END_POINT_KEY}': 'foobar',
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.NEO4J_USER}': 'foo',
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.NEO4J_PASSWORD}': 'bar',
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.TARGET_NODES}': ['Foo', 'Bar'],
+                f'{task.get_scope()}.{neo4j_staleness_removal_task.DELETE_BY_ID}': True,
+                neo4j_csv_publisher.JOB_PUBLISH_TAG: 'foo',
+            })
+
+            mock_execute.side_effect = Exception('failure')
+            task.init(job_config)
+
+            self.assertRaises(Exception, task._delete_stale_nodes)
+
 
 if __name__ == '__main__':
     unittest.main()
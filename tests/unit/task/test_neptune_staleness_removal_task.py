@@ -0,0 +1,125 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+import unittest
+from typing import Any, Dict
+from unittest.mock import MagicMock, patch
+
+from gremlin_python.driver.protocol import GremlinServerError
+from pyhocon import ConfigFactory
+
+from databuilder.clients.neptune_client import NeptuneSessionClient
+from databuilder.task.neptune_staleness_removal_task import NeptuneStalenessRemovalTask
+
+
+class TestNeptuneStalenessRemovalTask(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.graph = MagicMock()
+        patch.object(NeptuneSessionClient, 'init').start()
+        patch.object(NeptuneSessionClient, 'get_graph', return_value=self.graph).start()
+        patch.object(NeptuneStalenessRemovalTask, 'RETRY_BACKOFF_SEC', 0).start()
+        self.addCleanup(patch.stopall)
+
+    def _init_task(self, conf: Dict[str, Any]) -> NeptuneStalenessRemovalTask:
+        task = NeptuneStalenessRemovalTask()
+        task.init(ConfigFactory.from_dict({
+            f'{task.get_scope()}.{NeptuneStalenessRemovalTask.STALENESS_CUT_OFF_IN_SECONDS}': 3600,
+            f'{task.get_scope()}.{NeptuneStalenessRemovalTask.TARGET_NODES}': ['Table', 'Column'],
+            **{f'{task.get_scope()}.{key}': value for key, value in conf.items()}
+        }))
+        return task
+
+    def test_validation_counts_reused(self) -> None:
+        task = self._init_task({})
+        with patch.object(task, 'get_number_of_nodes_grouped_by_label') as mock_count, \
+                patch.object(task.gremlin_client, 'delete_nodes') as mock_delete:
+            mock_count.side_effect = [
+                [{'type': 'Table', 'count': 100}, {'type': 'Column', 'count': 100}],
+                [{'type': 'Table', 'count': 1}, {'type': 'Column', 'count': 0}],
+            ]
+            task._validate_node_staleness_pct()
+            task._delete_stale_nodes()
+
+            self.assertEqual(mock_delete.call_args[1]['node_labels'], ['Table'])
+
+            mock_delete.reset_mock()
+            task._stale_node_counts = {'Table': 0}
+            task._delete_stale_nodes()
+
+            mock_delete.assert_not_called()
+
+    def test_delete_in_batches(self) -> None:
+        task = self._init_task({NeptuneStalenessRemovalTask.DELETE_BATCH_SIZE: 2,
+                                NeptuneStalenessRemovalTask.DELETE_WORKER_COUNT: 1})
+        task._stale_node_counts = {'Table': 3, 'Column': 0}
+        limit = self.graph.V.return_value.hasLabel.return_value.has.return_value.has.return_value.id.return_value \
+            .limit
+        limit.return_value.toList.side_effect = [['a', 'b'], ['c'], []]
+
+        task._delete_stale_nodes()
+
+        # Ids are listed a page at a time, until no stale data is left
+        self.assertEqual([c[0] for c in self.graph.V.return_value.hasLabel.call_args_list], [('Table',)] * 3)
+        self.assertEqual([c[0] for c in limit.call_args_list], [(2,)] * 3)
+        self.assertEqual([c[0] for c in self.graph.V.return_value.hasId.call_args_list], [('a', 'b'), ('c',)])
+        drop = self.graph.V.return_value.hasId.return_value.has.return_value.has.return_value.drop
+        self.assertEqual(drop.return_value.iterate.call_count, 2)
+
+    def test_delete_in_batches_excludes_running_batches(self) -> None:
+        task = self._init_task({NeptuneStalenessRemovalTask.DELETE_BATCH_SIZE: 2,
+                                NeptuneStalenessRemovalTask.DELETE_WORKER_COUNT: 2})
+        task._stale_node_counts = {'Table': 3}
+        stale = self.graph.V.return_value.hasLabel.return_value.has.return_value.has.return_value
+        pages = iter([['a', 'b'], ['c'], []])
+        stale.id.return_value.limit.return_value.toList.side_effect = lambda: next(pages)
+        stale.hasId.return_value.id.return_value.limit.return_value.toList.side_effect = lambda: next(pages)
+
+        task._delete_stale_nodes()
+
+        # The second page is listed while the first one may still be dropped
+        self.assertEqual(str(stale.hasId.call_args_list[0][0][0]), "without(['a', 'b'])")
+        self.assertEqual(sorted(c[0] for c in self.graph.V.return_value.hasId.call_args_list), [('a', 'b'), ('c',)])
+
+    def test_delete_in_batches_not_dropped(self) -> None:
+        task = self._init_task({NeptuneStalenessRemovalTask.DELETE_BATCH_SIZE: 2,
+                                NeptuneStalenessRemovalTask.DELETE_WORKER_COUNT: 1})
+        task._stale_node_counts = {'Table': 1}
+        self.graph.V.return_value.hasLabel.return_value.has.return_value.has.return_value.id.return_value \
+            .limit.return_value.toList.return_value = ['a']
+
+        # Listing the same stale ids again once dropped fails instead of looping
+        self.assertRaises(RuntimeError, task._delete_stale_nodes)
+
+    def test_delete_batch_retries_concurrent_modification(self) -> None:
+        task = self._init_task({NeptuneStalenessRemovalTask.DELETE_BATCH_SIZE: 2,
+                                NeptuneStalenessRemovalTask.DELETE_WORKER_COUNT: 1})
+        task._stale_node_counts = {'Table': 1}
+        self.graph.V.return_value.hasLabel.return_value.has.return_value.has.return_value.id.return_value \
+            .limit.return_value.toList.side_effect = [['a'], []]
+        iterate = self.graph.V.return_value.hasId.return_value.has.return_value.has.return_value.drop \
+            .return_value.iterate
+        iterate.side_effect = [
+            GremlinServerError({'code': 500, 'message': 'ConcurrentModificationException', 'attributes': {}}),
+            None
+        ]
+
+        task._delete_stale_nodes()
+
+        self.assertEqual(iterate.call_count, 2)
+
+    def test_delete_batch_failure(self) -> None:
+        task = self._init_task({NeptuneStalenessRemovalTask.DELETE_BATCH_SIZE: 2,
+                                NeptuneStalenessRemovalTask.DELETE_WORKER_COUNT: 1})
+        task._stale_node_counts = {'Table': 1}
+        self.graph.V.return_value.hasLabel.return_value.has.return_value.has.return_value.id.return_value \
+            .limit.return_value.toList.return_value = ['a']
+        self.graph.V.return_value.hasId.return_value.has.return_value.has.return_value.drop.return_value \
+            .iterate.side_effect = GremlinServerError({'code': 500, 'message': 'TimeLimitExceededException',
+                                                       'attributes': {}})
+
+        self.assertRaises(GremlinServerError, task._delete_stale_nodes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+import unittest
+from typing import (
+    Any, Iterator, List,
+)
+
+from mock import MagicMock
+from pyhocon import ConfigFactory, ConfigTree
+
+from databuilder.extractor.base_extractor import Extractor
+from databuilder.loader.base_loader import Loader
+from databuilder.task.pipelined_task import PipelinedTask
+from databuilder.transformer.base_transformer import Transformer
+
+
+class TestPipelinedTask(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.conf = ConfigFactory.from_dict({f'task.{PipelinedTask.QUEUE_SIZE}': 2,
+                                             f'task.{PipelinedTask.POLL_INTERVAL_SEC}': 0.01})
+
+    def test_run(self) -> None:
+        extractor = ListExtractor(list(range(10)))
+        loader = ListLoader()
+        task = PipelinedTask(extractor=extractor, loader=loader, transformer=OddFilterTransformer())
+        task.init(self.conf)
+        task.run()
+
+        self.assertEqual(loader.records, [10, 10, 30, 30, 50, 50, 70, 70, 90, 90])
+        self.assertTrue(extractor.closed)
+        self.assertEqual(loader.calls, ['close'])
+
+    def test_extractor_failure(self) -> None:
+        extractor = ListExtractor(list(range(10)), fail_at=5)
+        loader = ListLoader()
+        task = PipelinedTask(extractor=extractor, loader=loader)
+        task.init(self.conf)
+
+        with self.assertRaises(RuntimeError):
+            task.run()
+        self.assertTrue(extractor.closed)
+        # The loader is told that the task failed before it is closed
+        self.assertEqual(loader.calls, ['fail', 'close'])
+
+    def test_loader_failure(self) -> None:
+        extractor = ListExtractor(list(range(1000)))
+        loader = ListLoader()
+        loader.load = MagicMock(side_effect=ValueError('failed to load'))  # type: ignore
+        task = PipelinedTask(extractor=extractor, loader=loader)
+        task.init(self.conf)
+
+        with self.assertRaises(ValueError):
+            task.run()
+        # Extractor stops once the loader has failed
+        self.assertLess(extractor.index, 1000)
+        self.assertTrue(extractor.closed)
+
+
+class ListExtractor(Extractor):
+    def __init__(self, records: List[Any], fail_at: int = -1) -> None:
+        self.records = records
+        self.fail_at = fail_at
+        self.index = 0
+        self.closed = False
+
+    def init(self, conf: ConfigTree) -> None:
+        pass
+
+    def extract(self) -> Any:
+        if self.index == self.fail_at:
+            raise RuntimeError('failed to extract')
+        if self.index >= len(self.records):
+            return None
+        self.index += 1
+        # Start from 1 as 0 would end the extraction
+        return self.records[self.index - 1] + 1
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class OddFilterTransformer(Transformer):
+    def init(self, conf: ConfigTree) -> None:
+        pass
+
+    def transform(self, record: Any) -> Any:
+        if record % 2 == 0:
+            return None
+        return self._duplicate(record * 10)
+
+    def _duplicate(self, record: Any) -> Iterator[Any]:
+        yield record
+        yield record
+
+    def get_scope(self) -> str:
+        return 'transformer.odd_filter'
+
+
+class ListLoader(Loader):
+    def __init__(self) -> None:
+        self.records: List[Any] = []
+        self.calls: List[str] = []
+
+    def init(self, conf: ConfigTree) -> None:
+        pass
+
+    def load(self, record: Any) -> None:
+        self.records.append(record)
+
+    def fail(self) -> None:
+        self.calls.append('fail')
+
+    def close(self) -> None:
+        self.calls.append('close')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import tempfile
+import unittest
+from typing import (
+    Any, Iterator, List,
+)
+
+from pyhocon import ConfigFactory, ConfigTree
+
+from databuilder.extractor.base_extractor import Extractor
+from databuilder.loader.base_loader import Loader
+from databuilder.task.task import DefaultTask
+from databuilder.transformer.base_transformer import (
+    ChainedTransformer, NoopTransformer, Transformer,
+)
+from databuilder.transformer.parallel_transformer import ParallelTransformer
+from databuilder.transformer.regex_str_replace_transformer import (
+    ATTRIBUTE_NAME, REGEX_REPLACE_TUPLE_LIST, RegexStrReplaceTransformer,
+)
+
+
+class TestParallelTransformer(unittest.TestCase):
+
+    def _get_conf(self, preserve_order: bool) -> ConfigTree:
+        return ConfigFactory.from_dict({
+            f'transformer.parallel.{ParallelTransformer.WORKER_COUNT}': 2,
+            f'transformer.parallel.{ParallelTransformer.BATCH_SIZE}': 3,
+            f'transformer.parallel.{ParallelTransformer.PRESERVE_ORDER}': preserve_order,
+            f'transformer.parallel.transformer.regex_str_replace.{REGEX_REPLACE_TUPLE_LIST}': [('-', '_')],
+            f'transformer.parallel.transformer.regex_str_replace.{ATTRIBUTE_NAME}': 'name',
+        })
+
+    def test_transform_preserve_order(self) -> None:
+        loader = ListLoader()
+        task = DefaultTask(extractor=ListExtractor([{'name': f'foo-{i}'} for i in range(10)]),
+                           loader=loader,
+                           transformer=ParallelTransformer(RegexStrReplaceTransformer()))
+        task.init(self._get_conf(preserve_order=True))
+        task.run()
+
+        self.assertEqual(loader.records, [{'name': f'foo_{i}'} for i in range(10)])
+
+    def test_transform_without_order(self) -> None:
+        loader = ListLoader()
+        task = DefaultTask(extractor=ListExtractor([{'name': f'foo-{i}'} for i in range(10)]),
+                           loader=loader,
+                           transformer=ParallelTransformer(RegexStrReplaceTransformer()))
+        task.init(self._get_conf(preserve_order=False))
+        task.run()
+
+        self.assertCountEqual(loader.records, [{'name': f'foo_{i}'} for i in range(10)])
+
+    def test_flush_chained_transformer(self) -> None:
+        parallel_transformer = ParallelTransformer(RegexStrReplaceTransformer())
+        parallel_transformer.init(self._get_conf(preserve_order=True).get('transformer.parallel'))
+        transformer = ChainedTransformer([NoopTransformer(), parallel_transformer])
+
+        # Batch size is 3 and the records are held back until the batch is sent
+        results = list(transformer.transform({'name': 'foo-1'})) + list(transformer.transform({'name': 'foo-2'}))
+        self.assertEqual(results, [])
+
+        self.assertEqual(list(transformer.flush()), [{'name': 'foo_1'}, {'name': 'foo_2'}])
+        parallel_transformer.close()
+
+    def test_flush_and_close_workers(self) -> None:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            loader = ListLoader()
+            task = DefaultTask(extractor=ListExtractor([{'name': f'foo-{i}'} for i in range(10)]),
+                               loader=loader,
+                               transformer=ParallelTransformer(BufferingTransformer()))
+            task.init(ConfigFactory.from_dict({
+                f'transformer.parallel.{ParallelTransformer.WORKER_COUNT}': 2,
+                f'transformer.parallel.{ParallelTransformer.BATCH_SIZE}': 3,
+                f'transformer.parallel.transformer.buffering.{BufferingTransformer.CLOSED_DIR}': temp_dir,
+            }))
+            task.run()
+
+            # Records held back by the transformer of each worker are returned on flush
+            self.assertCountEqual(loader.records, [{'name': f'foo-{i}'} for i in range(10)])
+            # and the transformer of each worker is closed
+            self.assertEqual(len(os.listdir(temp_dir)), 2)
+
+
+class BufferingTransformer(Transformer):
+    """
+    Holds back every record until flush, and records its process id in a file on close
+    """
+    CLOSED_DIR = 'closed_dir'
+
+    def init(self, conf: ConfigTree) -> None:
+        self._closed_dir = conf.get_string(BufferingTransformer.CLOSED_DIR)
+        self._records: List[Any] = []
+
+    def transform(self, record: Any) -> Any:
+        self._records.append(record)
+        return None
+
+    def flush(self) -> Iterator[Any]:
+        records, self._records = self._records, []
+        return iter(records)
+
+    def get_scope(self) -> str:
+        return 'transformer.buffering'
+
+    def close(self) -> None:
+        open(os.path.join(self._closed_dir, str(os.getpid())), 'w').close()
+
+
+class ListExtractor(Extractor):
+    def __init__(self, records: List[Any]) -> None:
+        self.iter = iter(records)
+
+    def init(self, conf: ConfigTree) -> None:
+        pass
+
+    def extract(self) -> Any:
+        return next(self.iter, None)
+
+
+class ListLoader(Loader):
+    def __init__(self) -> None:
+        self.records: List[Any] = []
+
+    def init(self, conf: ConfigTree) -> None:
+        pass
+
+    def load(self, record: Any) -> None:
+        self.records.append(record)
+
+
+if __name__ == '__main__':
+    unittest.main()
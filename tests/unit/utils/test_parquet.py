@@ -0,0 +1,57 @@
+# Copyright Contributors to the Amundsen project.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import tempfile
+import unittest
+
+import pyarrow.parquet as pq
+
+from databuilder.utils.parquet import ParquetRecordWriter
+
+
+class TestParquetRecordWriter(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.path = os.path.join(self.temp_dir.name, 'records.parquet')
+
+    def test_widen_integer_column(self) -> None:
+        writer = ParquetRecordWriter(self.path, ['key', 'value'], row_group_size=2)
+        writer.writerows([{'key': 'a', 'value': 1}, {'key': 'b', 'value': 2},
+                          {'key': 'c', 'value': 2.5}])
+        writer.close()
+
+        table = pq.read_table(self.path)
+        self.assertEqual(str(table.schema.field('value').type), 'double')
+        self.assertEqual(table.column('value').to_pylist(), [1.0, 2.0, 2.5])
+        self.assertEqual(pq.ParquetFile(self.path).num_row_groups, 2)
+
+    def test_type_column_without_value(self) -> None:
+        writer = ParquetRecordWriter(self.path, ['key', 'value'], row_group_size=2)
+        writer.writerows([{'key': 'a', 'value': None}, {'key': 'b', 'value': None},
+                          {'key': 'c', 'value': 3}, {'key': 'd', 'value': None},
+                          {'key': 'e', 'value': None}])
+        writer.close()
+
+        table = pq.read_table(self.path)
+        self.assertEqual(str(table.schema.field('value').type), 'int64')
+        self.assertEqual(table.column('value').to_pylist(), [None, None, 3, None, None])
+
+    def test_column_without_any_value(self) -> None:
+        writer = ParquetRecordWriter(self.path, ['key', 'value'])
+        writer.writerow({'key': 'a', 'value': None})
+        writer.close()
+
+        self.assertEqual(str(pq.read_table(self.path).schema.field('value').type), 'string')
+
+    def test_incompatible_types(self) -> None:
+        writer = ParquetRecordWriter(self.path, ['key', 'value'], row_group_size=1)
+        writer.writerow({'key': 'a', 'value': 1})
+        with self.assertRaises(ValueError):
+            writer.writerow({'key': 'b', 'value': 'one'})
+
+
+if __name__ == '__main__':
+    unittest.main()